@@ -4,6 +4,8 @@ import requests
 from bs4 import BeautifulSoup
 import time
 
+from catalog_writer import CatalogWriter
+
 CATALOG_PATH = '/Users/jasonjenkins/Desktop/alpha/toxico/data/catalog.json'
 QUEUE_PATH = '/Users/jasonjenkins/Desktop/alpha/toxico/PRODUCTS_TO_ADD.md'
 
@@ -94,11 +96,7 @@ def process_queue():
 
     print(f"Found {len(links)} links to process...")
     
-    with open(CATALOG_PATH, 'r') as f:
-        catalog = json.load(f)
-    
-    new_products = []
-    
+    scraped = []
     for url in links:
         if 'collections' in url:
             print(f"Skipping collection page for now: {url}")
@@ -107,11 +105,21 @@ def process_queue():
         print(f"Processing: {url}")
         data = get_page_metadata(url)
         if data:
+            scraped.append(data)
+        
+        time.sleep(1) # Be nice to the server
+
+    # Hold the catalog lock only for the read-modify-write, not the scraping
+    with CatalogWriter(CATALOG_PATH) as catalog:
+        new_products = []
+        
+        for data in scraped:
+            url = data['url']
             product_id = 'aff-zimmerli-' + data['name'].lower().replace(' ', '-').replace('zimmerli-', '')[:20]
             
             new_product = {
                 "id": product_id,
-                "sku": f"AFF-ZM-{len(catalog['products']) + len(new_products) + 1:03d}",
+                "sku": f"AFF-ZM-{len(catalog.products) + len(new_products) + 1:03d}",
                 "name": data['name'],
                 "subtitle": "zimmerli \u00b7 swiss made",
                 "category": data['category'],
@@ -131,21 +139,21 @@ def process_queue():
             }
             
             # Check if exists
-            if not any(p.get('url') == url for p in catalog['products']):
+            if not any(p.get('url') == url for p in catalog.products):
                 new_products.append(new_product)
                 print(f"✓ Added: {data['name']}")
             else:
                 print(f"⚠ Duplicate: {data['name']}")
-        
-        time.sleep(1) # Be nice to the server
 
-    if new_products:
-        catalog['products'].extend(new_products)
-        with open(CATALOG_PATH, 'w') as f:
-            json.dump(catalog, f, indent=2)
-        print(f"\nSuccessfully added {len(new_products)} products to catalog.")
-    else:
-        print("\nNo new products added.")
+        if new_products:
+            # Ids are truncated name slugs; never let one replace another product
+            for product, product_id in zip(new_products, catalog.insert(new_products)):
+                if product_id != product['id']:
+                    print(f"⚠ Id {product['id']} is taken; added {product['name']} as {product_id}")
+            catalog.commit(compact=True)
+            print(f"\nSuccessfully added {len(new_products)} products to catalog.")
+        else:
+            print("\nNo new products added.")
 
 if __name__ == "__main__":
     process_queue()
@@ -0,0 +1,345 @@
+"""
+Local embedding index over catalog products.
+
+Each product's text (name, subtitle, description, category, vibes and
+activities) is embedded once per catalog version. Queries are embedded with
+the same embedder and matched by cosine similarity, with no network calls.
+
+Embedders:
+
+- HashingEmbedder (default, no dependencies): words and character
+  trigrams are hashed into a fixed number of signed buckets, which gives a
+  sparse, L2-normalized vector. It catches shared words, plurals, typos and
+  partial words without a model download.
+- ModelEmbedder: a small local sentence-transformers model (for example
+  ``all-MiniLM-L6-v2``), used when VALET_EMBEDDING_MODEL names one and
+  the package is installed.
+
+Hash collisions give almost every product some small positive similarity,
+even to gibberish. With HashingEmbedder a product therefore only counts as
+a match when it shares a word with the query: the same word, or one that
+has more than half of the query word's trigrams (plurals, typos). With a
+model, the similarity must reach ``ModelEmbedder.min_similarity``.
+
+With NumPy, the product vectors form one float32 matrix and a query costs a
+single matrix-vector product plus ``argpartition``. The matrix is saved next
+to the catalog (``data/catalog.embeddings.npz``) and reused by any process
+with the same catalog digest and model. Without NumPy, the hashed vectors
+are scored through an inverted index over their buckets.
+"""
+
+import io
+import logging
+import os
+import threading
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from catalog_search import tokenize
+from catalog_snapshot import atomic_write_bytes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIM = 512
+
+# Weight of each product field in its embedding
+FIELD_WEIGHTS = (
+    ('name', 2.0),
+    ('subtitle', 1.0),
+    ('description', 1.0),
+    ('category', 1.0),
+    ('vibes', 1.5),
+    ('activities', 1.5),
+)
+
+# Character trigrams count for less than whole words
+NGRAM_WEIGHT = 0.5
+
+# Query words too common to make a product a match on their own
+GATE_STOPWORDS = frozenset(
+    'and are but for from has have its not our the this that with you your'.split())
+
+SparseVector = Dict[int, float]
+
+
+def embeddings_path_for(json_path: str) -> str:
+    """data/catalog.json -> data/catalog.embeddings.npz"""
+    root, _ = os.path.splitext(json_path)
+    return root + '.embeddings.npz'
+
+
+def product_text(item: Any) -> Tuple[Tuple[str, float], ...]:
+    """(text, weight) per embedded field of a catalog item."""
+    out = []
+    for field, weight in FIELD_WEIGHTS:
+        value = getattr(item, field, '')
+        if isinstance(value, tuple):
+            value = ' '.join(value)
+        if value:
+            out.append((value, weight))
+    return tuple(out)
+
+
+def _trigrams(token: str) -> List[str]:
+    padded = f'#{token}#'
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def _normalize(vector: SparseVector) -> SparseVector:
+    norm = sum(v * v for v in vector.values()) ** 0.5
+    return {k: v / norm for k, v in vector.items()} if norm else {}
+
+
+class HashingEmbedder:
+    """Signed feature hashing of words and character trigrams."""
+
+    sparse = True
+
+    def __init__(self, dim: int = DEFAULT_DIM):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def _add(self, vector: SparseVector, feature: str, weight: float) -> None:
+        h = zlib.crc32(feature.encode('utf-8'))
+        bucket = h % self.dim
+        vector[bucket] = vector.get(bucket, 0.0) + (weight if h & 0x80000000 else -weight)
+
+    def embed_fields(self, fields: Iterable[Tuple[str, float]]) -> SparseVector:
+        vector: SparseVector = {}
+        for text, weight in fields:
+            for token in tokenize(text):
+                self._add(vector, 'w:' + token, weight)
+                for gram in _trigrams(token):
+                    self._add(vector, gram, weight * NGRAM_WEIGHT)
+        return _normalize(vector)
+
+    def embed_query(self, text: str) -> SparseVector:
+        return self.embed_fields(((text, 1.0),))
+
+
+class ModelEmbedder:
+    """A local sentence-transformers model (dense vectors; needs NumPy)."""
+
+    sparse = False
+
+    # Cosine similarity below this is not a match (typical for MiniLM-sized models)
+    min_similarity = 0.3
+
+    def __init__(self, model_name: str):
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def embed_fields(self, fields: Iterable[Tuple[str, float]]) -> Any:
+        return self.embed_query('. '.join(text for text, _ in fields))
+
+    def embed_query(self, text: str) -> Any:
+        return self.model.encode(text, normalize_embeddings=True).astype('float32')
+
+
+def local_embedder(model_name: str = '', dim: int = DEFAULT_DIM) -> Any:
+    """ModelEmbedder for ``model_name`` when it can be loaded, else HashingEmbedder."""
+    if model_name and SentenceTransformer is not None and numpy is not None:
+        try:
+            return ModelEmbedder(model_name)
+        except Exception as e:  # missing weights, bad name, ...
+            logger.warning('Embedding model %s unavailable, using hashed n-grams: %s',
+                           model_name, e)
+    return HashingEmbedder(dim)
+
+
+class EmbeddingIndex:
+    """Cosine top-k over the active products of one catalog snapshot."""
+
+    __slots__ = ('digest', 'embedder', 'items', 'matrix', 'postings', 'words', 'grams', 'reused',
+                 '_vectors')
+
+    def __init__(self, items: Iterable[Any], embedder: Any, digest: str = '',
+                 previous: Optional['EmbeddingIndex'] = None, matrix: Any = None):
+        self.digest = digest
+        self.embedder = embedder
+        self.items = tuple(item for item in items if item.active)
+        self.reused = 0
+        # product id -> (texts, vector); reused when a product's text is unchanged
+        self._vectors: Dict[Any, Tuple[tuple, Any]] = {}
+        reuse = previous._vectors if previous is not None and previous.embedder is embedder else {}
+        if matrix is None:
+            vectors = []
+            for item in self.items:
+                texts = product_text(item)
+                cached = reuse.get(item.id)
+                if cached is not None and cached[0] == texts:
+                    vector = cached[1]
+                    self.reused += 1
+                else:
+                    vector = embedder.embed_fields(texts)
+                self._vectors.setdefault(item.id, (texts, vector))
+                vectors.append(vector)
+            matrix = self._to_matrix(vectors) if numpy is not None else None
+        else:
+            vectors = None
+        self.matrix = matrix
+        self.postings: Dict[int, List[Tuple[int, float]]] = {}
+        if matrix is None:  # pure-Python scoring of sparse vectors
+            for row, vector in enumerate(vectors):
+                for bucket, weight in vector.items():
+                    self.postings.setdefault(bucket, []).append((row, weight))
+        # The shared-word gate: word -> rows using it, trigram -> words containing it
+        self.words: Dict[str, set] = {}
+        self.grams: Dict[str, set] = {}
+        if embedder.sparse:
+            for row, item in enumerate(self.items):
+                for text, _ in product_text(item):
+                    for token in tokenize(text):
+                        self.words.setdefault(token, set()).add(row)
+            for word in self.words:
+                for gram in _trigrams(word):
+                    self.grams.setdefault(gram, set()).add(word)
+
+    def _to_matrix(self, vectors: Sequence[Any]) -> Any:
+        matrix = numpy.zeros((len(vectors), self.embedder.dim), dtype='float32')
+        for row, vector in enumerate(vectors):
+            if self.embedder.sparse:
+                for bucket, weight in vector.items():
+                    matrix[row, bucket] = weight
+            else:
+                matrix[row] = vector
+        return matrix
+
+    # -- queries --------------------------------------------------------
+
+    def _word_matches(self, query: str) -> set:
+        """Rows with a word equal or close (most trigrams shared) to a query word."""
+        rows: set = set()
+        for token in set(tokenize(query)):
+            if len(token) < 3 or token in GATE_STOPWORDS:
+                continue
+            grams = _trigrams(token)
+            hits: Dict[str, int] = {}
+            for gram in grams:
+                for word in self.grams.get(gram, ()):
+                    hits[word] = hits.get(word, 0) + 1
+            for word, n in hits.items():
+                if n * 2 > len(grams):
+                    rows |= self.words[word]
+        return rows
+
+    def scores(self, query: str) -> Dict[int, float]:
+        """Row -> cosine similarity for rows that match ``query`` (see module
+        docstring); collision noise and weak similarities are left out."""
+        if self.embedder.sparse:
+            matched = self._word_matches(query)
+            return {row: score for row, score in self._similarities(query).items()
+                    if row in matched}
+        floor = self.embedder.min_similarity
+        return {row: score for row, score in self._similarities(query).items() if score >= floor}
+
+    def _similarities(self, query: str) -> Dict[int, float]:
+        """Row -> cosine similarity for rows with positive similarity."""
+        vector = self.embedder.embed_query(query)
+        if self.matrix is not None:
+            if self.embedder.sparse:
+                dense = numpy.zeros(self.embedder.dim, dtype='float32')
+                for bucket, weight in vector.items():
+                    dense[bucket] = weight
+                vector = dense
+            sims = self.matrix @ vector
+            rows = numpy.flatnonzero(sims > 0)
+            return dict(zip(rows.tolist(), sims[rows].tolist()))
+        sims: Dict[int, float] = {}
+        for bucket, weight in vector.items():
+            for row, value in self.postings.get(bucket, ()):
+                sims[row] = sims.get(row, 0.0) + weight * value
+        return {row: score for row, score in sims.items() if score > 0}
+
+    def top(self, query: str, k: int = 10, exclude: Iterable[Any] = ()) -> List[Tuple[Any, float]]:
+        """Best ``k`` (item, similarity) pairs with positive similarity."""
+        if k <= 0 or not self.items:
+            return []
+        excluded = set(exclude)
+        scores = self.scores(query)
+        ranked = sorted(scores, key=lambda row: (-scores[row], row))
+        out = []
+        for row in ranked:
+            item = self.items[row]
+            if item.id in excluded:
+                continue
+            out.append((item, scores[row]))
+            if len(out) == k:
+                break
+        return out
+
+    # -- persistence ----------------------------------------------------
+
+    def save(self, path: str) -> None:
+        """Write the matrix next to the catalog (NumPy only)."""
+        if self.matrix is None:
+            return
+        buffer = io.BytesIO()
+        numpy.savez(buffer, matrix=self.matrix,
+                    ids=numpy.array([str(item.id) for item in self.items]),
+                    digest=numpy.array(self.digest), model=numpy.array(self.embedder.name))
+        atomic_write_bytes(path, buffer.getvalue())
+
+    @classmethod
+    def load(cls, path: str, items: Iterable[Any], embedder: Any,
+             digest: str) -> Optional['EmbeddingIndex']:
+        """The saved index if it was built for ``digest`` with ``embedder``."""
+        if numpy is None:
+            return None
+        try:
+            with numpy.load(path, allow_pickle=False) as saved:
+                if str(saved['digest']) != digest or str(saved['model']) != embedder.name:
+                    return None
+                matrix, ids = saved['matrix'], saved['ids'].tolist()
+        except (OSError, ValueError, KeyError):
+            return None
+        index = cls(items, embedder, digest, matrix=matrix)
+        if ids != [str(item.id) for item in index.items] or matrix.shape[1] != embedder.dim:
+            return None
+        return index
+
+    def stats(self) -> Dict[str, Any]:
+        return {'model': self.embedder.name, 'dim': self.embedder.dim,
+                'products': len(self.items), 'reused': self.reused,
+                'backend': 'numpy' if self.matrix is not None else 'python'}
+
+
+_index: Optional[EmbeddingIndex] = None
+_lock = threading.Lock()
+
+
+def embeddings_for(snapshot: Any, embedder: Any, path: Optional[str] = None) -> EmbeddingIndex:
+    """EmbeddingIndex for a catalog snapshot, rebuilt when the digest changes.
+
+    With ``path``, a saved matrix for the same digest is loaded instead of
+    re-embedding, and a freshly built one is saved there.
+    """
+    global _index
+    digest = snapshot.digest if snapshot is not None else ''
+    index = _index
+    if index is None or index.digest != digest or index.embedder is not embedder:
+        with _lock:
+            index = _index
+            if index is None or index.digest != digest or index.embedder is not embedder:
+                items = snapshot.items if snapshot is not None else ()
+                index = EmbeddingIndex.load(path, items, embedder, digest) if path else None
+                if index is None:
+                    index = EmbeddingIndex(items, embedder, digest, previous=_index)
+                    if path:
+                        try:
+                            index.save(path)
+                        except OSError as e:
+                            logger.warning('Could not write catalog embeddings: %s', e)
+                _index = index
+    return index
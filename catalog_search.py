@@ -0,0 +1,146 @@
+"""
+Full-text product search for the valet server.
+
+BM25 over name, subtitle, description, tags, brand, vibes and activities,
+with prefix expansion of the last query term for typeahead. The index is
+rebuilt per catalog snapshot, but per-product tokenization is reused from
+the previous index when a product's text did not change.
+"""
+
+import bisect
+import heapq
+import math
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Weighted term frequency per field (a cheap BM25F approximation)
+FIELD_WEIGHTS = (
+    ('name', 3.0),
+    ('brand', 2.0),
+    ('subtitle', 1.5),
+    ('tags', 1.5),
+    ('vibes', 1.0),
+    ('activities', 1.0),
+    ('description', 1.0),
+)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Cap on vocabulary terms a typeahead prefix may expand to
+MAX_PREFIX_EXPANSIONS = 50
+
+# Expanded (prefix) matches score a little below exact ones
+PREFIX_DISCOUNT = 0.8
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case, strip accents, split on anything non-alphanumeric."""
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return _TOKEN_RE.findall(text)
+
+
+def _field_text(item: Any, field: str) -> str:
+    value = getattr(item, field, '')
+    if isinstance(value, tuple):
+        return ' '.join(value)
+    return value or ''
+
+
+def _document(texts: Tuple[str, ...]) -> Tuple[Tuple[str, ...], Dict[str, float], float]:
+    """(source texts, weighted term frequencies, weighted length) for one product."""
+    tf: Dict[str, float] = {}
+    length = 0.0
+    for text, (_, weight) in zip(texts, FIELD_WEIGHTS):
+        for token in tokenize(text):
+            tf[token] = tf.get(token, 0.0) + weight
+            length += weight
+    return texts, tf, length
+
+
+class SearchIndex:
+    """Inverted index with BM25 scoring over normalized catalog items."""
+
+    def __init__(self, items: Iterable[Any], previous: Optional['SearchIndex'] = None,
+                 docs: Optional[Dict[Any, Any]] = None):
+        self.items = tuple(items)
+        if docs is not None:
+            reuse = docs
+        else:
+            reuse = previous._docs if previous is not None else {}
+        # product id -> (texts, tf, length); reused when texts are unchanged
+        self._docs: Dict[Any, Tuple[Tuple[str, ...], Dict[str, float], float]] = {}
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        self.lengths: List[float] = []
+        self.reused = 0
+
+        for item in self.items:
+            cached = reuse.get(item.id)
+            texts = tuple(_field_text(item, field) for field, _ in FIELD_WEIGHTS)
+            if cached is not None and cached[0] == texts:
+                doc = cached
+                self.reused += 1
+            else:
+                doc = _document(texts)
+            self._docs.setdefault(item.id, doc)
+            _, tf, length = doc
+            self.lengths.append(length)
+            for term, freq in tf.items():
+                self.postings.setdefault(term, []).append((item.position, freq))
+
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        self.vocabulary = sorted(self.postings)
+        n = len(self.items)
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    @property
+    def docs(self) -> Dict[Any, Tuple[Tuple[str, ...], Dict[str, float], float]]:
+        """Per-product tokenization, reusable by a later index or a snapshot."""
+        return self._docs
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        """Vocabulary terms starting with ``prefix`` (bounded)."""
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        out = []
+        for term in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            out.append(term)
+        return out
+
+    def _query_terms(self, query: str, prefix: bool) -> Dict[str, float]:
+        tokens = tokenize(query)
+        terms: Dict[str, float] = {}
+        for n, token in enumerate(tokens):
+            if token in self.postings:
+                terms[token] = 1.0
+            if prefix and n == len(tokens) - 1:
+                for term in self.expand_prefix(token):
+                    terms.setdefault(term, PREFIX_DISCOUNT)
+        return terms
+
+    def search(self, query: str, limit: int = 20, mask: Optional[int] = None,
+               prefix: bool = True) -> List[Tuple[Any, float]]:
+        """Top ``limit`` (item, score) pairs, optionally restricted to a bitmap."""
+        if limit <= 0 or not self.avg_length:
+            return []
+        scores: Dict[int, float] = {}
+        avg = self.avg_length
+        for term, boost in self._query_terms(query, prefix).items():
+            idf = self.idf[term] * boost
+            for pos, freq in self.postings[term]:
+                if mask is not None and not mask >> pos & 1:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[pos] / avg)
+                scores[pos] = scores.get(pos, 0.0) + idf * freq * (BM25_K1 + 1) / (freq + norm)
+        best = heapq.nlargest(limit, scores.items(), key=lambda kv: (kv[1], -kv[0]))
+        return [(self.items[pos], score) for pos, score in best]
@@ -0,0 +1,141 @@
+"""
+Compiled binary snapshot of data/catalog.json.
+
+The JSON file stays the editable source of truth. Next to it we keep a
+marshal-encoded snapshot holding the parsed catalog plus prebuilt filter
+and search indexes, so a cold process can skip JSON parsing and index
+construction.
+
+marshal is not safe against corrupt or crafted input, so the snapshot is
+only a cache this process trusts because it wrote it: a file not owned by
+the current user, or writable by group or others, is ignored, and the
+payload's SHA-256 (in the header) is checked before it is unmarshalled.
+
+File layout::
+
+    MAGIC (8 bytes) | header length (4 bytes, big-endian) | header JSON | payload
+
+The header records the format version, the Python/marshal versions that
+wrote it, the payload checksum, and the stat signature + digest of the
+JSON (and change journal) it was built from. A snapshot whose header does not match the current
+files (or interpreter) is stale and ignored.
+"""
+
+import hashlib
+import json
+import marshal
+import os
+import stat
+import struct
+import sys
+import tempfile
+from typing import Any, Dict, Optional, Tuple
+
+MAGIC = b'IMTXCAT\x00'
+FORMAT_VERSION = 2
+
+# Snapshot file mode: never group/world writable (see _trusted)
+SNAPSHOT_MODE = 0o644
+
+_HEADER_LEN = struct.Struct('>I')
+
+# Read once at import: os.umask() can only be queried by setting it
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def snapshot_path_for(json_path: str) -> str:
+    """data/catalog.json -> data/catalog.snapshot"""
+    root, _ = os.path.splitext(json_path)
+    return root + '.snapshot'
+
+
+def _file_mode(path: str) -> int:
+    """Mode of the existing ``path``, else what open() would give a new file."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except OSError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write_bytes(path: str, data: bytes, mode: Optional[int] = None) -> None:
+    """Write ``data`` to a temp file in the same directory, fsync, rename.
+
+    The file gets ``mode``, else the mode of the one it replaces (mkstemp
+    creates 0600).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, _file_mode(path) if mode is None else mode)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _trusted(fd: int) -> bool:
+    """Owned by us and not writable by anyone else."""
+    st = os.fstat(fd)
+    if hasattr(os, 'geteuid') and st.st_uid != os.geteuid():
+        return False
+    return not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _runtime() -> list:
+    return [sys.version_info[0], sys.version_info[1], marshal.version]
+
+
+def write_snapshot(path: str, source_signature: Tuple[int, ...], digest: str,
+                   payload: Dict[str, Any]) -> None:
+    """Atomically write a snapshot built from the JSON with ``source_signature``."""
+    body = marshal.dumps(payload)
+    header = json.dumps({
+        'format': FORMAT_VERSION,
+        'runtime': _runtime(),
+        'source': list(source_signature),
+        'digest': digest,
+        'sha256': hashlib.sha256(body).hexdigest(),
+    }).encode('utf-8')
+    blob = MAGIC + _HEADER_LEN.pack(len(header)) + header + body
+    atomic_write_bytes(path, blob, mode=SNAPSHOT_MODE & ~_UMASK)
+
+
+def read_snapshot(path: str, source_signature: Optional[Tuple[int, ...]]
+                  ) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Return ``(digest, payload)`` if a fresh snapshot exists, else None."""
+    try:
+        with open(path, 'rb') as f:
+            if not _trusted(f.fileno()):
+                return None
+            blob = f.read()
+    except OSError:
+        return None
+    if not blob.startswith(MAGIC):
+        return None
+    try:
+        offset = len(MAGIC)
+        (size,) = _HEADER_LEN.unpack_from(blob, offset)
+        offset += _HEADER_LEN.size
+        header = json.loads(blob[offset:offset + size])
+        if (header.get('format') != FORMAT_VERSION
+                or header.get('runtime') != _runtime()
+                or source_signature is None
+                or tuple(header.get('source', ())) != tuple(source_signature)):
+            return None
+        body = blob[offset + size:]
+        if hashlib.sha256(body).hexdigest() != header.get('sha256'):
+            return None
+        payload = marshal.loads(body)
+    except (struct.error, ValueError, EOFError, TypeError):
+        return None
+    if not isinstance(payload, dict) or 'data' not in payload:
+        return None
+    return header['digest'], payload
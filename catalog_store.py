@@ -0,0 +1,788 @@
+"""
+In-memory catalog store for the valet server.
+
+Loads data/catalog.json once per process and hands out an immutable
+snapshot. The file is re-read only when its stat signature (mtime, inode,
+size) changes, or when a reload is forced (SIGHUP / admin endpoint).
+"""
+
+import base64
+import bisect
+import hashlib
+import heapq
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from catalog_search import SearchIndex
+from catalog_snapshot import read_snapshot, snapshot_path_for, write_snapshot
+from catalog_writer import (
+    JOURNAL_RETENTION, apply_entry, journal_path_for, read_journal, replay_entries,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# ------------------------------------------------------------------
+# Immutable containers
+# ------------------------------------------------------------------
+
+class FrozenDict(dict):
+    """dict that refuses mutation. Still a dict, so json/jsonify accept it."""
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("catalog snapshot is read-only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+
+def freeze(value: Any) -> Any:
+    """Recursively convert dicts to FrozenDict and lists to tuples."""
+    if isinstance(value, dict):
+        return FrozenDict((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """Inverse of freeze(): return plain mutable dicts and lists."""
+    if isinstance(value, dict):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+
+# ------------------------------------------------------------------
+# Normalized product model
+# ------------------------------------------------------------------
+
+def _str_tuple(value: Any, shared: Optional[Dict[Tuple[str, ...], Tuple[str, ...]]]) -> Tuple[str, ...]:
+    if not isinstance(value, (list, tuple)):
+        return ()
+    out = tuple(v for v in value if isinstance(v, str))
+    return shared.setdefault(out, out) if shared is not None else out
+
+
+class Product:
+    """Typed, slot-based view of one catalog entry, built once per load.
+
+    Hand-edited and scripted entries disagree on keys (``name`` vs
+    ``title``, ``price`` vs ``priceValue``); this reconciles them so hot
+    paths read attributes instead of chained ``.get()`` calls.
+
+    Only fields something reads are kept, and no reference back to the
+    source dict: the API serializes entries verbatim, so the frozen dicts
+    stay in ``CatalogSnapshot.products`` (look one up by ``position``).
+    Products are therefore an index on top of the dicts, not a
+    replacement; memory per product does not drop below the dict itself.
+    ``shared`` dedupes equal tag tuples across a catalog load.
+    """
+
+    __slots__ = ('position', 'id', 'sku', 'name', 'subtitle', 'description',
+                 'category', 'price', 'url', 'image', 'vibes', 'activities',
+                 'sites', 'tags', 'brand', 'source', 'active')
+
+    def __init__(self, raw: Dict[str, Any], position: int,
+                 shared: Optional[Dict[Tuple[str, ...], Tuple[str, ...]]] = None):
+        get = raw.get
+        self.position = position
+        self.id = get('id')
+        self.sku = get('sku')
+        self.name = get('name') or get('title') or ''
+        self.subtitle = get('subtitle') or ''
+        self.description = get('description') or ''
+        self.category = get('category') or ''
+        price = get('price')
+        if price is None:
+            price = get('priceValue')
+        try:
+            self.price = float(price or 0)
+        except (TypeError, ValueError):
+            self.price = 0.0
+        self.url = get('url') or ''
+        self.image = get('image') or None
+        self.vibes = _str_tuple(get('vibes'), shared)
+        self.activities = _str_tuple(get('activities'), shared)
+        self.sites = _str_tuple(get('sites'), shared)
+        self.tags = _str_tuple(get('tags'), shared)
+        self.brand = get('brand') or ''
+        self.source = get('source')
+        self.active = bool(get('active', True))
+
+    @property
+    def price_label(self) -> str:
+        """Price as shown in prompts: ``28`` or ``29.99``."""
+        return f'{self.price:.0f}' if self.price.is_integer() else f'{self.price:.2f}'
+
+    def __repr__(self) -> str:
+        return f'Product({self.id!r}, {self.name!r})'
+
+
+def normalize_products(products: Iterable[Dict[str, Any]]) -> Tuple[Product, ...]:
+    shared: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+    return tuple(Product(p, i, shared) for i, p in enumerate(products))
+
+
+# ------------------------------------------------------------------
+# Inverted indexes
+# ------------------------------------------------------------------
+
+# Index name -> (Product attribute, is the attribute a tuple of values?)
+INDEXED_FIELDS = {
+    'category': ('category', False),
+    'vibe': ('vibes', True),
+    'activity': ('activities', True),
+    'site': ('sites', True),
+    'source': ('source', False),
+}
+
+
+def _indexed_values(item: Product) -> Iterable[Tuple[str, Any]]:
+    for name, (attr, multi) in INDEXED_FIELDS.items():
+        value = getattr(item, attr)
+        for value in (value if multi else (value,)):
+            try:
+                hash(value)
+            except TypeError:  # unhashable junk in hand-edited data
+                continue
+            yield name, value
+
+
+def _sort_key(item: Product) -> Tuple[str, int]:
+    return (str(item.id or ''), item.position)
+
+
+class CatalogIndex:
+    """Per-field inverted indexes over normalized products.
+
+    Postings are Python ints used as bitmaps (bit ``i`` = ``items[i]``),
+    so a multi-filter query is a handful of ``&`` / ``|`` operations
+    regardless of catalog size, and results keep catalog order.
+    """
+
+    __slots__ = ('items', 'products', 'postings', 'all_mask', 'active_mask',
+                 'sort_keys', 'sort_order')
+
+    def __init__(self, items: Tuple[Product, ...], products: Tuple[Dict[str, Any], ...],
+                 prebuilt: Optional[Dict[str, Any]] = None):
+        self.items = items
+        self.products = products
+        if prebuilt is not None:
+            # Loaded from a binary snapshot (see catalog_snapshot.py)
+            self.postings = prebuilt['postings']
+            self.all_mask = prebuilt['all_mask']
+            self.active_mask = prebuilt['active_mask']
+            self.sort_keys = prebuilt['sort_keys']
+            self.sort_order = tuple(i for _, i in self.sort_keys)
+            return
+        self.postings: Dict[str, Dict[Any, int]] = {name: {} for name in INDEXED_FIELDS}
+        self.all_mask = (1 << len(items)) - 1
+        self.active_mask = 0
+        for item in items:
+            self._add(item)
+        # Stable pagination order: product id, ties broken by position
+        keyed = sorted(_sort_key(item) for item in items)
+        self.sort_keys = keyed
+        self.sort_order = tuple(i for _, i in keyed)
+
+    def _add(self, item: Product) -> None:
+        bit = 1 << item.position
+        if item.active:
+            self.active_mask |= bit
+        for name, value in _indexed_values(item):
+            postings = self.postings[name]
+            postings[value] = postings.get(value, 0) | bit
+
+    def _remove(self, item: Product) -> None:
+        bit = 1 << item.position
+        self.active_mask &= ~bit
+        for name, value in _indexed_values(item):
+            postings = self.postings[name]
+            remaining = postings.get(value, 0) & ~bit
+            if remaining:
+                postings[value] = remaining
+            else:
+                postings.pop(value, None)
+
+    def updated(self, items: Tuple[Product, ...], products: Tuple[Dict[str, Any], ...],
+                changed: Iterable[int]) -> 'CatalogIndex':
+        """New index for ``items`` where only positions in ``changed`` differ.
+
+        Positions past the end of the current items are appends. Postings
+        are patched bit by bit instead of rebuilt; ``self`` is not modified.
+        """
+        index = CatalogIndex.__new__(CatalogIndex)
+        index.items = items
+        index.products = products
+        index.postings = {name: dict(p) for name, p in self.postings.items()}
+        index.all_mask = (1 << len(items)) - 1
+        index.active_mask = self.active_mask
+        sort_keys = list(self.sort_keys)
+        for i in sorted(set(changed)):
+            new = items[i]
+            if i < len(self.items):
+                old = self.items[i]
+                index._remove(old)
+                if _sort_key(old) != _sort_key(new):
+                    del sort_keys[bisect.bisect_left(sort_keys, _sort_key(old))]
+                    bisect.insort(sort_keys, _sort_key(new))
+            else:
+                bisect.insort(sort_keys, _sort_key(new))
+            index._add(new)
+        index.sort_keys = sort_keys
+        index.sort_order = tuple(i for _, i in sort_keys)
+        return index
+
+    def export(self) -> Dict[str, Any]:
+        """Plain-data form of the index, for the binary snapshot."""
+        return {
+            'postings': self.postings,
+            'all_mask': self.all_mask,
+            'active_mask': self.active_mask,
+            'sort_keys': self.sort_keys,
+        }
+
+    def mask(self, field: str, value: Any) -> int:
+        """Bitmap of products whose ``field`` contains ``value``."""
+        return self.postings[field].get(value, 0)
+
+    def any_of(self, field: str, values: Iterable[Any]) -> int:
+        """Bitmap of products matching at least one of ``values``."""
+        postings = self.postings[field]
+        result = 0
+        for value in values:
+            result |= postings.get(value, 0)
+        return result
+
+    def values(self, field: str) -> List[Any]:
+        return list(self.postings[field])
+
+    def select(self, mask: int) -> List[Dict[str, Any]]:
+        """Materialize a bitmap into products, in catalog order."""
+        products = self.products
+        out = []
+        while mask:
+            low = mask & -mask
+            out.append(products[low.bit_length() - 1])
+            mask ^= low
+        return out
+
+    def filter_mask(self, active_only: bool = True, **filters: Any) -> int:
+        """Intersect filters into a bitmap; a list value means "any of"."""
+        mask = self.active_mask if active_only else self.all_mask
+        for field, value in filters.items():
+            if value is None or value == '':
+                continue
+            if isinstance(value, (list, tuple, set)):
+                mask &= self.any_of(field, value)
+            else:
+                mask &= self.mask(field, value)
+            if not mask:
+                break
+        return mask
+
+    def filter(self, active_only: bool = True, **filters: Any) -> List[Dict[str, Any]]:
+        """Products matching every filter, in catalog order.
+
+        Example: ``index.filter(category='underwear', vibe=['bold', 'party'])``
+        """
+        return self.select(self.filter_mask(active_only, **filters))
+
+    def page(self, mask: int, limit: int,
+             after: Optional[Tuple[str, int]] = None) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, int]]]:
+        """One page of ``mask`` in (id, position) order.
+
+        Returns ``(products, next_key)``; ``next_key`` is None on the last
+        page. ``after`` is the key returned by the previous page.
+        """
+        start = bisect.bisect_right(self.sort_keys, after) if after else 0
+        out: List[Dict[str, Any]] = []
+        last = None
+        order = self.sort_order
+        for n in range(start, len(order)):
+            i = order[n]
+            if not mask >> i & 1:
+                continue
+            if len(out) == limit:
+                return out, last
+            out.append(self.products[i])
+            last = self.sort_keys[n]
+        return out, None
+
+
+def encode_cursor(key: Tuple[str, int]) -> str:
+    """Opaque, URL-safe pagination cursor for an index sort key."""
+    raw = json.dumps(list(key), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Inverse of encode_cursor(). Raises ValueError on a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        pid, pos = json.loads(raw)
+        return (str(pid), int(pos))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor: {cursor!r}') from e
+
+
+def project(product: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+    """Keep only ``fields`` (plus ``id``) of a product."""
+    out = {'id': product.get('id')}
+    for field in fields:
+        if field in product:
+            out[field] = product[field]
+    return out
+
+
+# ------------------------------------------------------------------
+# Offers scoring
+# ------------------------------------------------------------------
+
+# Points per product tag that matches a context word
+OFFER_TAG_WEIGHT = 2
+
+
+class OffersEngine:
+    """Context-to-product scoring for /api/valet/offers.
+
+    A product's tags are its vibes, activities and category. A context word
+    matches a tag when either is a substring of the other. Tags are
+    lower-cased and indexed once per snapshot, so a query scans the (small)
+    tag vocabulary instead of every product, and only products sharing a
+    term with the context are scored.
+    """
+
+    __slots__ = ('products', 'index', 'by_id', 'term_postings', '_word_cache')
+
+    def __init__(self, index: CatalogIndex):
+        self.products = index.products
+        self.index = index
+        self.by_id: Dict[Any, int] = {}
+        # term -> {product position: number of times the term is a tag}
+        self.term_postings: Dict[str, Dict[int, int]] = {}
+        self._word_cache: Dict[str, Tuple[str, ...]] = {}
+        for item in index.items:
+            i = item.position
+            self.by_id.setdefault(item.id, i)
+            for tag in item.vibes + item.activities + (item.category,):
+                if not isinstance(tag, str) or not tag:
+                    continue
+                postings = self.term_postings.setdefault(tag.lower(), {})
+                postings[i] = postings.get(i, 0) + 1
+
+    def _terms_for(self, word: str) -> Tuple[str, ...]:
+        terms = self._word_cache.get(word)
+        if terms is None:
+            terms = tuple(t for t in self.term_postings if word in t or t in word)
+            self._word_cache[word] = terms
+        return terms
+
+    def score(self, context: str) -> Dict[int, int]:
+        """Map product position -> tag score for every candidate product."""
+        matched = set()
+        for word in set(context.lower().split()):
+            matched.update(self._terms_for(word))
+        scores: Dict[int, int] = {}
+        for term in matched:
+            for i, hits in self.term_postings[term].items():
+                scores[i] = scores.get(i, 0) + OFFER_TAG_WEIGHT * hits
+        return scores
+
+    def top(self, context: str, count: int = 3, exclude: Iterable[Any] = (),
+            rng: Optional[random.Random] = None) -> List[Dict[str, Any]]:
+        """Best ``count`` active products for ``context``.
+
+        Each candidate gets a ``[0, 1)`` jitter from ``rng`` for variety;
+        pass a seeded ``random.Random`` for reproducible results. If fewer
+        than ``count`` products match, the rest are drawn at random.
+        """
+        if count <= 0:
+            return []
+        rng = rng or random
+        allowed = self.index.active_mask
+        for pid in exclude:
+            i = self.by_id.get(pid)
+            if i is not None:
+                allowed &= ~(1 << i)
+
+        scored = [(score + rng.random(), i)
+                  for i, score in sorted(self.score(context).items())
+                  if allowed >> i & 1]
+        best = [i for _, i in heapq.nlargest(count, scored)]
+
+        if len(best) < count:
+            chosen = set(best)
+            rest = [i for i in range(len(self.products))
+                    if allowed >> i & 1 and i not in chosen]
+            best.extend(rng.sample(rest, min(count - len(best), len(rest))))
+        return [self.products[i] for i in best]
+
+
+# ------------------------------------------------------------------
+# Snapshot
+# ------------------------------------------------------------------
+
+# Journal entries kept in memory for /api/valet/catalog/changes
+CHANGES_RETAINED = JOURNAL_RETENTION
+
+class CatalogSnapshot:
+    """One parsed, frozen version of the catalog.
+
+    ``digest`` is a content hash of the source file and is stable across
+    processes; ``generation`` counts reloads within this process.
+    ``version`` is the journal version (see catalog_writer.py) and
+    ``changes`` the retained journal entries, oldest first.
+    """
+
+    __slots__ = ('data', 'products', 'items', 'index', 'offers', 'search', 'digest',
+                 'generation', 'loaded_at', 'source', 'changes')
+
+    def __init__(self, data: Dict[str, Any], digest: str, generation: int,
+                 source: str = 'json', previous: Optional['CatalogSnapshot'] = None,
+                 prebuilt: Optional[Dict[str, Any]] = None,
+                 changes: Iterable[Dict[str, Any]] = ()):
+        prebuilt = prebuilt or {}
+        self.data = freeze(data)
+        self.products = self.data.get('products', ())
+        self.items = normalize_products(self.products)
+        self.index = CatalogIndex(self.items, self.products, prebuilt.get('index'))
+        self.offers = OffersEngine(self.index)
+        self.search = SearchIndex(self.items, previous.search if previous else None,
+                                  docs=prebuilt.get('search_docs'))
+        self.digest = digest
+        self.generation = generation
+        self.loaded_at = time.time()
+        self.source = source
+        self.changes = freeze(list(changes or prebuilt.get('changes', ()))[-CHANGES_RETAINED:])
+
+    @property
+    def version(self) -> int:
+        return self.data.get('version', 0)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def export_indexes(self) -> Dict[str, Any]:
+        return {'index': self.index.export(), 'search_docs': self.search.docs,
+                'changes': thaw(self.changes)}
+
+    def changes_since(self, since: int, limit: int) -> Tuple[List[Dict[str, Any]], bool, bool]:
+        """Journal entries with ``version > since``, oldest first.
+
+        Returns ``(entries, has_more, reset)``. ``reset`` means the history
+        no longer reaches back to ``since`` (or ``since`` is from another
+        catalog lineage), so the client must refetch the full catalog.
+        """
+        version = self.version
+        if since > version:
+            return [], False, True
+        if since == version:
+            return [], False, False
+        start = bisect.bisect_right(self.changes, since, key=lambda e: e.get('version', 0))
+        if start == 0 and (not self.changes or self.changes[0].get('version', 0) > since + 1):
+            return [], False, True
+        entries = list(self.changes[start:start + limit])
+        return entries, start + limit < len(self.changes), False
+
+    def apply(self, entries: List[Dict[str, Any]], digest: str,
+              generation: int) -> 'CatalogSnapshot':
+        """Derive the next snapshot from journal ``entries`` newer than this one.
+
+        Upserts, patches and (de)activations reuse every unchanged Product
+        and patch the index postings in place of a rebuild; a delete shifts
+        positions, so it falls back to rebuilding the filter index.
+        """
+        products = list(self.products)
+        positions = {p.get('id'): i for i, p in reversed(list(enumerate(products)))}
+        changed = set()
+        shifted = False
+        version = self.version
+        for entry in entries:
+            if entry.get('version', 0) <= version:
+                continue
+            apply_entry(products, entry, positions)
+            version = entry['version']
+            if entry['op'] == 'delete':
+                shifted = True
+            elif entry['id'] in positions:
+                changed.add(positions[entry['id']])
+        frozen = tuple(p if isinstance(p, FrozenDict) else freeze(p) for p in products)
+
+        snap = CatalogSnapshot.__new__(CatalogSnapshot)
+        snap.data = FrozenDict(self.data, products=frozen, version=version)
+        snap.products = frozen
+        if shifted:
+            snap.items = normalize_products(frozen)
+            snap.index = CatalogIndex(snap.items, frozen)
+        else:
+            items = list(self.items)
+            for i in sorted(changed):
+                if i < len(items):
+                    items[i] = Product(frozen[i], i)
+                else:
+                    items.append(Product(frozen[i], i))
+            snap.items = tuple(items)
+            snap.index = self.index.updated(snap.items, frozen, changed)
+        snap.offers = OffersEngine(snap.index)
+        snap.search = SearchIndex(snap.items, self.search)
+        snap.digest = digest
+        snap.generation = generation
+        snap.loaded_at = time.time()
+        snap.source = 'journal'
+        snap.changes = (self.changes + freeze(
+            [e for e in entries if e.get('version', 0) > self.version]))[-CHANGES_RETAINED:]
+        return snap
+
+
+# ------------------------------------------------------------------
+# Store
+# ------------------------------------------------------------------
+
+class CatalogStore:
+    """Process-wide catalog cache with stat-based hot reload.
+
+    The catalog is catalog.json plus any journal entries newer than its
+    ``version`` (see catalog_writer.py). A change to catalog.json reloads;
+    if only the journal grew, the new entries are applied to the current
+    snapshot as a delta.
+
+    ``snapshot()`` costs one ``os.stat`` at most every ``check_interval``
+    seconds; otherwise it is a plain attribute read. ``request_reload()``
+    only sets a flag (safe in a signal handler); the next ``snapshot()``
+    call does the reload.
+
+    With ``use_binary_snapshot`` a cold start loads the compiled snapshot
+    next to the JSON (if it was built from the current JSON), and every JSON
+    load rewrites that snapshot.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0,
+                 use_binary_snapshot: bool = True):
+        self.path = path
+        self.check_interval = check_interval
+        self.snapshot_path = snapshot_path_for(path) if use_binary_snapshot else None
+        self.journal_path = journal_path_for(path)
+        self._lock = threading.Lock()
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._signature: Optional[Tuple[int, ...]] = None
+        self._checked_at = 0.0
+        self._reload_requested = False
+        self._generation = 0
+        self._source_digest = ''  # sha1 of the catalog.json bytes
+
+    def _stat_signature(self) -> Optional[Tuple[int, ...]]:
+        """(mtime, inode, size) of the JSON followed by those of its journal."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        try:
+            jst = os.stat(self.journal_path)
+            journal = (jst.st_mtime_ns, jst.st_ino, jst.st_size)
+        except OSError:
+            journal = (0, 0, 0)
+        return (st.st_mtime_ns, st.st_ino, st.st_size) + journal
+
+    def _digest(self, version: int) -> str:
+        """Content hash of the JSON source plus the journal version on top of it."""
+        return hashlib.sha1(f'{self._source_digest}:{version}'.encode('ascii')).hexdigest()[:16]
+
+    def _load(self, signature: Tuple[int, ...]) -> None:
+        """Parse the file, replay the journal, swap in a new snapshot.
+        Caller holds the lock."""
+        with open(self.path, 'rb') as f:
+            raw = f.read()
+        entries = list(read_journal(self.journal_path))
+        data = replay_entries(json.loads(raw), entries)
+        self._source_digest = hashlib.sha1(raw).hexdigest()
+        self._generation += 1
+        self._snapshot = CatalogSnapshot(
+            data, self._digest(data['version']), self._generation,
+            previous=self._snapshot, changes=entries)
+        self._signature = signature
+        logger.info('Loaded catalog %s (%d products, digest %s)',
+                    self.path, len(self._snapshot.products), self._snapshot.digest)
+        self._write_binary(data)
+
+    def _apply_journal(self, signature: Tuple[int, ...]) -> bool:
+        """Apply journal entries appended since the current snapshot.
+
+        Only valid when catalog.json itself is unchanged and the journal
+        grew in place; returns False when a full load is needed instead.
+        """
+        old_ino, old_size = self._signature[4], self._signature[5]
+        new_ino, new_size = signature[4], signature[5]
+        if old_ino not in (0, new_ino) or new_size < old_size:
+            return False  # journal was rewritten (compaction)
+        snap = self._snapshot
+        entries = list(read_journal(self.journal_path, since=snap.version))
+        self._signature = signature
+        if not entries:
+            return True
+        version = entries[-1]['version']
+        self._generation += 1
+        self._snapshot = snap.apply(entries, self._digest(version), self._generation)
+        logger.info('Applied %d catalog change(s) up to version %d (digest %s)',
+                    len(entries), version, self._snapshot.digest)
+        self._write_binary(thaw(self._snapshot.data))
+        return True
+
+    def _write_binary(self, data: Dict[str, Any]) -> None:
+        if not self.snapshot_path:
+            return
+        payload = dict(self._snapshot.export_indexes(), data=data,
+                       source_digest=self._source_digest)
+        try:
+            write_snapshot(self.snapshot_path, self._signature, self._snapshot.digest, payload)
+        except (OSError, ValueError) as e:
+            logger.warning('Could not write catalog snapshot: %s', e)
+
+    def _load_binary(self, signature: Tuple[int, ...]) -> bool:
+        """Cold-start from the compiled snapshot if it matches the JSON."""
+        found = read_snapshot(self.snapshot_path, signature)
+        if found is None or 'source_digest' not in found[1]:
+            return False
+        digest, payload = found
+        self._source_digest = payload['source_digest']
+        self._generation += 1
+        self._snapshot = CatalogSnapshot(
+            payload['data'], digest, self._generation, source='snapshot', prebuilt=payload)
+        self._signature = signature
+        logger.info('Loaded catalog snapshot %s (%d products, digest %s)',
+                    self.snapshot_path, len(self._snapshot.products), digest)
+        return True
+
+    def _refresh(self, force: bool = False) -> None:
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._stat_signature()
+            if signature is None:
+                if self._snapshot is None:
+                    return
+                logger.warning('Catalog %s disappeared; serving last snapshot', self.path)
+                return
+            if not force and signature == self._signature:
+                return
+            try:
+                if self._snapshot is None:
+                    if self.snapshot_path and self._load_binary(signature):
+                        return
+                elif (not force and signature[:3] == self._signature[:3]
+                        and self._apply_journal(signature)):
+                    return
+                self._load(signature)
+            except (OSError, ValueError) as e:
+                # Keep serving the previous snapshot (e.g. a half-written file)
+                logger.error('Failed to load catalog: %s', e)
+
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        """Return the current snapshot, reloading if the file changed."""
+        if self._reload_requested:
+            self._reload_requested = False
+            self._refresh(force=True)
+        elif (self._snapshot is None
+                or time.monotonic() - self._checked_at >= self.check_interval):
+            self._refresh()
+        return self._snapshot
+
+    def reload(self) -> Optional[CatalogSnapshot]:
+        """Force a re-read of the catalog file regardless of its stat."""
+        self._refresh(force=True)
+        return self._snapshot
+
+    def request_reload(self) -> None:
+        """Force a re-read on the next snapshot() call (takes no lock)."""
+        self._reload_requested = True
+
+    def status(self) -> Dict[str, Any]:
+        snap = self._snapshot
+        return {
+            'path': self.path,
+            'loaded': snap is not None,
+            'digest': snap.digest if snap else None,
+            'generation': snap.generation if snap else 0,
+            'products': len(snap.products) if snap else 0,
+            'loaded_at': snap.loaded_at if snap else None,
+            'source': snap.source if snap else None,
+            'version': snap.version if snap else 0,
+        }
+
+
+# ------------------------------------------------------------------
+# Encoded response cache
+# ------------------------------------------------------------------
+
+class CachedResponse:
+    __slots__ = ('body', 'etag')
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+
+
+class ResponseCache:
+    """LRU of already-encoded JSON bodies, scoped to one catalog version.
+
+    Entries are looked up with the catalog digest they were built from; the
+    first lookup with a different digest drops everything, so a catalog
+    reload invalidates the cache without any explicit hook.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Any, CachedResponse]' = OrderedDict()
+        self._version: Optional[str] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self, version: str) -> None:
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key: Any, version: str) -> Optional[CachedResponse]:
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Any, version: str, body: bytes) -> CachedResponse:
+        entry = CachedResponse(body)
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'entries': len(self._entries), 'version': self._version,
+                'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,292 @@
+"""
+Shared catalog mutation layer.
+
+Every script that changes data/catalog.json goes through CatalogWriter:
+
+    with CatalogWriter(CATALOG_PATH) as catalog:
+        catalog.upsert([product, ...])      # or insert() to never replace
+        catalog.delete(['old-id'])
+        catalog.commit(compact=True)
+
+The writer holds an exclusive lock (catalog.json.lock) for the whole
+read-modify-write cycle. Changes are appended to an append-only journal
+(catalog.journal.jsonl), one versioned entry per operation. Compaction
+folds the journal into catalog.json with write-to-temp-and-rename, so
+readers never see a half-written file. Without compaction, a change costs
+one journal append instead of rewriting the whole catalog; readers replay
+journal entries newer than the catalog's ``version`` on top of it.
+"""
+
+import json
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from catalog_snapshot import atomic_write_bytes
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# Uncompacted journal entries that trigger an automatic compaction on commit()
+COMPACT_THRESHOLD = 500
+
+# Journal entries kept after compaction (history for change feeds)
+JOURNAL_RETENTION = 5000
+
+
+def journal_path_for(json_path: str) -> str:
+    """data/catalog.json -> data/catalog.journal.jsonl"""
+    root, _ = os.path.splitext(json_path)
+    return root + '.journal.jsonl'
+
+
+def lock_path_for(json_path: str) -> str:
+    return json_path + '.lock'
+
+
+# ------------------------------------------------------------------
+# Journal reading / replay
+# ------------------------------------------------------------------
+
+def read_journal(path: str, since: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yield journal entries with ``version > since``.
+
+    A torn final line (a writer crashed mid-append) is skipped.
+    """
+    try:
+        f = open(path, 'r', encoding='utf-8')
+    except OSError:
+        return
+    with f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('version', 0) > since:
+                yield entry
+
+
+def apply_entry(products: List[Dict[str, Any]], entry: Dict[str, Any],
+                positions: Optional[Dict[Any, int]] = None) -> None:
+    """Apply one journal entry to a mutable product list in place."""
+    if positions is None:
+        positions = {p.get('id'): i for i, p in reversed(list(enumerate(products)))}
+    op = entry['op']
+    pid = entry['id']
+    i = positions.get(pid)
+    if op == 'upsert':
+        if i is None:
+            positions[pid] = len(products)
+            products.append(entry['product'])
+        else:
+            products[i] = entry['product']
+    elif i is None:
+        return
+    elif op == 'delete':
+        # Hand-edited catalogs can hold duplicate ids; drop every copy
+        products[:] = [p for p in products if p.get('id') != pid]
+        positions.clear()
+        positions.update({p.get('id'): n for n, p in reversed(list(enumerate(products)))})
+    elif op == 'patch':
+        products[i] = dict(products[i], **entry['fields'])
+    elif op in ('activate', 'deactivate'):
+        products[i] = dict(products[i], active=(op == 'activate'))
+
+
+def replay_entries(data: Dict[str, Any], entries: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply ``entries`` newer than ``data['version']`` to ``data`` in place."""
+    products = data.setdefault('products', [])
+    positions = None
+    version = data.get('version', 0)
+    for entry in entries:
+        if entry.get('version', 0) <= version:
+            continue
+        if positions is None:
+            positions = {p.get('id'): i for i, p in reversed(list(enumerate(products)))}
+        apply_entry(products, entry, positions)
+        version = entry['version']
+    data['version'] = version
+    return data
+
+
+def replay_journal(data: Dict[str, Any], journal_path: str) -> Dict[str, Any]:
+    """Apply journal entries newer than ``data['version']`` to ``data``."""
+    return replay_entries(data, read_journal(journal_path, since=data.get('version', 0)))
+
+
+def load_catalog_data(json_path: str) -> Dict[str, Any]:
+    """Current catalog as a plain mutable dict (JSON + journal replay)."""
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return replay_journal(data, journal_path_for(json_path))
+
+
+# ------------------------------------------------------------------
+# Writer
+# ------------------------------------------------------------------
+
+class CatalogWriter:
+    """Locked, journaled, batched catalog mutations.
+
+    Use as a context manager. Mutations are staged in memory and written by
+    ``commit()``; leaving the block without committing discards them.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.journal_path = journal_path_for(path)
+        self.lock_path = lock_path_for(path)
+        self.data: Dict[str, Any] = {}
+        self._positions: Dict[Any, int] = {}
+        self._pending: List[Dict[str, Any]] = []
+        self._base_version = 0  # version already folded into catalog.json
+        self._lock_file = None
+
+    # -- locking --------------------------------------------------------
+
+    def __enter__(self) -> 'CatalogWriter':
+        self._lock_file = open(self.lock_path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._base_version = data.get('version', 0)
+            self.data = replay_journal(data, self.journal_path)
+            self._positions = {p.get('id'): i for i, p in
+                               reversed(list(enumerate(self.data['products'])))}
+        except BaseException:
+            self._unlock()  # __exit__ does not run when __enter__ raises
+            raise
+        self._pending = []
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._pending = []
+        self._unlock()
+
+    def _unlock(self) -> None:
+        if self._lock_file is not None:
+            if fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+    # -- reads ----------------------------------------------------------
+
+    @property
+    def products(self) -> List[Dict[str, Any]]:
+        return self.data['products']
+
+    @property
+    def version(self) -> int:
+        return self.data.get('version', 0)
+
+    def get(self, product_id: Any) -> Optional[Dict[str, Any]]:
+        i = self._positions.get(product_id)
+        return self.products[i] if i is not None else None
+
+    def __contains__(self, product_id: Any) -> bool:
+        return product_id in self._positions
+
+    # -- staged mutations -----------------------------------------------
+
+    def _stage(self, op: str, pid: Any, **extra: Any) -> None:
+        entry = {'op': op, 'id': pid, 'ts': time.time(), **extra}
+        apply_entry(self.products, entry, self._positions)
+        self._pending.append(entry)
+
+    def upsert(self, products: Iterable[Dict[str, Any]]) -> int:
+        """Insert or replace products by ``id``. Returns how many were staged."""
+        count = 0
+        for product in products:
+            if not product.get('id'):
+                raise ValueError(f'Product without id: {product!r}')
+            self._stage('upsert', product['id'], product=product)
+            count += 1
+        return count
+
+    def insert(self, products: Iterable[Dict[str, Any]]) -> List[Any]:
+        """Add products without replacing any: a product whose ``id`` is
+        taken is stored as ``<id>-2``, ``<id>-3``, ... Returns the ids used."""
+        ids = []
+        for product in products:
+            if not product.get('id'):
+                raise ValueError(f'Product without id: {product!r}')
+            pid, n = product['id'], 2
+            while pid in self._positions:
+                pid, n = f"{product['id']}-{n}", n + 1
+            self._stage('upsert', pid, product=dict(product, id=pid))
+            ids.append(pid)
+        return ids
+
+    def delete(self, product_ids: Iterable[Any]) -> int:
+        """Remove products by id. Unknown ids are ignored. Returns removed count."""
+        count = 0
+        for pid in product_ids:
+            if pid in self._positions:
+                self._stage('delete', pid)
+                count += 1
+        return count
+
+    def patch(self, product_id: Any, **fields: Any) -> bool:
+        """Set individual fields on one product (e.g. ``image=...``)."""
+        if product_id not in self._positions:
+            return False
+        self._stage('patch', product_id, fields=fields)
+        return True
+
+    def set_active(self, product_ids: Iterable[Any], active: bool = True) -> int:
+        count = 0
+        for pid in product_ids:
+            if pid in self._positions:
+                self._stage('activate' if active else 'deactivate', pid)
+                count += 1
+        return count
+
+    # -- persistence ----------------------------------------------------
+
+    def commit(self, compact: Optional[bool] = None) -> int:
+        """Write staged changes; returns the new catalog version.
+
+        Appends one journal line per change. ``compact=True`` also rewrites
+        catalog.json; ``None`` compacts once the journal has more than
+        COMPACT_THRESHOLD unfolded entries.
+        """
+        if self._lock_file is None:
+            raise RuntimeError('CatalogWriter.commit() called outside its with-block')
+        version = self.version
+        if self._pending:
+            lines = []
+            for entry in self._pending:
+                version += 1
+                entry['version'] = version
+                lines.append(json.dumps(entry, separators=(',', ':')) + '\n')
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            self.data['version'] = version
+            self._pending = []
+
+        if compact is None:
+            compact = version - self._base_version > COMPACT_THRESHOLD
+        if compact:
+            self._compact()
+        return version
+
+    def _compact(self) -> None:
+        """Fold the journal into catalog.json (atomic rename) and trim history."""
+        body = json.dumps(self.data, indent=2).encode('utf-8')
+        atomic_write_bytes(self.path, body)
+        self._base_version = self.version
+        entries = list(read_journal(self.journal_path))
+        if len(entries) > JOURNAL_RETENTION:
+            kept = ''.join(json.dumps(e, separators=(',', ':')) + '\n'
+                           for e in entries[-JOURNAL_RETENTION:])
+            atomic_write_bytes(self.journal_path, kept.encode('utf-8'))
@@ -0,0 +1,313 @@
+"""
+Async LLM gateway.
+
+All provider calls run as coroutines on one event loop in a dedicated
+thread. Flask handlers hand work to the loop with ``run()`` and block on
+the result, so a WSGI worker is still held for the whole call; what the
+gateway adds is admission control in one place. ASGI code can await
+``arun()`` directly and holds no thread while it waits.
+
+With httpx installed (see requirements.txt) the provider request itself
+is a coroutine on the loop. Without it, llm_http.py runs the blocking
+request in a bounded thread pool, so each call also holds a pool thread.
+
+Admission control:
+
+- each provider has a concurrency limit (an ``asyncio.Semaphore``);
+- a call waits at most ``queue_timeout`` seconds for a slot;
+- at most ``max_waiting`` calls may wait across all providers.
+
+A call that cannot be admitted fails fast with GatewayOverloaded (the
+server answers 503 + Retry-After) instead of piling up behind a slow
+provider.
+
+``hedge()`` races a backup provider against a slow primary: the backup
+starts once the primary has not answered within a latency budget, and the
+first success wins.
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER_LIMIT = 32
+DEFAULT_MAX_WAITING = 256
+DEFAULT_QUEUE_TIMEOUT = 10.0
+
+
+class GatewayOverloaded(RuntimeError):
+    """A provider is saturated; retry after ``retry_after`` seconds."""
+
+    def __init__(self, provider: str, reason: str, retry_after: int = 1):
+        super().__init__(f'{provider} is overloaded ({reason}); retry in {retry_after}s')
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """``"groq:8,gemini:16"`` -> ``{'groq': 8, 'gemini': 16}``"""
+    limits = {}
+    for part in (spec or '').split(','):
+        name, _, value = part.partition(':')
+        if name.strip() and value.strip().isdigit():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class _Lane:
+    """Concurrency state for one provider. Touched only on the loop thread."""
+
+    __slots__ = ('limit', 'semaphore', 'in_flight', 'waiting', 'completed',
+                 'failed', 'rejected', 'wait_seconds')
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+
+
+class LLMGateway:
+    """Event-loop thread that runs provider coroutines under per-provider limits."""
+
+    def __init__(self, provider_limit: int = DEFAULT_PROVIDER_LIMIT,
+                 provider_limits: Optional[Dict[str, int]] = None,
+                 max_waiting: int = DEFAULT_MAX_WAITING,
+                 queue_timeout: float = DEFAULT_QUEUE_TIMEOUT):
+        self.provider_limit = provider_limit
+        self.provider_limits = dict(provider_limits or {})
+        self.max_waiting = max_waiting
+        self.queue_timeout = queue_timeout
+        self._lanes: Dict[str, _Lane] = {}
+        self._waiting = 0
+        self.hedge_stats = {'calls': 0, 'backups_launched': 0, 'backup_wins': 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    # -- event loop -----------------------------------------------------
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The gateway loop, started on first use."""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(target=loop.run_forever,
+                                              name='llm-gateway', daemon=True)
+                    thread.start()
+                    self._thread = thread
+                    self._loop = loop
+        return self._loop
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+            if loop is not None:
+                loop.call_soon_threadsafe(loop.stop)
+                self._thread.join(timeout=5)
+                loop.close()
+            self._lanes.clear()
+            self._waiting = 0
+
+    # -- admission ------------------------------------------------------
+
+    def _lane(self, provider: str) -> _Lane:
+        lane = self._lanes.get(provider)
+        if lane is None:
+            limit = self.provider_limits.get(provider, self.provider_limit)
+            lane = self._lanes[provider] = _Lane(limit)
+        return lane
+
+    async def _acquire(self, provider: str) -> _Lane:
+        lane = self._lane(provider)
+        if lane.semaphore.locked():
+            if self._waiting >= self.max_waiting:
+                lane.rejected += 1
+                raise GatewayOverloaded(provider, 'queue full')
+            self._waiting += 1
+            lane.waiting += 1
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(lane.semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                lane.rejected += 1
+                raise GatewayOverloaded(provider, 'no free slot',
+                                        retry_after=max(1, int(self.queue_timeout))) from None
+            finally:
+                self._waiting -= 1
+                lane.waiting -= 1
+                lane.wait_seconds += time.perf_counter() - started
+        else:
+            await lane.semaphore.acquire()
+        lane.in_flight += 1
+        return lane
+
+    def _release(self, lane: _Lane, ok: bool) -> None:
+        lane.in_flight -= 1
+        if ok:
+            lane.completed += 1
+        else:
+            lane.failed += 1
+        lane.semaphore.release()
+
+    # -- calls ----------------------------------------------------------
+
+    async def arun(self, provider: str, fn: Callable[..., Awaitable[Any]],
+                   *args: Any, **kwargs: Any) -> Any:
+        """Await ``fn(*args, **kwargs)`` inside ``provider``'s concurrency limit.
+        Must be awaited on the gateway loop."""
+        lane = await self._acquire(provider)
+        ok = False
+        try:
+            result = await fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            self._release(lane, ok)
+
+    def submit(self, coro: Awaitable[Any]) -> 'concurrent.futures.Future[Any]':
+        """``asyncio.run_coroutine_threadsafe()``, with the coroutine running
+        in a copy of the caller's context (so context variables such as the
+        request trace are visible on the loop)."""
+        loop = self.loop
+        context = contextvars.copy_context()
+        future: 'concurrent.futures.Future[Any]' = concurrent.futures.Future()
+
+        def start() -> None:
+            if future.cancelled():
+                coro.close()
+                return
+            task = loop.create_task(coro, context=context)
+
+            def done(task: asyncio.Task) -> None:
+                if not future.set_running_or_notify_cancel():
+                    return  # cancelled by the caller meanwhile
+                if task.cancelled():
+                    future.set_exception(concurrent.futures.CancelledError())
+                elif task.exception() is not None:
+                    future.set_exception(task.exception())
+                else:
+                    future.set_result(task.result())
+
+            task.add_done_callback(done)
+            future.add_done_callback(
+                lambda f: f.cancelled() and loop.call_soon_threadsafe(task.cancel))
+
+        loop.call_soon_threadsafe(start)
+        return future
+
+    def run(self, provider: str, fn: Callable[..., Awaitable[Any]], *args: Any,
+            timeout: Optional[float] = None, **kwargs: Any) -> Any:
+        """Blocking entry point for WSGI handlers: run ``arun()`` on the loop."""
+        future = self.submit(self.arun(provider, fn, *args, **kwargs))
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def ahedge(self, attempts: Sequence[Tuple[str, Callable[..., Awaitable[Any]], tuple]],
+                     budget: float) -> Tuple[int, Any]:
+        """Hedged call: first success among ``attempts`` wins.
+
+        ``attempts`` are ``(provider, fn, args)``, primary first. The next
+        attempt starts when nothing has succeeded within ``budget`` seconds,
+        or as soon as every running attempt has failed. Losers are
+        cancelled. Returns ``(attempt index, result)``; if all fail, the
+        earliest attempt's error is raised.
+        """
+        pending: Dict[asyncio.Future, int] = {}
+        errors: Dict[int, BaseException] = {}
+        launched = 0
+
+        def launch() -> None:
+            nonlocal launched
+            provider, fn, args = attempts[launched]
+            pending[asyncio.ensure_future(self.arun(provider, fn, *args))] = launched
+            if launched:
+                self.hedge_stats['backups_launched'] += 1
+            launched += 1
+
+        self.hedge_stats['calls'] += 1
+        launch()
+        try:
+            while pending:
+                timeout = budget if launched < len(attempts) else None
+                done, _ = await asyncio.wait(pending, timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    index = pending.pop(task)
+                    if task.exception() is None:
+                        if index:
+                            self.hedge_stats['backup_wins'] += 1
+                        return index, task.result()
+                    errors[index] = task.exception()
+                if not pending and launched < len(attempts):
+                    launch()
+            raise errors[min(errors)]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def hedge(self, attempts: Sequence[Tuple[str, Callable[..., Awaitable[Any]], tuple]],
+              budget: float, timeout: Optional[float] = None) -> Tuple[int, Any]:
+        """Blocking entry point for ahedge()."""
+        future = self.submit(self.ahedge(attempts, budget))
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    @contextlib.contextmanager
+    def slot(self, provider: str) -> Iterator[None]:
+        """Hold one of ``provider``'s slots for a blocking block of code
+        (e.g. relaying a stream); same limits as run()."""
+        loop = self.loop
+        lane = asyncio.run_coroutine_threadsafe(self._acquire(provider), loop).result()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            loop.call_soon_threadsafe(self._release, lane, ok)
+
+    # -- metrics --------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'provider_limit': self.provider_limit,
+            'max_waiting': self.max_waiting,
+            'queue_timeout': self.queue_timeout,
+            'waiting': self._waiting,
+            'hedging': dict(self.hedge_stats),
+            'providers': {
+                name: {
+                    'limit': lane.limit,
+                    'in_flight': lane.in_flight,
+                    'waiting': lane.waiting,
+                    'completed': lane.completed,
+                    'failed': lane.failed,
+                    'rejected': lane.rejected,
+                    'avg_wait_seconds': round(lane.wait_seconds / (lane.completed + lane.failed), 4)
+                                        if lane.completed + lane.failed else 0.0,
+                }
+                for name, lane in list(self._lanes.items())
+            },
+        }
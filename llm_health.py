@@ -0,0 +1,226 @@
+"""
+Per-provider circuit breakers for LLM calls.
+
+Each provider gets a CircuitBreaker over a rolling time window of recent
+calls. A call counts as failed on a 5xx/429 answer, a timeout or a network
+error; it counts as slow when it takes ``slow_seconds`` or more. Once the
+window holds ``min_calls`` calls and the error rate or the slow rate
+reaches ``error_rate``, the breaker opens:
+
+- open: calls fail fast with CircuitOpen (a GatewayOverloaded, so the
+  server answers 503 + Retry-After) for ``cooldown`` seconds;
+- half-open: after the cooldown, ``probes`` calls are let through. A
+  successful probe closes the breaker, a failed one reopens it.
+
+ProviderHealth.route() keeps a request on its provider while that breaker
+admits calls, and otherwise moves it to the healthiest configured provider.
+"""
+
+import collections
+import threading
+import time
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+
+from llm_gateway import GatewayOverloaded
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULT_WINDOW = 60.0
+DEFAULT_MIN_CALLS = 5
+DEFAULT_ERROR_RATE = 0.5
+DEFAULT_SLOW_SECONDS = 15.0
+DEFAULT_COOLDOWN = 30.0
+DEFAULT_PROBES = 1
+
+
+class CircuitOpen(GatewayOverloaded):
+    """The provider's breaker is open; retry after ``retry_after`` seconds."""
+
+    def __init__(self, provider: str, retry_after: int = 1):
+        super().__init__(provider, 'circuit open', retry_after)
+
+
+def is_failure_status(status_code: int) -> bool:
+    """Provider-side failures. Other 4xx (bad key, bad request) are the caller's."""
+    return status_code >= 500 or status_code == 429
+
+
+class CircuitBreaker:
+    """Rolling-window breaker for one provider. Thread-safe."""
+
+    def __init__(self, window: float = DEFAULT_WINDOW, min_calls: int = DEFAULT_MIN_CALLS,
+                 error_rate: float = DEFAULT_ERROR_RATE, slow_seconds: float = DEFAULT_SLOW_SECONDS,
+                 cooldown: float = DEFAULT_COOLDOWN, probes: int = DEFAULT_PROBES):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.cooldown = cooldown
+        self.probes = probes
+        self._calls: Deque[Tuple[float, bool, float]] = collections.deque()  # (ended, ok, seconds)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self.times_opened = 0
+        self._lock = threading.Lock()
+
+    # -- state ----------------------------------------------------------
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.cooldown:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def available(self) -> bool:
+        """Would a call be admitted now? (Does not take a probe slot.)"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return state == CLOSED or (state == HALF_OPEN and self._probes_in_flight < self.probes)
+
+    def retry_after(self) -> int:
+        with self._lock:
+            if self._state != OPEN:
+                return 1
+            remaining = self.cooldown - (time.monotonic() - self._opened_at)
+            return max(1, int(remaining + 0.999))
+
+    def _open(self, now: float) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self.times_opened += 1
+
+    # -- calls ----------------------------------------------------------
+
+    def begin(self) -> Optional[bool]:
+        """Admit a call: False for a normal call, True for a half-open probe,
+        None when the breaker rejects it."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and self._probes_in_flight < self.probes:
+                self._probes_in_flight += 1
+                return True
+            return None
+
+    def record(self, ok: bool, seconds: float, probe: bool = False) -> None:
+        """Outcome of a call admitted by begin()."""
+        now = time.monotonic()
+        slow = seconds >= self.slow_seconds
+        with self._lock:
+            self._calls.append((now, ok, seconds))
+            self._trim(now)
+            if probe:
+                if self._state != HALF_OPEN:
+                    return
+                self._probes_in_flight -= 1
+                if ok and not slow:
+                    self._state = CLOSED
+                    self._calls.clear()
+                else:
+                    self._open(now)
+                return
+            if self._state == CLOSED and len(self._calls) >= self.min_calls:
+                failed = sum(1 for _, good, _ in self._calls if not good)
+                slow_calls = sum(1 for _, _, s in self._calls if s >= self.slow_seconds)
+                threshold = self.error_rate * len(self._calls)
+                if failed >= threshold or slow_calls >= threshold:
+                    self._open(now)
+
+    def cancel(self, probe: bool = False) -> None:
+        """A call admitted by begin() ended without an outcome (cancelled,
+        rejected locally); frees its probe slot."""
+        if probe:
+            with self._lock:
+                if self._state == HALF_OPEN and self._probes_in_flight:
+                    self._probes_in_flight -= 1
+
+    def _trim(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+
+    # -- metrics --------------------------------------------------------
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            state = self._current_state(now)
+            calls = list(self._calls)
+        n = len(calls)
+        latencies = sorted(s for _, _, s in calls)
+        return {
+            'state': state,
+            'calls': n,
+            'error_rate': round(sum(1 for _, ok, _ in calls if not ok) / n, 3) if n else 0.0,
+            'slow_rate': round(sum(1 for s in latencies if s >= self.slow_seconds) / n, 3) if n else 0.0,
+            'avg_seconds': round(sum(latencies) / n, 3) if n else None,
+            'p95_seconds': round(latencies[min(n - 1, int(n * 0.95))], 3) if n else None,
+            'times_opened': self.times_opened,
+            'retry_after': self.retry_after() if state == OPEN else None,
+        }
+
+
+class ProviderHealth:
+    """Circuit breakers for every provider, plus health-aware routing."""
+
+    def __init__(self, **breaker_options: Any):
+        self.breaker_options = breaker_options
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self.reroutes = 0
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        breaker = self._breakers.get(provider)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(provider, CircuitBreaker(**self.breaker_options))
+        return breaker
+
+    def begin(self, provider: str) -> bool:
+        """Admit a call to ``provider`` (True if it is a probe); raises CircuitOpen."""
+        breaker = self.breaker(provider)
+        probe = breaker.begin()
+        if probe is None:
+            raise CircuitOpen(provider, breaker.retry_after())
+        return probe
+
+    def record(self, provider: str, ok: bool, seconds: float, probe: bool = False) -> None:
+        self.breaker(provider).record(ok, seconds, probe)
+
+    def cancel(self, provider: str, probe: bool = False) -> None:
+        self.breaker(provider).cancel(probe)
+
+    def _rank(self, provider: str) -> Tuple[int, float, float]:
+        """Sort key: healthier first (closed < half-open, then errors, latency)."""
+        snap = self.breaker(provider).snapshot()
+        return (0 if snap['state'] == CLOSED else 1, snap['error_rate'] + snap['slow_rate'],
+                snap['avg_seconds'] or 0.0)
+
+    def route(self, provider: str, candidates: Iterable[str]) -> Optional[str]:
+        """``provider`` if its breaker admits calls, else the healthiest
+        available candidate, else None."""
+        if self.breaker(provider).available():
+            return provider
+        available = [c for c in candidates if c != provider and self.breaker(c).available()]
+        if not available:
+            return None
+        self.reroutes += 1
+        return min(available, key=self._rank)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {
+            'reroutes': self.reroutes,
+            'providers': {name: breaker.snapshot() for name, breaker in breakers.items()},
+        }
@@ -0,0 +1,332 @@
+"""
+Pooled HTTP transport for LLM provider calls.
+
+One keep-alive session per provider, so consecutive valet queries reuse an
+open TCP + TLS connection instead of paying the handshake every time.
+Sessions are created lazily and shared across request threads.
+
+Transport: ``requests`` (HTTP/1.1 keep-alive via urllib3 connection pools).
+When ``httpx`` and ``h2`` are installed and HTTP/2 is enabled, an
+``httpx.Client(http2=True)`` is used instead; callers see the same
+response interface (``status_code``, ``text``, ``json()``) and the same
+``requests`` exception types either way.
+
+``apost()`` is the coroutine form used by the async gateway
+(llm_gateway.py): with httpx it multiplexes calls on one event loop through
+an ``httpx.AsyncClient``; without it, ``post()`` runs in a thread pool of
+``max_threads``, and calls beyond that wait for a free thread.
+"""
+
+import asyncio
+import contextlib
+import functools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+    import h2  # noqa: F401  (httpx needs it for http2=True)
+except ImportError:
+    httpx = None
+
+logger = logging.getLogger(__name__)
+
+# Keep-alive connections per provider host
+DEFAULT_POOL_SIZE = 10
+
+# Seconds to open a connection / to wait between bytes of the response
+DEFAULT_CONNECT_TIMEOUT = 3.05
+DEFAULT_READ_TIMEOUT = 60.0
+
+# Threads for apost() when no async transport (httpx) is installed
+DEFAULT_MAX_THREADS = 64
+
+
+class ProviderStats:
+    """Request counters for one provider session."""
+
+    __slots__ = ('requests', 'errors', 'timeouts', 'seconds', 'http_versions',
+                 '_connections')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.seconds = 0.0
+        self.http_versions: Dict[str, int] = {}
+        self._connections = set()  # httpx transport: ids of connections seen
+
+
+class StreamedResponse:
+    """A provider response whose body is read line by line."""
+
+    __slots__ = ('response', 'status_code', '_httpx')
+
+    def __init__(self, response: Any, is_httpx: bool):
+        self.response = response
+        self.status_code = response.status_code
+        self._httpx = is_httpx
+
+    def lines(self) -> Iterator[str]:
+        """Body lines as text (UTF-8), as soon as each one arrives."""
+        with _httpx_errors():
+            if self._httpx:
+                yield from self.response.iter_lines()
+            else:
+                for line in self.response.iter_lines():
+                    yield line.decode('utf-8', 'replace')
+
+    def read_text(self) -> str:
+        """Whole remaining body, e.g. an error message."""
+        with _httpx_errors():
+            if self._httpx:
+                self.response.read()
+            return self.response.text
+
+
+@contextlib.contextmanager
+def _httpx_errors() -> Iterator[None]:
+    """Re-raise httpx errors as the equivalent requests exceptions."""
+    if httpx is None:
+        yield
+        return
+    try:
+        yield
+    except httpx.TimeoutException as e:
+        raise requests.Timeout(str(e)) from e
+    except httpx.HTTPError as e:
+        raise requests.ConnectionError(str(e)) from e
+
+
+def _httpx_kwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """requests-style keyword arguments for an httpx call."""
+    kwargs = dict(kwargs)
+    timeout = kwargs.pop('timeout', None)
+    if isinstance(timeout, tuple):
+        kwargs['timeout'] = httpx.Timeout(timeout[1], connect=timeout[0])
+    elif timeout is not None:
+        kwargs['timeout'] = timeout
+    return kwargs
+
+
+class ProviderSessions:
+    """Per-provider pooled HTTP sessions with timeouts and reuse metrics."""
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE,
+                 connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout: float = DEFAULT_READ_TIMEOUT,
+                 http2: bool = True, max_threads: int = DEFAULT_MAX_THREADS):
+        self.pool_size = pool_size
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self.http2 = http2 and httpx is not None
+        self.max_threads = max_threads
+        self._sessions: Dict[str, Any] = {}
+        self._async_clients: Dict[str, Any] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats: Dict[str, ProviderStats] = {}
+        self._lock = threading.Lock()
+
+    # -- sessions -------------------------------------------------------
+
+    def _new_session(self) -> Any:
+        if self.http2:
+            return httpx.Client(
+                http2=True,
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size),
+            )
+        session = requests.Session()
+        # No urllib3 retries: a POST to an LLM is not idempotent (it bills)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size,
+                              max_retries=0, pool_block=False)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def session(self, provider: str) -> Any:
+        """The shared session for ``provider`` (created on first use)."""
+        session = self._sessions.get(provider)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(provider)
+                if session is None:
+                    session = self._new_session()
+                    self._sessions[provider] = session
+                    self._stats[provider] = ProviderStats()
+        return session
+
+    # -- requests -------------------------------------------------------
+
+    def post(self, provider: str, url: str, **kwargs: Any) -> Any:
+        """POST through the provider's pooled session.
+
+        Raises ``requests.RequestException`` subclasses on network errors
+        and timeouts, whichever transport is in use.
+        """
+        session = self.session(provider)
+        stats = self._stats[provider]
+        started = time.perf_counter()
+        try:
+            if self.http2:
+                response = self._post_httpx(session, url, **kwargs)
+            else:
+                kwargs.setdefault('timeout', self.timeout)
+                response = session.post(url, **kwargs)
+        except requests.RequestException as e:
+            self._record_error(stats, e)
+            raise
+        self._record(stats, response, time.perf_counter() - started)
+        return response
+
+    async def apost(self, provider: str, url: str, **kwargs: Any) -> Any:
+        """Coroutine form of post(), for callers on an event loop."""
+        if httpx is None:
+            if self._executor is None:
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.max_threads, thread_name_prefix='llm-http')
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(self.post, provider, url, **kwargs))
+
+        self.session(provider)  # registers stats
+        stats = self._stats[provider]
+        client = self._async_clients.get(provider)
+        if client is None:
+            client = self._async_clients[provider] = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+                limits=httpx.Limits(max_connections=self.pool_size,
+                                    max_keepalive_connections=self.pool_size),
+            )
+        started = time.perf_counter()
+        try:
+            with _httpx_errors():
+                response = await client.post(url, **_httpx_kwargs(kwargs))
+        except requests.RequestException as e:
+            self._record_error(stats, e)
+            raise
+        self._record(stats, response, time.perf_counter() - started)
+        return response
+
+    @contextlib.contextmanager
+    def stream(self, provider: str, url: str, **kwargs: Any) -> Iterator['StreamedResponse']:
+        """POST and read the body incrementally (for provider streaming APIs).
+
+        Use as ``with sessions.stream(...) as response: for line in
+        response.lines(): ...``. The connection goes back to the pool when
+        the block exits. Errors are ``requests`` exceptions, as in post().
+        """
+        session = self.session(provider)
+        stats = self._stats[provider]
+        started = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            try:
+                with _httpx_errors():
+                    if self.http2:
+                        response = stack.enter_context(
+                            session.stream('POST', url, **_httpx_kwargs(kwargs)))
+                    else:
+                        kwargs.setdefault('timeout', self.timeout)
+                        response = stack.enter_context(session.post(url, stream=True, **kwargs))
+            except requests.RequestException as e:
+                self._record_error(stats, e)
+                raise
+            self._record(stats, response, time.perf_counter() - started)
+            yield StreamedResponse(response, self.http2)
+
+    def _record(self, stats: ProviderStats, response: Any, elapsed: float) -> None:
+        version = self._http_version(response)
+        with self._lock:
+            stats.requests += 1
+            stats.seconds += elapsed
+            stats.http_versions[version] = stats.http_versions.get(version, 0) + 1
+            if self.http2:
+                stream = response.extensions.get('network_stream')
+                if stream is not None:
+                    stats._connections.add(id(stream))
+
+    def _record_error(self, stats: ProviderStats, error: Exception) -> None:
+        with self._lock:
+            stats.requests += 1
+            stats.errors += 1
+            if isinstance(error, requests.Timeout):
+                stats.timeouts += 1
+
+    def _post_httpx(self, client: Any, url: str, **kwargs: Any) -> Any:
+        with _httpx_errors():
+            return client.post(url, **_httpx_kwargs(kwargs))
+
+    @staticmethod
+    def _http_version(response: Any) -> str:
+        version = getattr(response, 'http_version', None)  # httpx
+        if version:
+            return version
+        raw = getattr(response, 'raw', None)  # urllib3: 11 / 20
+        code = getattr(raw, 'version', None)
+        return f'HTTP/{code // 10}.{code % 10}' if isinstance(code, int) else 'unknown'
+
+    # -- metrics --------------------------------------------------------
+
+    def _connection_counts(self, provider: str) -> Tuple[Optional[int], Optional[int]]:
+        """(connections opened, requests sent) as seen by the transport."""
+        session = self._sessions[provider]
+        if self.http2:
+            return len(self._stats[provider]._connections), None
+        opened = sent = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+                    sent += pool.num_requests
+        return opened, sent
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-provider request and connection-reuse counters."""
+        providers = {}
+        with self._lock:
+            names = list(self._stats)
+        for name in names:
+            s = self._stats[name]
+            opened, sent = self._connection_counts(name)
+            sent = sent if sent is not None else s.requests
+            reused = max(sent - opened, 0) if opened is not None else None
+            providers[name] = {
+                'requests': s.requests,
+                'errors': s.errors,
+                'timeouts': s.timeouts,
+                'connections_opened': opened,
+                'connections_reused': reused,
+                'reuse_ratio': round(reused / sent, 3) if sent and reused is not None else None,
+                'avg_seconds': round(s.seconds / (s.requests - s.errors), 3)
+                               if s.requests > s.errors else None,
+                'http_versions': dict(s.http_versions),
+            }
+        return {
+            'transport': 'httpx-h2' if self.http2 else 'requests',
+            'pool_size': self.pool_size,
+            'connect_timeout': self.timeout[0],
+            'read_timeout': self.timeout[1],
+            'providers': providers,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._async_clients.clear()  # bound to the gateway's loop
+            self._stats.clear()
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
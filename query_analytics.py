@@ -0,0 +1,313 @@
+"""
+Hourly rollups of the user query log.
+
+The log (see query_log.py) is read as a generator pipeline, so memory is
+bounded by the number of hours covered, not by the size of the log:
+
+    log_segments()      rotated segments, oldest first, then the live file
+    read_lines()        raw lines of one segment (gzip or plain) from an offset
+    parse_entries()     decoded entries, malformed lines skipped
+    rollup_entries()    entries folded into one HourRollup per local hour
+
+An HourRollup counts queries per ``detected_category``, ``mode``,
+``provider`` and ``model``, and keeps a latency histogram for entries that
+carry ``latency_ms`` (percentiles are reported as bucket upper bounds, or
+as ``">60000"`` when they fall beyond the last bound).
+
+RollupStore persists the rollups as one compact JSON file per day under
+``logs/rollups/`` and remembers what it has read: finished segments by
+name, and the byte offset reached in the live file. ``update()`` only reads
+new lines. When the live file is rotated, its segment is recognized by its
+first line and resumed from the saved offset, so no entry is counted twice.
+"""
+
+import bisect
+import glob
+import gzip
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from catalog_snapshot import atomic_write_bytes
+
+DIMENSIONS = ('detected_category', 'mode', 'provider', 'model')
+
+# Latency histogram bucket upper bounds (ms); one more bucket for slower
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2000, 5000, 10000, 20000, 60000)
+
+# Reported for a percentile in the overflow bucket, which has no upper bound
+LATENCY_OVERFLOW = f'>{LATENCY_BUCKETS_MS[-1]}'
+
+PERCENTILES = (50, 95, 99)
+
+_SEGMENT = re.compile(r'-(\d{4}-\d{2}-\d{2})\.(\d+)\.')
+
+
+def _hour(timestamp: float) -> str:
+    return time.strftime('%Y-%m-%dT%H', time.localtime(timestamp))
+
+
+# -- reading ------------------------------------------------------------
+
+
+def log_segments(log_path: str) -> List[str]:
+    """Rotated segments of ``log_path`` (oldest first), then the live file.
+
+    A segment being compressed exists both plain and gzipped for a moment;
+    the plain file is the complete one.
+    """
+    root, ext = os.path.splitext(log_path)
+    found: Dict[str, str] = {}
+    for path in glob.glob(glob.escape(root) + '-*' + ext) + glob.glob(glob.escape(root) + '-*' + ext + '.gz'):
+        name = segment_name(path)
+        if _SEGMENT.search(name) and (name not in found or not path.endswith('.gz')):
+            found[name] = path
+
+    def order(name: str) -> Tuple[str, int]:
+        day, n = _SEGMENT.search(name).groups()
+        return day, int(n)
+
+    segments = [found[name] for name in sorted(found, key=order)]
+    if os.path.exists(log_path):
+        segments.append(log_path)
+    return segments
+
+
+def segment_name(path: str) -> str:
+    """File name without the .gz suffix (same for a segment before and after compression)."""
+    name = os.path.basename(path)
+    return name[:-3] if name.endswith('.gz') else name
+
+
+def read_lines(path: str, offset: int = 0) -> Iterator[bytes]:
+    """Complete lines of ``path`` after ``offset`` (bytes of the uncompressed
+    text). A last line still being written is left for the next read."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        if offset:
+            f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                return
+            yield line
+
+
+def parse_entries(lines: Iterable[bytes]) -> Iterator[Dict[str, Any]]:
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if isinstance(entry, dict) and isinstance(entry.get('timestamp'), (int, float)):
+            yield entry
+
+
+class HourRollup:
+    """Counts for one hour of queries."""
+
+    __slots__ = ('count', 'dimensions', 'latency')
+
+    def __init__(self):
+        self.count = 0
+        self.dimensions: Dict[str, Dict[str, int]] = {d: {} for d in DIMENSIONS}
+        self.latency = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        self.count += 1
+        for dimension, counts in self.dimensions.items():
+            value = entry.get(dimension)
+            key = 'unknown' if value is None else str(value)
+            counts[key] = counts.get(key, 0) + 1
+        latency = entry.get('latency_ms')
+        if isinstance(latency, (int, float)):
+            self.latency[bisect.bisect_left(LATENCY_BUCKETS_MS, latency)] += 1
+
+    def merge(self, other: 'HourRollup') -> None:
+        self.count += other.count
+        for dimension, counts in other.dimensions.items():
+            mine = self.dimensions.setdefault(dimension, {})
+            for key, n in counts.items():
+                mine[key] = mine.get(key, 0) + n
+        self.latency = [a + b for a, b in zip(self.latency, other.latency)]
+
+    def latency_percentiles(self) -> Dict[str, Any]:
+        """{'count', 'p50', 'p95', 'p99'}; None where nothing was recorded,
+        LATENCY_OVERFLOW above the last bucket bound."""
+        total = sum(self.latency)
+        out: Dict[str, Any] = {'count': total}
+        for p in PERCENTILES:
+            out[f'p{p}'] = None
+            if total:
+                seen = 0
+                for i, n in enumerate(self.latency):
+                    seen += n
+                    if seen >= total * p / 100:
+                        out[f'p{p}'] = LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) \
+                            else LATENCY_OVERFLOW
+                        break
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {'count': self.count}
+        out.update(self.dimensions)
+        if any(self.latency):
+            out['latency'] = self.latency
+        return out
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HourRollup':
+        rollup = cls()
+        rollup.count = data.get('count', 0)
+        for dimension in DIMENSIONS:
+            rollup.dimensions[dimension] = dict(data.get(dimension) or {})
+        latency = data.get('latency')
+        if latency and len(latency) == len(rollup.latency):
+            rollup.latency = list(latency)
+        return rollup
+
+
+def rollup_entries(entries: Iterable[Dict[str, Any]],
+                   hours: Optional[Dict[str, HourRollup]] = None) -> Dict[str, HourRollup]:
+    """Fold ``entries`` into ``hours`` (hour -> HourRollup)."""
+    if hours is None:
+        hours = {}
+    for entry in entries:
+        hour = _hour(entry['timestamp'])
+        rollup = hours.get(hour)
+        if rollup is None:
+            rollup = hours[hour] = HourRollup()
+        rollup.add(entry)
+    return hours
+
+
+def _head(path: str) -> str:
+    """Fingerprint of the first line of a segment ('' if it has none yet)."""
+    for line in read_lines(path):
+        return hashlib.sha1(line).hexdigest()[:16]
+    return ''
+
+
+# -- persisted rollups --------------------------------------------------
+
+
+class RollupStore:
+    """Incrementally maintained hourly rollups of one query log."""
+
+    def __init__(self, log_path: str, rollup_dir: Optional[str] = None):
+        self.log_path = log_path
+        self.rollup_dir = rollup_dir or os.path.join(os.path.dirname(log_path) or '.', 'rollups')
+        self.state_path = os.path.join(self.rollup_dir, 'state.json')
+        self._lock = threading.Lock()
+
+    def _read_json(self, path: str, default: Any) -> Any:
+        try:
+            with open(path, 'rb') as f:
+                return json.loads(f.read())
+        except (OSError, ValueError):
+            return default
+
+    def _write_json(self, path: str, data: Any) -> None:
+        atomic_write_bytes(path, json.dumps(data, separators=(',', ':'), sort_keys=True).encode('utf-8'))
+
+    def _day_path(self, day: str) -> str:
+        return os.path.join(self.rollup_dir, f'{day}.json')
+
+    def update(self) -> Dict[str, int]:
+        """Read what was logged since the last update into the day files."""
+        with self._lock:
+            state = self._read_json(self.state_path, {})
+            done = set(state.get('segments', ()))
+            live_head = state.get('live_head', '')
+            live_offset = state.get('live_offset', 0)
+            hours: Dict[str, HourRollup] = {}
+
+            def consume(path: str, offset: int) -> int:
+                """Roll up ``path`` from ``offset``; returns the offset reached."""
+                position = [offset]
+
+                def tracked(lines: Iterable[bytes]) -> Iterator[bytes]:
+                    for line in lines:
+                        position[0] += len(line)
+                        yield line
+
+                rollup_entries(parse_entries(tracked(read_lines(path, offset))), hours)
+                return position[0]
+
+            for path in log_segments(self.log_path):
+                if path == self.log_path:
+                    head = _head(path)
+                    if head != live_head:  # a new live file
+                        live_head, live_offset = head, 0
+                    live_offset = consume(path, live_offset)
+                    continue
+                name = segment_name(path)
+                if name in done:
+                    continue
+                # The live file we were reading, now rotated: resume where we stopped
+                offset = live_offset if live_head and _head(path) == live_head else 0
+                if offset:
+                    live_head, live_offset = '', 0
+                consume(path, offset)
+                done.add(name)
+
+            entries = sum(rollup.count for rollup in hours.values())
+            if hours:
+                os.makedirs(self.rollup_dir, exist_ok=True)
+                by_day: Dict[str, Dict[str, HourRollup]] = {}
+                for hour, rollup in hours.items():
+                    by_day.setdefault(hour[:10], {})[hour] = rollup
+                for day, day_hours in by_day.items():
+                    saved = self._read_json(self._day_path(day), {})
+                    for hour, rollup in day_hours.items():
+                        if hour in saved:
+                            rollup.merge(HourRollup.from_dict(saved[hour]))
+                        saved[hour] = rollup.to_dict()
+                    self._write_json(self._day_path(day), saved)
+            new_state = {'segments': sorted(done), 'live_head': live_head, 'live_offset': live_offset}
+            if new_state != state:
+                os.makedirs(self.rollup_dir, exist_ok=True)
+                self._write_json(self.state_path, new_state)
+            return {'entries': entries, 'hours': len(hours)}
+
+    def rebuild(self) -> Dict[str, int]:
+        """Drop the saved rollups and read the whole log again."""
+        with self._lock:
+            for path in glob.glob(os.path.join(glob.escape(self.rollup_dir), '*.json')):
+                os.remove(path)
+        return self.update()
+
+    def hours(self, since: float, until: Optional[float] = None) -> Dict[str, HourRollup]:
+        """Saved rollups for the hours from ``since`` to ``until`` (timestamps)."""
+        until = time.time() if until is None else until
+        first, last = _hour(since), _hour(until)
+        days = {_hour(t)[:10] for t in range(int(since), int(until), 3600)} | {last[:10]}
+        out: Dict[str, HourRollup] = {}
+        for day in sorted(days):
+            for hour, data in self._read_json(self._day_path(day), {}).items():
+                if first <= hour <= last:
+                    out[hour] = HourRollup.from_dict(data)
+        return out
+
+    def summary(self, hours: int = 24, top: int = 10, now: Optional[float] = None,
+                update: bool = True) -> Dict[str, Any]:
+        """Totals over the last ``hours`` hours, the ``top`` values per
+        dimension, latency percentiles and the count per hour."""
+        if update:
+            self.update()
+        now = time.time() if now is None else now
+        rollups = self.hours(now - (hours - 1) * 3600, now)
+        total = HourRollup()
+        for rollup in rollups.values():
+            total.merge(rollup)
+        out: Dict[str, Any] = {'from': _hour(now - (hours - 1) * 3600), 'to': _hour(now),
+                               'count': total.count}
+        for dimension in DIMENSIONS:
+            counts = total.dimensions[dimension]
+            out[dimension] = sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:top]
+        out['latency_ms'] = total.latency_percentiles()
+        out['hourly'] = [{'hour': hour, 'count': rollups[hour].count} for hour in sorted(rollups)]
+        return out
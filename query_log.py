@@ -0,0 +1,204 @@
+"""
+Background writer for the user query log (``logs/user_queries.jsonl``).
+
+Request handlers only put the entry on a bounded queue (``log()``); a
+writer thread serializes entries, writes them in batches and flushes when a
+batch reaches ``batch_size`` lines or its oldest line is ``flush_interval``
+seconds old. When the queue is full the entry is dropped and counted, so
+logging never blocks a request.
+
+The live file is rotated when it reaches ``max_bytes`` or when the day
+changes. Rotated segments are named after the day they cover and gzipped
+by the writer thread:
+
+    logs/user_queries.jsonl                      (live)
+    logs/user_queries-2026-10-16.1.jsonl.gz
+    logs/user_queries-2026-10-17.1.jsonl.gz
+    logs/user_queries-2026-10-17.2.jsonl.gz
+"""
+
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_QUEUE = 10000
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 1.0
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+_STOP = object()
+
+
+def _day(timestamp: Optional[float] = None) -> str:
+    return time.strftime('%Y-%m-%d', time.localtime(timestamp))
+
+
+def rotated_path(path: str, day: str, n: int, compressed: bool = True) -> str:
+    """logs/user_queries.jsonl -> logs/user_queries-<day>.<n>.jsonl(.gz)"""
+    root, ext = os.path.splitext(path)
+    return f'{root}-{day}.{n}{ext}' + ('.gz' if compressed else '')
+
+
+class QueryLogWriter:
+    """Bounded queue + writer thread appending JSON lines to ``path``."""
+
+    def __init__(self, path: str, max_queue: int = DEFAULT_MAX_QUEUE,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_bytes: int = DEFAULT_MAX_BYTES, compress: bool = True):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self._queue: 'queue.Queue[Any]' = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._exit_hook = False
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._file_day = ''
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self.errors = 0
+
+    # -- request side ---------------------------------------------------
+
+    def log(self, entry: Dict[str, Any]) -> bool:
+        """Queue ``entry``; False (and counted) if the queue is full."""
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until everything queued so far is written."""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write what is queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='query-log', daemon=True)
+                thread.start()
+                self._thread = thread
+                if not self._exit_hook:
+                    atexit.register(self.close)
+                    self._exit_hook = True
+
+    # -- writer thread --------------------------------------------------
+
+    def _run(self) -> None:
+        lines: List[bytes] = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if lines else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # the oldest buffered line is due
+            if isinstance(item, dict):
+                try:
+                    lines.append(json.dumps(item).encode('utf-8') + b'\n')
+                except (TypeError, ValueError) as e:
+                    self.errors += 1
+                    logger.error('Unserializable query log entry: %s', e)
+                if len(lines) == 1:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(lines) < self.batch_size:
+                    continue
+            if lines:
+                self._write(lines)
+                lines = []
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                self._close_file()
+                return
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.path, 'ab')
+        stat = os.fstat(self._file.fileno())
+        self._size = stat.st_size
+        # A file left by a previous process belongs to the day it was last written
+        self._file_day = _day(stat.st_mtime) if stat.st_size else _day()
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, lines: List[bytes]) -> None:
+        data = b''.join(lines)
+        try:
+            if self._file is None:
+                self._open()
+            if self._size and (_day() != self._file_day or self._size + len(data) > self.max_bytes):
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+            self.written += len(lines)
+            self.batches += 1
+        except OSError as e:
+            self.errors += 1
+            self.dropped += len(lines)
+            logger.error('Failed to write query log: %s', e)
+            self._close_file()
+
+    def _rotate(self) -> None:
+        self._close_file()
+        n = 1
+        while (os.path.exists(rotated_path(self.path, self._file_day, n))
+               or os.path.exists(rotated_path(self.path, self._file_day, n, compressed=False))):
+            n += 1
+        target = rotated_path(self.path, self._file_day, n, compressed=False)
+        os.replace(self.path, target)
+        self.rotations += 1
+        if self.compress:
+            with open(target, 'rb') as src, gzip.open(target + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(target)
+        self._open()
+
+    # -- metrics --------------------------------------------------------
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'rotations': self.rotations,
+            'errors': self.errors,
+        }
@@ -1,6 +1,7 @@
-import json
 import os
 
+from catalog_writer import CatalogWriter
+
 file_path = '/Users/jasonjenkins/Desktop/alpha/toxico/data/catalog.json'
 ids_to_remove = [
     'printify-6929b4c9e07f035cf5020be6',
@@ -12,16 +13,12 @@ ids_to_remove = [
 ]
 
 try:
-    with open(file_path, 'r') as f:
-        data = json.load(f)
-
-    original_count = len(data['products'])
-    data['products'] = [p for p in data['products'] if p['id'] not in ids_to_remove]
-    new_count = len(data['products'])
-    removed_count = original_count - new_count
-
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=2)
+    with CatalogWriter(file_path) as catalog:
+        original_count = len(catalog.products)
+        catalog.delete(ids_to_remove)
+        new_count = len(catalog.products)
+        removed_count = original_count - new_count
+        catalog.commit(compact=True)
 
     print(f"Successfully removed {removed_count} items.")
     print(f"Original count: {original_count}")
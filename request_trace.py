@@ -0,0 +1,169 @@
+"""
+Lightweight per-request tracing.
+
+A Trace collects spans (stage, seconds, provider) for one request. Code
+marks a stage with ``with span('catalog'):``, which times the block into
+the current request's trace. The trace lives in a context variable, so a
+span outside a traced request costs one lookup and records nothing. LLM
+gateway calls run in the caller's context, so spans inside provider
+coroutines land in the right trace too.
+
+When a request ends, its spans go out in a ``Server-Timing`` header and
+into a TraceRecorder. The recorder is a ring buffer of recent spans that
+reports p50/p95/p99 per endpoint, stage and provider, in Prometheus text
+format. The summary's ``_sum`` and ``_count`` come from cumulative
+counters, not the ring buffer, so they never go down.
+"""
+
+import collections
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_BUFFER = 10000
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+STAGE_METRIC = 'valet_stage_seconds'
+REQUESTS_METRIC = 'valet_traced_requests_total'
+
+_current: 'contextvars.ContextVar[Optional[Trace]]' = contextvars.ContextVar('request_trace', default=None)
+
+
+class Trace:
+    """Spans of one request."""
+
+    __slots__ = ('endpoint', 'started', 'spans')
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, Optional[str]]] = []  # (stage, seconds, provider)
+
+    def add(self, stage: str, seconds: float, provider: Optional[str] = None) -> None:
+        self.spans.append((stage, seconds, provider))  # list.append is atomic
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """``Server-Timing`` header value; repeated stages are summed."""
+        durations: Dict[Tuple[str, Optional[str]], float] = {}
+        for stage, seconds, provider in list(self.spans):
+            durations[(stage, provider)] = durations.get((stage, provider), 0.0) + seconds
+        parts = [f'{stage};dur={seconds * 1000:.1f}' + (f';desc="{provider}"' if provider else '')
+                 for (stage, provider), seconds in durations.items()]
+        parts.append(f'total;dur={(self.elapsed() if total is None else total) * 1000:.1f}')
+        return ', '.join(parts)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def start_trace(endpoint: str) -> Tuple[Trace, contextvars.Token]:
+    """Make a new Trace current; pass the token to end_trace()."""
+    trace = Trace(endpoint)
+    return trace, _current.set(trace)
+
+
+def end_trace(token: contextvars.Token) -> None:
+    try:
+        _current.reset(token)
+    except ValueError:  # ended in another context than it started
+        _current.set(None)
+
+
+@contextlib.contextmanager
+def span(stage: str, provider: Optional[str] = None) -> Iterator[None]:
+    """Time the block as ``stage`` of the current request (no-op outside one)."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(stage, time.perf_counter() - started, provider)
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class TraceRecorder:
+    """Ring buffer of recent spans with latency percentiles, plus
+    cumulative seconds and span counts since start."""
+
+    def __init__(self, size: int = DEFAULT_BUFFER):
+        # (endpoint, stage, provider, seconds)
+        self._spans: Deque[Tuple[str, str, str, float]] = collections.deque(maxlen=size)
+        # (endpoint, stage, provider) -> [seconds, count], never reset
+        self._totals: Dict[Tuple[str, str, str], List[float]] = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _add(self, endpoint: str, stage: str, provider: str, seconds: float) -> None:
+        self._spans.append((endpoint, stage, provider, seconds))
+        total = self._totals.get((endpoint, stage, provider))
+        if total is None:
+            total = self._totals[(endpoint, stage, provider)] = [0.0, 0]
+        total[0] += seconds
+        total[1] += 1
+
+    def record(self, trace: Trace, total: Optional[float] = None) -> None:
+        """Add a finished request's spans, plus its total as stage 'total'."""
+        total = trace.elapsed() if total is None else total
+        with self._lock:
+            self.requests += 1
+            for stage, seconds, provider in list(trace.spans):
+                self._add(trace.endpoint, stage, provider or '', seconds)
+            self._add(trace.endpoint, 'total', '', total)
+
+    def percentiles(self) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+        """(endpoint, stage, provider) -> {'count', 'sum', 'p50', 'p95', 'p99'} in seconds."""
+        with self._lock:
+            spans = list(self._spans)
+        groups: Dict[Tuple[str, str, str], List[float]] = {}
+        for endpoint, stage, provider, seconds in spans:
+            groups.setdefault((endpoint, stage, provider), []).append(seconds)
+        out = {}
+        for key, values in sorted(groups.items()):
+            values.sort()
+            stats: Dict[str, Any] = {'count': len(values), 'sum': sum(values)}
+            for q in QUANTILES:
+                stats[f'p{int(q * 100)}'] = _percentile(values, q)
+            out[key] = stats
+        return out
+
+    def prometheus(self) -> str:
+        """A Prometheus summary (text exposition format): quantiles over the
+        most recent spans, ``_sum``/``_count`` cumulative since start."""
+        name = STAGE_METRIC
+        quantiles = self.percentiles()
+        with self._lock:
+            totals = {key: tuple(total) for key, total in self._totals.items()}
+        lines = [f'# HELP {name} Request stage latency (quantiles over the most recent spans).',
+                 f'# TYPE {name} summary']
+        for key, (seconds, count) in sorted(totals.items()):
+            endpoint, stage, provider = key
+            labels = f'endpoint="{_label(endpoint)}",stage="{_label(stage)}"'
+            if provider:
+                labels += f',provider="{_label(provider)}"'
+            stats = quantiles.get(key)
+            if stats is not None:
+                for q in QUANTILES:
+                    lines.append(f'{name}{{{labels},quantile="{q}"}} {stats[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{name}_sum{{{labels}}} {seconds:.6f}')
+            lines.append(f'{name}_count{{{labels}}} {count}')
+        lines.append(f'# HELP {REQUESTS_METRIC} Traced requests.')
+        lines.append(f'# TYPE {REQUESTS_METRIC} counter')
+        lines.append(f'{REQUESTS_METRIC} {self.requests}')
+        return '\n'.join(lines) + '\n'
@@ -4,9 +4,12 @@ Add placeholder product images from brand CDNs to catalog.json.
 These are publicly available product images from brand websites.
 """
 
-import json
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from catalog_writer import CatalogWriter
+
 CATALOG_PATH = Path(__file__).parent.parent / 'data' / 'catalog.json'
 
 # Known brand image patterns (publicly available product images)
@@ -69,24 +72,21 @@ BRAND_IMAGES = {
 def update_catalog():
     """Add brand images to catalog products."""
     
-    with open(CATALOG_PATH, 'r') as f:
-        catalog = json.load(f)
-    
-    updated = 0
-    
-    for product in catalog['products']:
-        product_id = product.get('id', '')
+    with CatalogWriter(str(CATALOG_PATH)) as catalog:
+        updated = 0
         
-        # Check if we have an image for this product
-        if product_id in BRAND_IMAGES:
-            if not product.get('image'):
-                product['image'] = BRAND_IMAGES[product_id]
-                print(f"✓ {product['name']}: added image")
-                updated += 1
-    
-    # Save updated catalog
-    with open(CATALOG_PATH, 'w') as f:
-        json.dump(catalog, f, indent=2)
+        for product in catalog.products:
+            product_id = product.get('id', '')
+            
+            # Check if we have an image for this product
+            if product_id in BRAND_IMAGES:
+                if not product.get('image'):
+                    catalog.patch(product_id, image=BRAND_IMAGES[product_id])
+                    print(f"✓ {product['name']}: added image")
+                    updated += 1
+        
+        # Save updated catalog
+        catalog.commit(compact=True)
     
     print(f"\n=== Updated {updated} products with brand images ===")
     print("\nNote: For production, you should:")
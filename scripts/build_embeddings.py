@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Build the product embedding matrix next to the catalog.
+
+Embeds every active product in data/catalog.json and writes
+data/catalog.embeddings.npz, which the server loads instead of embedding
+the catalog itself (see catalog_embeddings.py). Needs NumPy.
+
+Usage:
+  python3 scripts/build_embeddings.py [--catalog data/catalog.json] [--model all-MiniLM-L6-v2]
+
+Without --model (or VALET_EMBEDDING_MODEL) the hashed n-gram embedder is used.
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from catalog_embeddings import EmbeddingIndex, embeddings_path_for, local_embedder, numpy
+from catalog_store import CatalogStore
+
+CATALOG_PATH = Path(__file__).parent.parent / 'data' / 'catalog.json'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--catalog', default=str(CATALOG_PATH))
+    parser.add_argument('--model', default=os.getenv('VALET_EMBEDDING_MODEL', ''))
+    parser.add_argument('--dim', type=int, default=int(os.getenv('VALET_EMBEDDING_DIM', '512')))
+    args = parser.parse_args(argv)
+
+    if numpy is None:
+        print('NumPy is required to write the embedding matrix (pip install numpy)')
+        return 1
+    snapshot = CatalogStore(args.catalog, use_binary_snapshot=False).snapshot()
+    if snapshot is None:
+        print(f'No catalog at {args.catalog}')
+        return 1
+
+    embedder = local_embedder(args.model, dim=args.dim)
+    started = time.perf_counter()
+    index = EmbeddingIndex(snapshot.items, embedder, snapshot.digest)
+    path = embeddings_path_for(args.catalog)
+    index.save(path)
+    print(f'Embedded {len(index.items)} products with {embedder.name} '
+          f'in {time.perf_counter() - started:.2f}s -> {path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Summarize the user query log from its hourly rollups.
+
+Reads what was logged since the last run (rotated .gz segments included)
+into logs/rollups/, then prints query counts per category, mode, provider
+and model, and latency percentiles, for the last --hours hours.
+
+Usage:
+  python3 scripts/query_analytics.py [--hours 24] [--top 10] [--json] [--rebuild]
+
+--rebuild drops the saved rollups and rescans the whole log.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from query_analytics import DIMENSIONS, RollupStore
+
+LOG_PATH = Path(__file__).parent.parent / 'logs' / 'user_queries.jsonl'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--log', default=str(LOG_PATH))
+    parser.add_argument('--rollups', default=None, help='rollup directory (default: <log dir>/rollups)')
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    parser.add_argument('--rebuild', action='store_true')
+    args = parser.parse_args(argv)
+
+    store = RollupStore(args.log, args.rollups)
+    read = store.rebuild() if args.rebuild else store.update()
+    summary = store.summary(hours=args.hours, top=args.top, update=False)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return 0
+
+    print(f"{summary['count']} queries from {summary['from']}h to {summary['to']}h "
+          f"({read['entries']} new log entries read)")
+    for dimension in DIMENSIONS:
+        print(f'\n{dimension}:')
+        for value, count in summary[dimension]:
+            print(f'  {count:>8}  {value}')
+    latency = summary['latency_ms']
+    if latency['count']:
+        bound = {p: v if isinstance(v, str) else f'<= {v}'
+                 for p, v in latency.items() if p != 'count'}  # '>60000' past the last bucket
+        print(f"\nlatency (ms, bucket bounds): p50 {bound['p50']}  "
+              f"p95 {bound['p95']}  p99 {bound['p99']}  ({latency['count']} timed)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
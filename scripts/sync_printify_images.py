@@ -4,11 +4,15 @@ Fetch product images from Printify and update catalog.json.
 """
 
 import os
+import sys
 import json
 import requests
 from pathlib import Path
 from dotenv import load_dotenv
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from catalog_writer import CatalogWriter
+
 # Load environment
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(env_path)
@@ -73,42 +77,38 @@ def fetch_printify_products():
 def update_catalog_images(printify_products):
     """Update catalog.json with Printify images."""
     
-    # Load catalog
-    with open(CATALOG_PATH, 'r') as f:
-        catalog = json.load(f)
-    
-    updated = 0
-    
-    print("\n--- Matching Printify products to catalog ---\n")
-    
-    # Match Printify products to catalog by name similarity
-    for product in catalog['products']:
-        if product.get('source') in ('printify', 'internal'):
-            product_name = product.get('name', '').lower()
-            
-            for pp in printify_products:
-                pp_title = pp.get('title', '').lower()
-                
-                # Matching logic
-                name_words = [w for w in product_name.split() if len(w) > 3]
-                title_words = [w for w in pp_title.split() if len(w) > 3]
-                
-                # Check for word overlap
-                matches = sum(1 for w in name_words if w in pp_title)
+    with CatalogWriter(str(CATALOG_PATH)) as catalog:
+        updated = 0
+        
+        print("\n--- Matching Printify products to catalog ---\n")
+        
+        # Match Printify products to catalog by name similarity
+        for product in catalog.products:
+            if product.get('source') in ('printify', 'internal'):
+                product_name = product.get('name', '').lower()
                 
-                if matches >= 2 or product_name in pp_title or pp_title in product_name:
-                    if pp.get('image'):
-                        old_image = product.get('image')
-                        product['image'] = pp['image']
-                        if old_image != pp['image']:
-                            print(f"  ✓ {product['name']}")
-                            print(f"    -> {pp['image'][:60]}...")
-                            updated += 1
-                        break
-    
-    # Save updated catalog
-    with open(CATALOG_PATH, 'w') as f:
-        json.dump(catalog, f, indent=2)
+                for pp in printify_products:
+                    pp_title = pp.get('title', '').lower()
+                    
+                    # Matching logic
+                    name_words = [w for w in product_name.split() if len(w) > 3]
+                    title_words = [w for w in pp_title.split() if len(w) > 3]
+                    
+                    # Check for word overlap
+                    matches = sum(1 for w in name_words if w in pp_title)
+                    
+                    if matches >= 2 or product_name in pp_title or pp_title in product_name:
+                        if pp.get('image'):
+                            old_image = product.get('image')
+                            if old_image != pp['image']:
+                                catalog.patch(product['id'], image=pp['image'])
+                                print(f"  ✓ {product['name']}")
+                                print(f"    -> {pp['image'][:60]}...")
+                                updated += 1
+                            break
+        
+        # Save updated catalog
+        catalog.commit(compact=True)
     
     print(f"\n=== Updated {updated} products with Printify images ===")
     return updated
@@ -16,7 +16,7 @@ Development-only token storage: spotify_tokens.json in repo root.
 
 Requires: Flask, requests, python-dotenv, flask-cors, spotipy
 """
-from flask import Flask, redirect, request, session, jsonify, url_for, send_from_directory
+from flask import Flask, g, redirect, request, session, jsonify, url_for, send_from_directory, stream_with_context
 from flask_cors import CORS
 import requests
 import os
@@ -29,6 +29,24 @@ from urllib.parse import urlencode
 from dotenv import load_dotenv
 import subprocess
 import time
+import random
+import re
+import queue
+import threading
+from catalog_embeddings import embeddings_for, embeddings_path_for, local_embedder
+from catalog_store import CatalogStore, ResponseCache, decode_cursor, encode_cursor, project
+from llm_gateway import GatewayOverloaded, LLMGateway, parse_limits
+from llm_health import ProviderHealth, is_failure_status
+from llm_http import ProviderSessions
+from query_analytics import RollupStore
+from query_log import QueryLogWriter
+from request_trace import TraceRecorder, current_trace, end_trace, span, start_trace
+from token_ledger import TokenLedger
+from valet_cache import ValetResponseCache, cache_key as valet_cache_key
+from valet_grounding import grounder_for
+from valet_json import ANSWER_SCHEMA, extract_json, validate_answer
+from valet_prompts import prompts_for
+from valet_stream import ValetStreamParser, answer_events, sse_event
 
 # Load .env if present
 load_dotenv()
@@ -262,21 +280,105 @@ def serve_used_file(filename):
     else:
         return 'File not found', 404
 
+# ==========================================
+# Request tracing
+# ==========================================
+
+# Stage timings of recent /api/ requests (see request_trace.py)
+TRACE_RECORDER = TraceRecorder(size=int(os.getenv('TRACE_BUFFER', '10000')))
+# Return each traced request's stage timings in a Server-Timing header
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1') in ('1', 'true', 'True')
+
+@app.before_request
+def start_request_trace():
+    if request.path.startswith('/api/'):
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.trace, g.trace_token = start_trace(endpoint)
+
+@app.after_request
+def finish_request_trace(response):
+    """Record the request's spans; streamed bodies are timed up to the first byte"""
+    trace = g.pop('trace', None)
+    if trace is not None:
+        total = trace.elapsed()
+        TRACE_RECORDER.record(trace, total)
+        if SERVER_TIMING:
+            response.headers['Server-Timing'] = trace.server_timing(total)
+    return response
+
+@app.teardown_request
+def end_request_trace(exc):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        end_trace(token)
+
+@app.route('/metrics')
+def metrics():
+    """p50/p95/p99 per endpoint, stage and provider (Prometheus text format)"""
+    return app.response_class(TRACE_RECORDER.prometheus(), mimetype='text/plain; version=0.0.4')
+
 # ==========================================
 # Product Catalog API
 # ==========================================
 
 CATALOG_PATH = os.path.join(os.path.dirname(__file__), 'data', 'catalog.json')
 
+# Parsed once per process; re-read only when the file's mtime/inode changes.
+# Cold starts load the compiled data/catalog.snapshot when it is up to date.
+CATALOG_STORE = CatalogStore(
+    CATALOG_PATH, check_interval=float(os.getenv('CATALOG_CHECK_INTERVAL', '1.0')),
+    use_binary_snapshot=os.getenv('CATALOG_BINARY_SNAPSHOT', '1') not in ('0', 'false', 'False'))
+
+# Local product embeddings for offers and product-mode retrieval; the matrix
+# is kept next to the catalog (data/catalog.embeddings.npz) when NumPy is installed
+CATALOG_EMBEDDER = local_embedder(os.getenv('VALET_EMBEDDING_MODEL', ''),
+                                  dim=int(os.getenv('VALET_EMBEDDING_DIM', '512')))
+CATALOG_EMBEDDINGS_PATH = embeddings_path_for(CATALOG_PATH) if CATALOG_STORE.snapshot_path else None
+
+def catalog_embeddings(snapshot):
+    """EmbeddingIndex for a catalog snapshot (built once per catalog version)"""
+    return embeddings_for(snapshot, CATALOG_EMBEDDER, CATALOG_EMBEDDINGS_PATH)
+
+# Shared secret for admin endpoints (unset = admin endpoints refuse every call)
+VALET_ADMIN_TOKEN = os.getenv('VALET_ADMIN_TOKEN') or ''
+
 def load_product_catalog():
-    """Load the product catalog from JSON file"""
-    try:
-        if os.path.exists(CATALOG_PATH):
-            with open(CATALOG_PATH, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        app.logger.error(f'Failed to load catalog: {e}')
-    return None
+    """Return the current (read-only) catalog snapshot, or None if unavailable"""
+    snapshot = CATALOG_STORE.snapshot()
+    return snapshot.data if snapshot else None
+
+# Encoded JSON for catalog GET endpoints, keyed on path + normalized query
+RESPONSE_CACHE = ResponseCache(max_entries=int(os.getenv('RESPONSE_CACHE_SIZE', '256')))
+
+def cached_json_response(snapshot, build_payload):
+    """Serve build_payload() as JSON, reusing encoded bytes for repeat queries.
+    
+    The cache is scoped to the catalog digest, so it empties itself on reload.
+    Responses carry a strong ETag; a matching If-None-Match gets a 304.
+    """
+    key = (request.path, tuple(sorted(request.args.items(multi=True))))
+    entry = RESPONSE_CACHE.get(key, snapshot.digest)
+    cache_status = 'HIT'
+    if entry is None:
+        cache_status = 'MISS'
+        with span('payload'):
+            payload = build_payload()
+        with span('encode'):
+            body = (app.json.dumps(payload) + '\n').encode('utf-8')
+        entry = RESPONSE_CACHE.put(key, snapshot.digest, body)
+    
+    if request.if_none_match.contains(entry.etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Cache'] = cache_status
+    return response
+
+# Upper bound for ?limit= on paginated catalog listings
+CATALOG_MAX_PAGE_SIZE = 200
+CATALOG_BLOCKS = ('meta', 'vibes', 'activities')
 
 @app.route('/api/valet/catalog')
 def api_valet_catalog():
@@ -287,40 +389,124 @@ def api_valet_catalog():
     - category: filter by category
     - vibes: filter by vibes (comma-separated)
     - active_only: only return active products (default: true)
+    - limit: page size (max 200); pages are ordered by product id
+    - cursor: next_cursor from the previous page
+    - fields: comma-separated product keys to return (id is always included)
+    - include: comma-separated blocks to return from meta,vibes,activities
+      (default: all; empty value omits them)
     """
-    catalog = load_product_catalog()
-    if not catalog:
+    with span('catalog'):
+        snapshot = CATALOG_STORE.snapshot()
+    if not snapshot:
         return jsonify({'error': 'Catalog not found', 'products': []}), 200
+    catalog = snapshot.data
     
-    products = catalog.get('products', [])
-    
-    # Filters
-    site = request.args.get('site', 'all')
-    category = request.args.get('category')
-    vibes = request.args.get('vibes')
-    active_only = request.args.get('active_only', 'true').lower() == 'true'
-    
-    # Apply filters
-    if active_only:
-        products = [p for p in products if p.get('active', True)]
-    
-    if site and site != 'all':
-        products = [p for p in products if site in p.get('sites', [])]
+    # Validate paging params up front so errors are never cached
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    try:
+        if limit is not None:
+            limit = int(limit)
+            if not 1 <= limit <= CATALOG_MAX_PAGE_SIZE:
+                raise ValueError
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        return jsonify({'error': f'limit must be 1-{CATALOG_MAX_PAGE_SIZE} and cursor must come from next_cursor'}), 400
+    if after and limit is None:
+        limit = CATALOG_MAX_PAGE_SIZE
+    
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else None
+    include = request.args.get('include')
+    include = CATALOG_BLOCKS if include is None else [b.strip() for b in include.split(',')]
+    
+    def build_payload():
+        # Filters
+        site = request.args.get('site', 'all')
+        category = request.args.get('category')
+        vibes = request.args.get('vibes')
+        active_only = request.args.get('active_only', 'true').lower() == 'true'
+        
+        # Resolve filters by bitmap intersection over the snapshot's indexes
+        mask = snapshot.index.filter_mask(
+            active_only=active_only,
+            site=site if site and site != 'all' else None,
+            category=category,
+            vibe=[v.strip() for v in vibes.split(',')] if vibes else None,
+        )
+        
+        payload = {}
+        if limit is None:
+            products = snapshot.index.select(mask)
+        else:
+            products, next_key = snapshot.index.page(mask, limit, after)
+            payload['total'] = bin(mask).count('1')
+            payload['next_cursor'] = encode_cursor(next_key) if next_key else None
+        if fields:
+            products = [project(p, fields) for p in products]
+        
+        payload['products'] = products
+        payload['count'] = len(products)
+        payload['version'] = snapshot.version
+        for block in CATALOG_BLOCKS:
+            if block in include:
+                payload[block] = catalog.get(block, {})
+        return payload
     
-    if category:
-        products = [p for p in products if p.get('category') == category]
+    return cached_json_response(snapshot, build_payload)
+
+# Upper bound for ?limit= on the catalog change feed
+CATALOG_CHANGES_MAX = 1000
+
+@app.route('/api/valet/catalog/changes')
+def api_valet_catalog_changes():
+    """Catalog mutations since a known version, for incremental sync
     
-    if vibes:
-        vibe_list = [v.strip() for v in vibes.split(',')]
-        products = [p for p in products if any(v in p.get('vibes', []) for v in vibe_list)]
+    Query params:
+    - since: catalog version the client already has (from /api/valet/catalog
+      or a previous call); default 0
+    - limit: max changes to return (default and max 1000)
+    
+    Each change is {op, id, version, ts} plus `product` (upsert) or
+    `fields` (patch); ops are upsert, delete, patch, activate, deactivate.
+    Follow `has_more` by calling again with since=<last change version>.
+    `reset: true` means the retained history does not reach back to
+    `since`; refetch /api/valet/catalog instead.
+    """
+    with span('catalog'):
+        snapshot = CATALOG_STORE.snapshot()
+    if not snapshot:
+        return jsonify({'error': 'Catalog not found'}), 404
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', CATALOG_CHANGES_MAX))
+        if since < 0 or not 1 <= limit <= CATALOG_CHANGES_MAX:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'since must be a version >= 0 and limit 1-{CATALOG_CHANGES_MAX}'}), 400
+    
+    def build_payload():
+        changes, has_more, reset = snapshot.changes_since(since, limit)
+        return {
+            'since': since,
+            'version': snapshot.version,
+            'changes': changes,
+            'count': len(changes),
+            'has_more': has_more,
+            'reset': reset,
+        }
     
-    return jsonify({
-        'products': products,
-        'count': len(products),
-        'meta': catalog.get('meta', {}),
-        'vibes': catalog.get('vibes', {}),
-        'activities': catalog.get('activities', {})
-    })
+    return cached_json_response(snapshot, build_payload)
+
+@app.route('/api/valet/catalog/reload', methods=['POST'])
+def api_valet_catalog_reload():
+    """Force the in-memory catalog to re-read data/catalog.json"""
+    if not VALET_ADMIN_TOKEN:
+        return jsonify({'error': 'Admin endpoints are disabled (set VALET_ADMIN_TOKEN)'}), 403
+    if request.headers.get('X-Admin-Token') != VALET_ADMIN_TOKEN:
+        return jsonify({'error': 'Unauthorized'}), 401
+    CATALOG_STORE.reload()
+    return jsonify(CATALOG_STORE.status())
 
 # Spotify OAuth Routes
 
@@ -1160,13 +1346,25 @@ def format_duration(ms):
     seconds = seconds % 60
     return f"{minutes}:{seconds:02d}"
 
+# User query log, written in batches by a background thread (see query_log.py)
+QUERY_LOG = QueryLogWriter(
+    os.path.join(os.path.dirname(__file__), 'logs', 'user_queries.jsonl'),
+    max_queue=int(os.getenv('QUERY_LOG_QUEUE', '10000')),
+    batch_size=int(os.getenv('QUERY_LOG_BATCH', '200')),
+    flush_interval=float(os.getenv('QUERY_LOG_FLUSH_SECONDS', '1')),
+    max_bytes=int(os.getenv('QUERY_LOG_MAX_MB', '50')) * 1024 * 1024,
+    compress=os.getenv('QUERY_LOG_COMPRESS', '1') in ('1', 'true', 'True'))
+
+# Hourly rollups of the query log, kept in logs/rollups/ (see query_analytics.py)
+QUERY_ANALYTICS = RollupStore(QUERY_LOG.path, os.getenv('QUERY_ROLLUP_DIR') or None)
+
 def log_user_query(query, request_data, response_data):
-    """Log user query and AI response metadata for analysis"""
+    """Log user query and AI response metadata for analysis
+    
+    Only queues the entry; it is dropped (and counted) if the log writer
+    is backed up. `latency_ms` is the request's time so far, when traced.
+    """
     try:
-        log_dir = os.path.join(os.path.dirname(__file__), 'logs')
-        os.makedirs(log_dir, exist_ok=True)
-        log_file = os.path.join(log_dir, 'user_queries.jsonl')
-        
         entry = {
             'timestamp': time.time(),
             'date': time.strftime('%Y-%m-%d %H:%M:%S'),
@@ -1177,11 +1375,11 @@ def log_user_query(query, request_data, response_data):
             'provider': response_data.get('_provider'),
             'model': response_data.get('_model')
         }
-        
-        # Append to file (JSONL format)
-        with open(log_file, 'a') as f:
-            f.write(json.dumps(entry) + '\n')
-            
+        trace = current_trace()
+        if trace is not None:
+            entry['latency_ms'] = round(trace.elapsed() * 1000)
+        with span('log'):
+            QUERY_LOG.log(entry)
     except Exception as e:
         app.logger.error(f"Failed to log query: {e}")
 
@@ -1205,6 +1403,13 @@ CEREBRAS_API_KEY = os.getenv('CEREBRAS_API_KEY') or ''
 SAMBANOVA_API_KEY = os.getenv('SAMBANOVA_API_KEY') or ''
 
 # Provider configurations
+# json_mode: how a JSON answer is requested (see build_llm_request):
+# response MIME type, OpenAI-style json_object, a JSON schema, or an
+# assistant prefill of "{" where the API has no JSON mode
+# price: list price of the default model in $ per million tokens
+# (input, output[, cached input]). It applies to every model of that
+# provider, so a cheaper user-selected model is costed at this rate unless
+# LLM_PRICES has a "provider/model" entry for it
 LLM_PROVIDERS = {
     'gemini': {
         'name': 'Google Gemini',
@@ -1212,7 +1417,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent',
         'default_key': GEMINI_API_KEY,
         'free_tier': '1,500 req/day',
-        'cost': 'Free tier available'
+        'cost': 'Free tier available',
+        'json_mode': 'mime_type',
+        'price': (0.10, 0.40, 0.025)
     },
     'openai': {
         'name': 'OpenAI',
@@ -1220,7 +1427,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.openai.com/v1/chat/completions',
         'default_key': OPENAI_API_KEY,
         'free_tier': None,
-        'cost': '$2.50-15/M tokens'
+        'cost': '$2.50-15/M tokens',
+        'json_mode': 'json_object',
+        'price': (2.50, 10.00, 1.25)
     },
     'claude': {
         'name': 'Anthropic Claude',
@@ -1228,7 +1437,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.anthropic.com/v1/messages',
         'default_key': ANTHROPIC_API_KEY,
         'free_tier': None,
-        'cost': '$3-15/M tokens'
+        'cost': '$3-15/M tokens',
+        'json_mode': 'prefill',
+        'price': (3.00, 15.00, 0.30)
     },
     'mistral': {
         'name': 'Mistral AI',
@@ -1236,7 +1447,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.mistral.ai/v1/chat/completions',
         'default_key': MISTRAL_API_KEY,
         'free_tier': 'Limited free',
-        'cost': '$2-8/M tokens'
+        'cost': '$2-8/M tokens',
+        'json_mode': 'json_object',
+        'price': (2.00, 6.00)
     },
     'groq': {
         'name': 'Groq',
@@ -1244,7 +1457,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.groq.com/openai/v1/chat/completions',
         'default_key': GROQ_API_KEY,
         'free_tier': '14,400 req/day',
-        'cost': 'Free tier, then $0.05-0.27/M tokens'
+        'cost': 'Free tier, then $0.05-0.27/M tokens',
+        'json_mode': 'json_object',
+        'price': (0.59, 0.79)
     },
     'together': {
         'name': 'Together AI',
@@ -1252,7 +1467,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.together.xyz/v1/chat/completions',
         'default_key': TOGETHER_API_KEY,
         'free_tier': '$1 free credit',
-        'cost': '$0.20-0.90/M tokens'
+        'cost': '$0.20-0.90/M tokens',
+        'json_mode': 'json_object',
+        'price': (0.88, 0.88)
     },
     'cohere': {
         'name': 'Cohere',
@@ -1260,7 +1477,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.cohere.ai/v1/chat',
         'default_key': COHERE_API_KEY,
         'free_tier': '1,000 req/month',
-        'cost': '$1-15/M tokens'
+        'cost': '$1-15/M tokens',
+        'json_mode': 'json_object',
+        'price': (2.50, 10.00)
     },
     'perplexity': {
         'name': 'Perplexity',
@@ -1268,7 +1487,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.perplexity.ai/chat/completions',
         'default_key': PERPLEXITY_API_KEY,
         'free_tier': None,
-        'cost': '$1-5/M tokens'
+        'cost': '$1-5/M tokens',
+        'json_mode': 'json_schema',
+        'price': (1.00, 1.00)
     },
     'deepseek': {
         'name': 'DeepSeek',
@@ -1276,7 +1497,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.deepseek.com/v1/chat/completions',
         'default_key': DEEPSEEK_API_KEY,
         'free_tier': 'Generous free tier',
-        'cost': '$0.14/M tokens (cheapest!)'
+        'cost': '$0.14/M tokens (cheapest!)',
+        'json_mode': 'json_object',
+        'price': (0.14, 0.28, 0.014)
     },
     'fireworks': {
         'name': 'Fireworks AI',
@@ -1284,7 +1507,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.fireworks.ai/inference/v1/chat/completions',
         'default_key': FIREWORKS_API_KEY,
         'free_tier': '$1 free credit',
-        'cost': '$0.20-0.90/M tokens'
+        'cost': '$0.20-0.90/M tokens',
+        'json_mode': 'json_object',
+        'price': (0.90, 0.90)
     },
     'xai': {
         'name': 'xAI Grok',
@@ -1292,7 +1517,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.x.ai/v1/chat/completions',
         'default_key': XAI_API_KEY,
         'free_tier': 'Limited free',
-        'cost': '$5/M tokens'
+        'cost': '$5/M tokens',
+        'json_mode': 'json_object',
+        'price': (5.00, 15.00)
     },
     'cerebras': {
         'name': 'Cerebras',
@@ -1300,7 +1527,9 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.cerebras.ai/v1/chat/completions',
         'default_key': CEREBRAS_API_KEY,
         'free_tier': 'Free tier available',
-        'cost': 'Fastest inference'
+        'cost': 'Fastest inference',
+        'json_mode': 'json_object',
+        'price': (0.60, 0.60)
     },
     'sambanova': {
         'name': 'SambaNova',
@@ -1308,106 +1537,448 @@ LLM_PROVIDERS = {
         'endpoint': 'https://api.sambanova.ai/v1/chat/completions',
         'default_key': SAMBANOVA_API_KEY,
         'free_tier': 'Free tier available',
-        'cost': 'Enterprise-grade speed'
+        'cost': 'Enterprise-grade speed',
+        'json_mode': 'json_object',
+        'price': (0.60, 1.20)
     }
 }
 
-def call_llm(provider, api_key, model, system_prompt, temperature=0.8):
+# Keep-alive session per provider (HTTP/2 when httpx + h2 are installed)
+LLM_HTTP = ProviderSessions(
+    pool_size=int(os.getenv('LLM_HTTP_POOL_SIZE', '10')),
+    connect_timeout=float(os.getenv('LLM_CONNECT_TIMEOUT', '3.05')),
+    read_timeout=float(os.getenv('LLM_READ_TIMEOUT', '60')),
+    http2=os.getenv('LLM_HTTP2', '1') not in ('0', 'false', 'False'))
+
+# Async gateway: per-provider concurrency limits and fail-fast backpressure
+LLM_GATEWAY = LLMGateway(
+    provider_limit=int(os.getenv('LLM_PROVIDER_CONCURRENCY', '32')),
+    provider_limits=parse_limits(os.getenv('LLM_PROVIDER_LIMITS', '')),  # e.g. "groq:8,gemini:16"
+    max_waiting=int(os.getenv('LLM_MAX_WAITING', '256')),
+    queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '10')))
+
+# Circuit breakers: stop calling a provider that is failing or slow
+LLM_HEALTH = ProviderHealth(
+    window=float(os.getenv('LLM_BREAKER_WINDOW', '60')),
+    min_calls=int(os.getenv('LLM_BREAKER_MIN_CALLS', '5')),
+    error_rate=float(os.getenv('LLM_BREAKER_ERROR_RATE', '0.5')),
+    slow_seconds=float(os.getenv('LLM_SLOW_CALL_SECONDS', '15')),
+    cooldown=float(os.getenv('LLM_BREAKER_COOLDOWN', '30')))
+
+# Token and cost totals per provider, model and mode (see token_ledger.py);
+# LLM_PRICES overrides list prices, e.g. {"openai/gpt-4o-mini": [0.15, 0.6]}
+LLM_TOKENS = TokenLedger(
+    os.getenv('LLM_USAGE_PATH') or os.path.join(os.path.dirname(__file__), 'logs', 'llm_usage.json'),
+    prices={**{p: config['price'] for p, config in LLM_PROVIDERS.items()},
+            **json.loads(os.getenv('LLM_PRICES') or '{}')},
+    save_interval=float(os.getenv('LLM_USAGE_SAVE_SECONDS', '60')))
+
+def resolve_llm(provider, api_key, model):
+    """(provider, config, key, model name); unknown providers fall back to Gemini"""
+    if provider not in LLM_PROVIDERS:
+        provider, api_key, model = 'gemini', GEMINI_API_KEY, None
+    config = LLM_PROVIDERS[provider]
+    key = api_key or config['default_key']
+    if not key:
+        raise ValueError(f"No API key provided for {provider}")
+    return provider, config, key, model or config['default_model']
+
+def route_llm(provider, api_key, model):
+    """(provider, api_key, model) to call: the requested provider while its
+    circuit breaker admits calls, else the healthiest provider with a server key"""
+    name = provider if provider in LLM_PROVIDERS else 'gemini'
+    candidates = [p for p, config in LLM_PROVIDERS.items() if config['default_key']]
+    routed = LLM_HEALTH.route(name, candidates)
+    if routed is None or routed == name:
+        return provider, api_key, model
+    return routed, '', ''
+
+# Start of a prefilled JSON answer (providers without a JSON mode)
+JSON_PREFILL = '{'
+
+def build_llm_request(provider, key, model_name, system_prompt, temperature=0.8, stream=False,
+                      user_prompt=None, json_mode=False):
+    """(url, payload, headers) for one provider call
+    
+    With `user_prompt`, `system_prompt` is the static part of the prompt and
+    goes out as system content, marked cacheable where the provider has an
+    explicit cache control (Anthropic). Without it, `system_prompt` is sent
+    as the user message, as before.
+    
+    With `json_mode`, the provider is asked for a JSON object the way its
+    LLM_PROVIDERS['json_mode'] says. For 'prefill' the answer starts after
+    JSON_PREFILL, which the caller puts back in front of the text.
+    """
+    config = LLM_PROVIDERS[provider]
+    headers = {'Content-Type': 'application/json'}
+    system, user = (system_prompt, user_prompt) if user_prompt is not None else (None, system_prompt)
+    
+    if provider == 'gemini':
+        # Google Gemini format (2.x models cache repeated prefixes implicitly)
+        endpoint = config['endpoint']
+        if stream:
+            endpoint = endpoint.replace(':generateContent', ':streamGenerateContent')
+        url = endpoint.format(model=model_name) + (f"?alt=sse&key={key}" if stream else f"?key={key}")
+        payload = {
+            'contents': [{'role': 'user', 'parts': [{'text': user}]}],
+            'generationConfig': {'temperature': temperature, 'maxOutputTokens': 2000}
+        }
+        if system:
+            payload['systemInstruction'] = {'parts': [{'text': system}]}
+        if json_mode:
+            payload['generationConfig']['responseMimeType'] = 'application/json'
+        return url, payload, headers
+    
+    if provider == 'claude':
+        # Anthropic Claude format
+        payload = {
+            'model': model_name,
+            'max_tokens': 2000,
+            'messages': [{'role': 'user', 'content': user}]
+        }
+        if system:
+            payload['system'] = [{'type': 'text', 'text': system,
+                                  'cache_control': {'type': 'ephemeral'}}]
+        if json_mode:
+            # No JSON mode: start the answer with "{"
+            payload['messages'].append({'role': 'assistant', 'content': JSON_PREFILL})
+        headers.update({'x-api-key': key, 'anthropic-version': '2023-06-01'})
+    elif provider == 'cohere':
+        # Cohere format
+        payload = {
+            'model': model_name,
+            'message': user,
+            'temperature': temperature
+        }
+        if system:
+            payload['preamble'] = system
+        headers['Authorization'] = f'Bearer {key}'
+    else:
+        # OpenAI format (also used by Groq, Together, Mistral, Perplexity, ...);
+        # OpenAI caches a repeated system prefix automatically
+        messages = [{'role': 'system', 'content': system}] if system else []
+        payload = {
+            'model': model_name,
+            'messages': messages + [{'role': 'user', 'content': user}],
+            'temperature': temperature,
+            'max_tokens': 2000
+        }
+        headers['Authorization'] = f'Bearer {key}'
+    if json_mode and config['json_mode'] == 'json_object':
+        payload['response_format'] = {'type': 'json_object'}
+    elif json_mode and config['json_mode'] == 'json_schema':
+        payload['response_format'] = {'type': 'json_schema', 'json_schema': {'schema': ANSWER_SCHEMA}}
+    if stream:
+        payload['stream'] = True
+    return config['endpoint'], payload, headers
+
+def llm_usage(provider, data):
+    """Token counts from a provider response body (or stream event):
+    {'input_tokens', 'output_tokens', 'cached_tokens'}, or None.
+    input_tokens includes the cached ones."""
+    if provider == 'gemini':
+        meta = data.get('usageMetadata')
+        if not meta:
+            return None
+        return {'input_tokens': meta.get('promptTokenCount', 0),
+                'output_tokens': meta.get('candidatesTokenCount', 0),
+                'cached_tokens': meta.get('cachedContentTokenCount', 0)}
+    if provider == 'claude':
+        usage = data.get('usage')
+        if not usage:
+            return None
+        cached = usage.get('cache_read_input_tokens') or 0
+        return {'input_tokens': usage.get('input_tokens', 0) + cached
+                                + (usage.get('cache_creation_input_tokens') or 0),
+                'output_tokens': usage.get('output_tokens', 0),
+                'cached_tokens': cached}
+    if provider == 'cohere':
+        billed = (data.get('meta') or {}).get('billed_units')
+        if not billed:
+            return None
+        return {'input_tokens': billed.get('input_tokens', 0),
+                'output_tokens': billed.get('output_tokens', 0),
+                'cached_tokens': 0}
+    usage = data.get('usage')
+    if not usage:
+        return None
+    return {'input_tokens': usage.get('prompt_tokens', 0),
+            'output_tokens': usage.get('completion_tokens', 0),
+            'cached_tokens': (usage.get('prompt_tokens_details') or {}).get('cached_tokens') or 0}
+
+def parse_llm_response(provider, response, usage=None):
+    """Completion text from a provider HTTP response; raises ValueError
+    
+    Token counts (see llm_usage) are stored in `usage` when given.
+    """
+    if response.status_code != 200:
+        raise ValueError(f"{LLM_PROVIDERS[provider]['name']} API error: {response.status_code} - {response.text}")
+    data = response.json()
+    if usage is not None:
+        usage.update(llm_usage(provider, data) or {})
+    if provider == 'gemini':
+        if 'candidates' in data and data['candidates']:
+            return data['candidates'][0].get('content', {}).get('parts', [{}])[0].get('text', '')
+        raise ValueError("No response from Gemini")
+    if provider == 'claude':
+        return data['content'][0]['text']
+    if provider == 'cohere':
+        return data['text']
+    return data['choices'][0]['message']['content']
+
+async def acall_llm(provider, api_key, model, system_prompt, temperature=0.8,
+                    user_prompt=None, usage=None, json_mode=False, mode=None):
+    """Coroutine form of call_llm(); runs on the gateway loop"""
+    if usage is None:
+        usage = {}
+    provider, config, key, model_name = resolve_llm(provider, api_key, model)
+    url, payload, headers = build_llm_request(provider, key, model_name, system_prompt, temperature,
+                                              user_prompt=user_prompt, json_mode=json_mode)
+    probe = LLM_HEALTH.begin(provider)
+    started = time.perf_counter()
+    try:
+        with span('llm.network', provider):
+            response = await LLM_HTTP.apost(provider, url, json=payload, headers=headers)
+    except requests.RequestException as e:
+        LLM_HEALTH.record(provider, False, time.perf_counter() - started, probe)
+        raise ValueError(f"Network error calling {provider}: {str(e)}")
+    except BaseException:
+        LLM_HEALTH.cancel(provider, probe)  # cancelled (e.g. lost a hedge race)
+        raise
+    LLM_HEALTH.record(provider, not is_failure_status(response.status_code),
+                      time.perf_counter() - started, probe)
+    text = parse_llm_response(provider, response, usage)
+    LLM_TOKENS.record(provider, model_name, mode, usage, time.perf_counter() - started)
+    if json_mode and config['json_mode'] == 'prefill':
+        text = JSON_PREFILL + text
+    return text
+
+def call_llm(provider, api_key, model, system_prompt, temperature=0.8, user_prompt=None, usage=None,
+             json_mode=False, mode=None):
     """
     Universal LLM caller supporting multiple providers.
     Returns the text response or raises an exception.
-    """
-    config = LLM_PROVIDERS.get(provider, LLM_PROVIDERS['gemini'])
-    key = api_key or config['default_key']
-    model_name = model or config['default_model']
     
-    if not key:
-        raise ValueError(f"No API key provided for {provider}")
+    Pass the static part of a prompt as `system_prompt` and the per-request
+    part as `user_prompt` so providers can cache the prefix; token counts,
+    including cached prompt tokens, are stored in the `usage` dict.
+    
+    With `json_mode`, the provider's JSON output mode is used (see
+    build_llm_request), so the text is a bare JSON object.
+    
+    Token counts and provider time of every successful call are added to
+    LLM_TOKENS under the request `mode` (e.g. 'default', 'product').
+    
+    Runs through LLM_GATEWAY, so it raises GatewayOverloaded when the
+    provider is saturated (or CircuitOpen while its breaker is open).
+    """
+    lane = provider if provider in LLM_PROVIDERS else 'gemini'
+    with span('llm', lane):
+        return LLM_GATEWAY.run(lane, acall_llm, provider, api_key, model, system_prompt,
+                               temperature, user_prompt, usage, json_mode, mode)
+
+# Hedged mode: race a backup provider when the primary is slow to answer
+LLM_HEDGE_DEFAULT = os.getenv('LLM_HEDGE', '0') in ('1', 'true', 'True')
+LLM_HEDGE_PROVIDERS = [p.strip() for p in os.getenv('LLM_HEDGE_PROVIDERS', 'groq,cerebras').split(',') if p.strip()]
+LLM_HEDGE_BUDGET = float(os.getenv('LLM_HEDGE_BUDGET_MS', '1500')) / 1000
+
+def hedge_attempts(provider, api_key, model, hedge):
+    """[(provider, api_key, model), ...] for a hedged call, primary first
     
+    `hedge` is the request's llm.hedge: true (use LLM_HEDGE_PROVIDERS, first
+    one with a server key) or {"provider", "apiKey", "model", "budget_ms"}.
+    """
+    primary = (provider if provider in LLM_PROVIDERS else 'gemini', api_key, model)
+    if isinstance(hedge, dict) and hedge.get('provider') in LLM_PROVIDERS:
+        backups = [(hedge['provider'], hedge.get('apiKey', ''), hedge.get('model', ''))]
+    else:
+        backups = [(p, '', '') for p in LLM_HEDGE_PROVIDERS
+                   if p in LLM_PROVIDERS and LLM_PROVIDERS[p]['default_key']
+                   and LLM_HEALTH.breaker(p).available()]
+    return [primary] + [b for b in backups if b[0] != primary[0]][:1]
+
+def hedge_budget(hedge):
+    if isinstance(hedge, dict) and hedge.get('budget_ms') is not None:
+        return float(hedge['budget_ms']) / 1000
+    return LLM_HEDGE_BUDGET
+
+def call_llm_hedged(attempts, system_prompt, temperature=0.8, budget=LLM_HEDGE_BUDGET,
+                    user_prompt=None, usage=None, json_mode=False, mode=None):
+    """
+    call_llm() racing a backup: the backup starts if the primary has not
+    answered within `budget` seconds (or failed); the first answer wins and
+    the other call is cancelled. Returns (text, index of the winning attempt).
+    """
+    usages = [{} for _ in attempts]
+    with span('llm'):
+        index, text = LLM_GATEWAY.hedge(
+            [(p, acall_llm, (p, key, model, system_prompt, temperature, user_prompt, usages[i], json_mode,
+                             mode))
+             for i, (p, key, model) in enumerate(attempts)],
+            budget)
+    if usage is not None:
+        usage.update(usages[index])
+    return text, index
+
+def _sse_payloads(lines):
+    """JSON payloads of a provider's Server-Sent Events stream"""
+    for line in lines:
+        if not line.startswith('data:'):
+            continue
+        payload = line[5:].strip()
+        if not payload or payload == '[DONE]':
+            continue
+        try:
+            yield json.loads(payload)
+        except ValueError:
+            continue
+
+def stream_llm(provider, api_key, model, system_prompt, temperature=0.8, user_prompt=None, usage=None,
+               json_mode=False, mode=None):
+    """
+    Streaming counterpart of call_llm(): yields text chunks as the provider
+    generates them. Raises ValueError like call_llm(). Holds a gateway slot
+    for the provider while the stream is open. The circuit breaker sees the
+    time until the provider's response headers.
+    
+    `usage` is filled from the token counts the provider reports in the
+    stream, when it does. `json_mode` and `mode` are as for call_llm(); a
+    stream is added to LLM_TOKENS once it has been read to the end.
+    """
+    if usage is None:
+        usage = {}
+    provider, config, key, model_name = resolve_llm(provider, api_key, model)
+    url, payload, headers = build_llm_request(provider, key, model_name, system_prompt,
+                                              temperature, stream=True, user_prompt=user_prompt,
+                                              json_mode=json_mode)
+    # Prefilled text goes out with the first chunk, so it still marks the first token
+    prefill = JSON_PREFILL if json_mode and config['json_mode'] == 'prefill' else ''
+    probe = LLM_HEALTH.begin(provider)
+    started = time.perf_counter()
+    recorded = False
     try:
-        if provider == 'gemini':
-            # Google Gemini format
-            url = config['endpoint'].format(model=model_name) + f"?key={key}"
-            payload = {
-                'contents': [{'parts': [{'text': system_prompt}]}],
-                'generationConfig': {'temperature': temperature, 'maxOutputTokens': 2000}
-            }
-            response = requests.post(url, json=payload, headers={'Content-Type': 'application/json'})
-            if response.status_code != 200:
-                raise ValueError(f"Gemini API error: {response.status_code} - {response.text}")
-            data = response.json()
-            if 'candidates' in data and data['candidates']:
-                return data['candidates'][0].get('content', {}).get('parts', [{}])[0].get('text', '')
-            raise ValueError("No response from Gemini")
-            
-        elif provider == 'openai':
-            # OpenAI format (also used by Groq, Together, Mistral, Perplexity)
-            payload = {
-                'model': model_name,
-                'messages': [{'role': 'user', 'content': system_prompt}],
-                'temperature': temperature,
-                'max_tokens': 2000
-            }
-            headers = {'Authorization': f'Bearer {key}', 'Content-Type': 'application/json'}
-            response = requests.post(config['endpoint'], json=payload, headers=headers)
-            if response.status_code != 200:
-                raise ValueError(f"OpenAI API error: {response.status_code} - {response.text}")
-            data = response.json()
-            return data['choices'][0]['message']['content']
-            
-        elif provider == 'claude':
-            # Anthropic Claude format
-            payload = {
-                'model': model_name,
-                'max_tokens': 2000,
-                'messages': [{'role': 'user', 'content': system_prompt}]
-            }
-            headers = {
-                'x-api-key': key,
-                'anthropic-version': '2023-06-01',
-                'Content-Type': 'application/json'
-            }
-            response = requests.post(config['endpoint'], json=payload, headers=headers)
+        with LLM_GATEWAY.slot(provider), \
+                LLM_HTTP.stream(provider, url, json=payload, headers=headers) as response:
+            recorded = True
+            LLM_HEALTH.record(provider, not is_failure_status(response.status_code),
+                              time.perf_counter() - started, probe)
             if response.status_code != 200:
-                raise ValueError(f"Claude API error: {response.status_code} - {response.text}")
-            data = response.json()
-            return data['content'][0]['text']
-            
-        elif provider in ['mistral', 'groq', 'together', 'perplexity', 'deepseek', 'fireworks', 'xai', 'cerebras', 'sambanova']:
-            # OpenAI-compatible format (most providers use this)
-            payload = {
-                'model': model_name,
-                'messages': [{'role': 'user', 'content': system_prompt}],
-                'temperature': temperature,
-                'max_tokens': 2000
-            }
-            headers = {'Authorization': f'Bearer {key}', 'Content-Type': 'application/json'}
-            response = requests.post(config['endpoint'], json=payload, headers=headers)
-            if response.status_code != 200:
-                raise ValueError(f"{provider.title()} API error: {response.status_code} - {response.text}")
-            data = response.json()
-            return data['choices'][0]['message']['content']
-            
-        elif provider == 'cohere':
-            # Cohere format
-            payload = {
-                'model': model_name,
-                'message': system_prompt,
-                'temperature': temperature
-            }
-            headers = {'Authorization': f'Bearer {key}', 'Content-Type': 'application/json'}
-            response = requests.post(config['endpoint'], json=payload, headers=headers)
-            if response.status_code != 200:
-                raise ValueError(f"Cohere API error: {response.status_code} - {response.text}")
-            data = response.json()
-            return data['text']
-            
-        else:
-            # Fallback to Gemini
-            return call_llm('gemini', GEMINI_API_KEY, None, system_prompt, temperature)
-            
+                raise ValueError(f"{config['name']} API error: {response.status_code} - {response.read_text()}")
+            lines = response.lines()
+            if provider == 'gemini':
+                for event in _sse_payloads(lines):
+                    usage.update(llm_usage(provider, event) or {})  # running totals
+                    for candidate in event.get('candidates') or []:
+                        for part in candidate.get('content', {}).get('parts', []):
+                            if part.get('text'):
+                                yield part['text']
+            elif provider == 'claude':
+                for event in _sse_payloads(lines):
+                    if event.get('type') == 'content_block_delta':
+                        text = event.get('delta', {}).get('text')
+                        if text:
+                            yield prefill + text
+                            prefill = ''
+                    elif event.get('type') == 'message_start':
+                        usage.update(llm_usage(provider, event.get('message', {})) or {})
+                    elif event.get('type') == 'message_delta' and event.get('usage'):
+                        usage['output_tokens'] = event['usage'].get('output_tokens', 0)
+                    elif event.get('type') == 'error':
+                        raise ValueError(f"Claude API error: {event.get('error')}")
+            elif provider == 'cohere':
+                # Newline-delimited JSON events
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    if event.get('event_type') == 'text-generation':
+                        yield event.get('text', '')
+                    elif event.get('event_type') == 'stream-end':
+                        usage.update(llm_usage(provider, event.get('response', {})) or {})
+            else:
+                for event in _sse_payloads(lines):
+                    usage.update(llm_usage(provider, event) or {})  # final chunk, if sent
+                    for choice in event.get('choices') or []:
+                        text = (choice.get('delta') or {}).get('content')
+                        if text:
+                            yield text
+        LLM_TOKENS.record(provider, model_name, mode, usage, time.perf_counter() - started)
     except requests.RequestException as e:
+        if not recorded:
+            recorded = True
+            LLM_HEALTH.record(provider, False, time.perf_counter() - started, probe)
         raise ValueError(f"Network error calling {provider}: {str(e)}")
+    finally:
+        if not recorded:
+            LLM_HEALTH.cancel(provider, probe)
+
+
+def stream_llm_hedged(attempts, system_prompt, temperature=0.8, budget=LLM_HEDGE_BUDGET, winner=None,
+                      user_prompt=None, usage=None, json_mode=False, mode=None):
+    """
+    stream_llm() racing a backup on time-to-first-token: the backup stream
+    starts if the primary has produced no text within `budget` seconds (or
+    failed). The first stream to produce text wins and the other is closed;
+    the winning attempt's index is stored in winner['index'].
+    """
+    events = queue.Queue()
+    cancelled = threading.Event()
+    chosen = []
+    usages = [{} for _ in attempts]
+    
+    def pump(i):
+        provider, key, model = attempts[i]
+        try:
+            for chunk in stream_llm(provider, key, model, system_prompt, temperature,
+                                    user_prompt, usages[i], json_mode, mode):
+                if cancelled.is_set() and chosen != [i]:
+                    return  # lost the race; closes the provider stream
+                events.put((i, 'chunk', chunk))
+            events.put((i, 'end', ValueError(f"{provider} returned an empty response")))
+        except Exception as e:
+            events.put((i, 'error', e))
+    
+    def launch():
+        threading.Thread(target=pump, args=(len(started),), daemon=True).start()
+        started.append(True)
+    
+    started, errors = [], {}
+    launch()
+    try:
+        while not chosen:
+            hedging = len(started) < len(attempts)
+            try:
+                i, kind, value = events.get(timeout=budget if hedging else None)
+            except queue.Empty:
+                launch()
+                continue
+            if kind == 'chunk':
+                chosen.append(i)
+                cancelled.set()
+                if winner is not None:
+                    winner['index'] = i
+                yield value
+                break
+            errors[i] = value
+            if len(errors) == len(attempts):
+                raise errors[min(errors)]
+            if hedging and len(errors) == len(started):
+                launch()
+        while True:
+            i, kind, value = events.get()
+            if i != chosen[0]:
+                continue
+            if kind == 'chunk':
+                yield value
+            elif kind == 'end':
+                if usage is not None:
+                    usage.update(usages[i])
+                return
+            else:
+                raise value
+    finally:
+        chosen[:] = [None]  # stops every pump, the winner included
+        cancelled.set()
 
 
 @app.route('/api/valet/test', methods=['POST'])
@@ -1421,7 +1992,7 @@ def api_valet_test():
     try:
         # Simple test prompt
         test_prompt = "Respond with exactly: 'Connection successful!' Nothing else."
-        result = call_llm(provider, api_key, model, test_prompt, temperature=0.1)
+        result = call_llm(provider, api_key, model, test_prompt, temperature=0.1, mode='test')
         
         config = LLM_PROVIDERS.get(provider, LLM_PROVIDERS['gemini'])
         return jsonify({
@@ -1436,6 +2007,49 @@ def api_valet_test():
             'error': str(e)
         })
 
+@app.route('/api/valet/health', methods=['GET'])
+def api_valet_health():
+    """Circuit breaker state per provider (closed / open / half_open),
+    with rolling error rate and latency"""
+    stats = LLM_HEALTH.stats()
+    stats['configured'] = [p for p, config in LLM_PROVIDERS.items() if config['default_key']]
+    return jsonify(stats)
+
+@app.route('/api/valet/connections', methods=['GET'])
+def api_valet_connections():
+    """Connection pool and keep-alive reuse counters per LLM provider"""
+    return jsonify(LLM_HTTP.stats())
+
+@app.route('/api/valet/gateway', methods=['GET'])
+def api_valet_gateway():
+    """In-flight, queued and rejected LLM calls per provider"""
+    return jsonify(LLM_GATEWAY.stats())
+
+@app.route('/api/valet/query-log', methods=['GET'])
+def api_valet_query_log():
+    """Query log writer counters: queued, written, dropped, rotations"""
+    return jsonify(QUERY_LOG.stats())
+
+@app.route('/api/valet/analytics', methods=['GET'])
+def api_valet_analytics():
+    """Query counts per category, mode, provider and model, and latency
+    percentiles, over the last `hours` hours (default 24)
+    
+    Reads only what was logged since the last call; earlier hours come
+    from the saved rollups.
+    """
+    hours = max(1, min(request.args.get('hours', 24, type=int), 24 * 90))
+    top = max(1, request.args.get('top', 10, type=int))
+    QUERY_LOG.flush(timeout=1.0)
+    return jsonify(QUERY_ANALYTICS.summary(hours=hours, top=top))
+
+@app.route('/api/valet/usage', methods=['GET'])
+def api_valet_usage():
+    """LLM tokens, estimated cost and output tokens/second per provider,
+    model and mode, with providers ranked cheapest first among those
+    producing at least `min_tps` tokens/second"""
+    return jsonify(LLM_TOKENS.stats(min_tokens_per_second=request.args.get('min_tps', 0.0, type=float)))
+
 
 # Valet category definitions
 VALET_CATEGORIES = [
@@ -1449,84 +2063,137 @@ VALET_CATEGORIES = [
 # Product Catalog from JSON
 # ==========================================
 
-CATALOG_FILE = os.path.join(os.path.dirname(__file__), 'data', 'catalog.json')
+CATALOG_FILE = CATALOG_PATH
 
 def load_catalog():
-    """Load product catalog from JSON file"""
-    try:
-        if os.path.exists(CATALOG_FILE):
-            with open(CATALOG_FILE, 'r') as f:
-                return json.load(f)
-    except Exception as e:
-        app.logger.error(f'Failed to load catalog: {e}')
-    return {'products': [], 'activities': [], 'vibes': [], 'categories': []}
+    """Return the current catalog snapshot (shared with load_product_catalog)"""
+    catalog = load_product_catalog()
+    if catalog is None:
+        return {'products': [], 'activities': [], 'vibes': [], 'categories': []}
+    return catalog
 
 @app.route('/api/valet/products', methods=['GET'])
 def api_valet_products():
     """Return active products, optionally filtered by category or vibes"""
-    catalog = load_catalog()
-    products = [p for p in catalog.get('products', []) if p.get('active', True)]
-    
-    # Optional filters
-    category = request.args.get('category')
-    vibe = request.args.get('vibe')
-    activity = request.args.get('activity')
-    source = request.args.get('source')  # 'internal', 'affiliate'
-    
-    if category:
-        products = [p for p in products if p.get('category') == category]
-    if vibe:
-        products = [p for p in products if vibe in p.get('vibes', [])]
-    if activity:
-        products = [p for p in products if activity in p.get('activities', [])]
-    if source:
-        products = [p for p in products if p.get('source') == source]
+    snapshot = CATALOG_STORE.snapshot()
+    if not snapshot:
+        return jsonify({'count': 0, 'products': []})
+    
+    def build_payload():
+        # Optional filters, resolved via the snapshot's inverted indexes
+        products = snapshot.index.filter(
+            category=request.args.get('category'),
+            vibe=request.args.get('vibe'),
+            activity=request.args.get('activity'),
+            source=request.args.get('source'),  # 'internal', 'affiliate'
+        )
+        return {
+            'count': len(products),
+            'products': products
+        }
     
-    return jsonify({
-        'count': len(products),
-        'products': products
-    })
+    return cached_json_response(snapshot, build_payload)
+
+# Upper bound for ?limit= on /api/valet/search
+SEARCH_MAX_RESULTS = 50
+
+@app.route('/api/valet/search', methods=['GET'])
+def api_valet_search():
+    """Ranked full-text product search (BM25, no LLM involved)
+    
+    Query params:
+    - q: search text; the last word also matches as a prefix (typeahead)
+    - limit: max results (default 20, max 50)
+    - category, vibe, activity, source: optional filters
+    - active_only: only search active products (default: true)
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'q required'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+        if not 1 <= limit <= SEARCH_MAX_RESULTS:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': f'limit must be 1-{SEARCH_MAX_RESULTS}'}), 400
+    
+    snapshot = CATALOG_STORE.snapshot()
+    if not snapshot:
+        return jsonify({'query': query, 'count': 0, 'products': []})
+    
+    def build_payload():
+        mask = snapshot.index.filter_mask(
+            active_only=request.args.get('active_only', 'true').lower() == 'true',
+            category=request.args.get('category'),
+            vibe=request.args.get('vibe'),
+            activity=request.args.get('activity'),
+            source=request.args.get('source'),
+        )
+        hits = snapshot.search.search(query, limit=limit, mask=mask)
+        products = [dict(snapshot.products[item.position], _score=round(score, 4))
+                    for item, score in hits]
+        return {
+            'query': query,
+            'count': len(products),
+            'products': products
+        }
+    
+    return cached_json_response(snapshot, build_payload)
 
 @app.route('/api/valet/offers', methods=['POST'])
 def api_valet_offers():
-    """Get contextually relevant product offers based on query context"""
+    """Get contextually relevant product offers based on query context
+    
+    Body: context (free text), exclude (product ids), count (default 3),
+    seed (optional; makes the tie-breaking jitter reproducible)
+    
+    Products are ranked by embedding similarity to the context; when fewer
+    than `count` match (see catalog_embeddings.py), the rest come from tag
+    matching (with jitter).
+    """
     data = request.get_json() or {}
     context = data.get('context', '')
     exclude_ids = data.get('exclude', [])
-    count = data.get('count', 3)
-    
-    catalog = load_catalog()
-    products = [p for p in catalog.get('products', []) 
-                if p.get('active', True) and p.get('id') not in exclude_ids]
-    
-    # Simple tag/context matching (can be enhanced with embeddings later)
-    context_words = context.lower().split()
-    
-    def score_product(p):
-        score = 0
-        tags = p.get('vibes', []) + p.get('activities', []) + [p.get('category', '')]
-        for tag in tags:
-            if any(word in tag.lower() or tag.lower() in word for word in context_words):
-                score += 2
-        # Slight random factor for variety
-        import random
-        score += random.random()
-        return score
-    
-    scored = sorted(products, key=score_product, reverse=True)
+    try:
+        count = int(data.get('count', 3))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'count must be an integer'}), 400
+    seed = data.get('seed')
+    
+    snapshot = CATALOG_STORE.snapshot()
+    if not snapshot:
+        return jsonify({'offers': []})
+    
+    offers = [snapshot.products[item.position] for item, _ in
+              catalog_embeddings(snapshot).top(context, k=count, exclude=exclude_ids)]
+    if len(offers) < count:
+        # Top up with tag/context matching
+        rng = random.Random(seed) if seed is not None else None
+        offers += snapshot.offers.top(context, count=count - len(offers), rng=rng,
+                                      exclude=list(exclude_ids) + [p.get('id') for p in offers])
     return jsonify({
-        'offers': scored[:count]
+        'offers': offers
     })
 
-@app.route('/api/valet', methods=['POST'])
-def api_valet():
-    """Process valet query using user's choice of LLM provider
+# LLM answers for /api/valet (memory LRU + optional SQLite tier for restarts)
+VALET_CACHE = ValetResponseCache(
+    max_entries=int(os.getenv('VALET_CACHE_SIZE', '512')),
+    ttl=float(os.getenv('VALET_CACHE_TTL', '3600')),
+    disk_path=os.getenv('VALET_CACHE_DB') or None)
+
+# Catalog products retrieved into a product-mode prompt
+VALET_GROUNDING_K = int(os.getenv('VALET_GROUNDING_K', '15'))
+
+# Ask providers for JSON output (JSON mode, response schema or prefill)
+VALET_JSON_MODE = os.getenv('VALET_JSON_MODE', '1') in ('1', 'true', 'True')
+
+def prepare_valet(data):
+    """Build the LLM request for a valet query (shared by /api/valet and /api/valet/stream)
     
-    Modes:
-    - Default: Returns youtube, songs, travel (eyeballs + products)
-    - Product Mode: Returns products only (triggered by product_mode=true or 7+ commercial likes)
+    Returns (plan, None), or (None, answer) when the query is an inventory
+    command that needs no LLM. The plan holds the prompt, provider settings
+    and response cache key.
     """
-    data = request.get_json()
     query = data.get('query', '')
     anchor = data.get('anchor', '')
     category_override = data.get('category', None)  # User-selected category
@@ -1537,16 +2204,14 @@ def api_valet():
     
     # LLM settings from user (or defaults)
     llm_config = data.get('llm', {})
-    provider = llm_config.get('provider', 'gemini')
-    user_api_key = llm_config.get('apiKey', '')
-    user_model = llm_config.get('model', '')
-    
-    if not query:
-        return jsonify({'error': 'Query required'}), 400
+    requested_provider = llm_config.get('provider', 'gemini')
+    # Skip a provider whose circuit breaker is open
+    provider, user_api_key, user_model = route_llm(
+        requested_provider, llm_config.get('apiKey', ''), llm_config.get('model', ''))
     
-    # Load product catalog for context
-    catalog = load_product_catalog()
-    categories = list(set(p.get('category', '') for p in catalog.get('products', [])))
+    # Load product catalog for context (normalized items: name/title, price/priceValue reconciled)
+    with span('catalog'):
+        snapshot = CATALOG_STORE.snapshot()
     
     # Detect if query is asking for specific products
     product_keywords = ['find', 'show me', 'looking for', 'want to buy', 'shop', 'purchase', 
@@ -1557,171 +2222,288 @@ def api_valet():
     # Special Inventory Commands
     if 'grouped by type' in query_lower or 'group by type' in query_lower or 'by category' in query_lower:
         log_user_query(query, data, {'mode': 'command', 'command': 'group_by_type'})
-        return jsonify({
+        return None, {
             'response': "I've organized the entire catalog by category for you.",
             'mode': 'command',
             'command': 'group_by_type'
-        })
+        }
 
     if 'grouped by vendor' in query_lower or 'group by vendor' in query_lower or 'by brand' in query_lower:
         log_user_query(query, data, {'mode': 'command', 'command': 'group_by_vendor'})
-        return jsonify({
+        return None, {
             'response': "Here is the inventory sorted by vendor and brand.",
             'mode': 'command',
             'command': 'group_by_vendor'
-        })
+        }
     
     is_product_query = any(kw in query_lower for kw in product_keywords)
     
     # Switch to product mode if: explicit, 7+ likes, or product-focused query
     use_product_mode = product_mode or commercial_likes >= 7 or is_product_query
     
-    # Get sample products with images for each category
-    products_with_images = [p for p in catalog.get('products', []) if p.get('image') and p.get('active', True)]
-    sample_products = products_with_images[:30] if products_with_images else catalog.get('products', [])[:30]
-    product_examples = "\n".join([f"- {p['name']} ({p['category']}, ${p.get('price', 0)})" for p in sample_products[:15]])
-    
-    # Build liked products context if available
-    liked_context = ''
-    if liked_products:
-        liked_context = f'''
-User has liked these products (consider similar items):
-{chr(10).join([f"- {p}" for p in liked_products[:5]])}
-'''
-    
-    # Category context for focused results
-    category_context = ''
-    if category_override and category_override != 'auto':
-        category_context = f'''
-IMPORTANT: User has selected "{category_override}" mode. 
-Focus recommendations on {category_override} items.
-'''
-    elif len(chat_history) >= 6:
-        category_context = f'''
-Analyze chat history and detect primary interest:
-{chr(10).join(chat_history[-6:])}
-
-Available categories: {', '.join(categories)}
-Use detected category to focus recommendations.
-Include "detected_category" in your response.
-'''
-    
-    if use_product_mode:
-        # PRODUCT MODE: Focus on catalog products
-        system_prompt = f"""You are Markov, iamtoxico's lifestyle valet in SHOPPING MODE - helping discover premium products.
-
-Your voice:
-- Warm but knowing ("oh, you're gonna love this...")
-- Confident recommendations ("trust me on this one")
-- Tasteful enthusiasm without being over the top
-
-BRAND: "iamtoxico" - liberates laughing. Deviant but proper, the sporting life.
-
-Markov knows the entire iamtoxico portfolio (internal and affiliate items).
-Always prioritize items from the catalog that match the user's vibe.
-
-Available product categories: {', '.join(categories)}
-
-Example products in catalog:
-{product_examples}
-
-{liked_context}
-{category_context}
-
-User Query: "{query}"
-
-Respond with valid JSON:
-{{
-  "response": "A warm, conversational 2-4 sentence response about the products.",
-  "detected_category": "category if detected, or null",
-  "mode": "product",
-  "products": [
-    {{"name": "Product Name", "category": "category", "reason": "why this fits", "vibe": "lifestyle vibe"}},
-    {{"name": "Product Name", "category": "category", "reason": "why this fits", "vibe": "lifestyle vibe"}},
-    {{"name": "Product Name", "category": "category", "reason": "why this fits", "vibe": "lifestyle vibe"}}
-  ],
-  "vibes": ["vibe1", "vibe2", "vibe3"]
-}}
-
-Focus on products from the catalog. Prefer items with high relevance to the query."""
-    else:
-        # DEFAULT MODE: YouTube, Songs, Travel (eyeballs + offers)
-        system_prompt = f"""You are Markov, iamtoxico's lifestyle valet - think part trusted friend, part tastemaker, part concierge who's seen it all. You curate content and experiences.
-
-Your voice:
-- Warm but knowing ("oh, you're gonna love this...")
-- Confident recommendations ("trust me on this one")
-- Personal touches ("I've been there, it's unreal")
-- Tasteful enthusiasm without being over the top
-- Occasionally playful ("okay but hear me out...")
-
-BRAND: "iamtoxico" - liberates laughing. Deviant but proper, the sporting life.
-ALTER EGO: Captain Adventure
-
-Markov knows the entire iamtoxico portfolio (internal and affiliate items).
-Use these items as anchors for your recommendations when relevant.
-
-{category_context}
-
-User Query: "{query}"
-{f'Previous context: {anchor}' if anchor else ''}
-
-Respond with valid JSON:
-{{
-  "response": "A warm, conversational 2-4 sentence response with PERSONALITY. Paint a picture of the lifestyle moment. Make it feel like advice from a friend who genuinely wants them to have an amazing experience.",
-  "detected_category": "category if detected, or null",
-  "mode": "default",
-  "youtube": [
-    {{"title": "Video title", "channel": "Channel name", "searchQuery": "YouTube search query", "vibe": "the mood/vibe"}},
-    {{"title": "Video title", "channel": "Channel name", "searchQuery": "YouTube search query", "vibe": "the mood/vibe"}},
-    {{"title": "Video title", "channel": "Channel name", "searchQuery": "YouTube search query", "vibe": "the mood/vibe"}}
-  ],
-  "songs": [
-    {{"title": "Song title", "artist": "Artist name", "vibe": "mood description"}},
-    {{"title": "Song title", "artist": "Artist name", "vibe": "mood description"}},
-    {{"title": "Song title", "artist": "Artist name", "vibe": "mood description"}}
-  ],
-  "travel": [
-    {{"name": "Hotel/Place name", "location": "City, Country", "price_hint": "$$$", "vibe": "experience description"}},
-    {{"name": "Hotel/Place name", "location": "City, Country", "price_hint": "$$$$", "vibe": "experience description"}},
-    {{"name": "Hotel/Place name", "location": "City, Country", "price_hint": "$$", "vibe": "experience description"}}
-  ]
-}}
-
-For YouTube: Suggest interesting videos, documentaries, or content that matches the vibe.
-For Songs: Create a mini soundtrack that fits the mood - mix familiar and discovery.
-For Travel: Suggest luxury/boutique hotels or experiences that match the lifestyle.
-Keep suggestions varied, tasteful, and aligned with the sporting life aesthetic."""
+    # Product mode shows the LLM only the catalog products retrieved for this query
+    with span('retrieval'):
+        grounder = grounder_for(snapshot) if use_product_mode else None
+        candidates = grounder.retrieve(query, liked_products, k=VALET_GROUNDING_K,
+                                       semantic=catalog_embeddings(snapshot)) if grounder else []
+    
+    # Catalog-derived prompt sections are compiled once per catalog version
+    with span('prompt'):
+        prompts = prompts_for(snapshot)
+        system_prompt, user_prompt = prompts.render(
+            use_product_mode, query, anchor=anchor, liked=liked_products,
+            category=category_override, history=chat_history, products=candidates)
+    category_override_active = bool(category_override and category_override != 'auto')
+
+    # Answers are cached per normalized query + everything else the prompt was built from
+    model_name = user_model or LLM_PROVIDERS.get(provider, {}).get('default_model', 'unknown')
+    prompt_context = {
+        'anchor': None if use_product_mode else anchor,
+        'liked': liked_products[:5] if use_product_mode else None,
+        'history': chat_history[-6:] if len(chat_history) >= 6 and not category_override_active else None,
+    }
+    cache_key = valet_cache_key(
+        query, 'product' if use_product_mode else 'default',
+        category_override if category_override_active else None,
+        provider, model_name, snapshot.digest if snapshot else '', prompt_context)
+    return {
+        'data': data,
+        'query': query,
+        'provider': provider,
+        'api_key': user_api_key,
+        'model': user_model,
+        'model_name': model_name,
+        'system_prompt': system_prompt,  # static, cacheable prefix
+        'user_prompt': user_prompt,
+        'product_mode': use_product_mode,
+        'mode': 'product' if use_product_mode else 'default',
+        'grounder': grounder,
+        'candidates': candidates,
+        'commercial_likes': commercial_likes,
+        'cache_key': cache_key,
+        'use_cache': data.get('cache', True) is not False,
+        'hedge': llm_config.get('hedge', LLM_HEDGE_DEFAULT),
+        'json_mode': VALET_JSON_MODE,
+        'routed_from': requested_provider if provider != requested_provider else None,
+        'usage': {},  # filled by the provider call
+    }, None
+
+def valet_hedge_attempts(plan):
+    """Attempts to race for a plan, or None when hedging is off or has no backup"""
+    if not plan['hedge']:
+        return None
+    attempts = hedge_attempts(plan['provider'], plan['api_key'], plan['model'], plan['hedge'])
+    return attempts if len(attempts) > 1 else None
+
+def use_hedge_winner(plan, attempts, index):
+    """Record which raced provider answered"""
+    provider, _, model = attempts[index]
+    plan['hedged'] = {'primary': attempts[0][0], 'winner': provider}
+    if index:
+        plan['provider'] = provider
+        plan['model_name'] = model or LLM_PROVIDERS[provider]['default_model']
+
+def cached_valet_answer(plan):
+    """The cached answer for a plan (marked as a hit and logged), or None"""
+    if not plan['use_cache']:
+        return None
+    cached = VALET_CACHE.get(plan['cache_key'])
+    if cached is not None:
+        cached['_commercial_likes'] = plan['commercial_likes']
+        cached['_cache'] = 'hit'
+        log_user_query(plan['query'], plan['data'], cached)
+    return cached
+
+def parse_valet_text(text):
+    """Parse the LLM's JSON answer; raises json.JSONDecodeError
+    
+    Fences and prose around the object are skipped, and a malformed or
+    cut-off object is repaired (see valet_json.py). Cards that do not fit
+    the answer schema are dropped. What had to be fixed is listed in
+    `_repaired`.
+    """
+    repairs = []
+    parsed = extract_json(text, repairs)
+    repairs.extend(validate_answer(parsed))
+    if repairs:
+        app.logger.info(f'Repaired LLM answer: {", ".join(repairs)}')
+        parsed['_repaired'] = repairs
+    return parsed
+
+def finish_valet_answer(plan, parsed):
+    """Add response metadata, cache and log a freshly generated answer"""
+    # Add provider info to response for debugging
+    parsed['_provider'] = plan['provider']
+    parsed['_model'] = plan['model_name']
+    parsed['_product_mode'] = plan['product_mode']
+    parsed['_commercial_likes'] = plan['commercial_likes']
+    if plan['grounder'] is not None:
+        # Keep only real catalog products, with their ids
+        with span('grounding'):
+            parsed['_grounding'] = plan['grounder'].ground(parsed, plan['candidates'])
+    if plan.get('hedged'):
+        parsed['_hedge'] = plan['hedged']
+    if plan.get('routed_from'):
+        parsed['_routed_from'] = plan['routed_from']
+    if plan['use_cache']:
+        VALET_CACHE.put(plan['cache_key'], parsed)
+    parsed['_cache'] = 'miss'
+    if plan['usage']:
+        parsed['_usage'] = plan['usage']  # tokens, incl. prompt tokens served from provider cache
+    
+    # Log the query
+    log_user_query(plan['query'], plan['data'], parsed)
+    return parsed
 
+@app.route('/api/valet', methods=['POST'])
+def api_valet():
+    """Process valet query using user's choice of LLM provider
+    
+    Modes:
+    - Default: Returns youtube, songs, travel (eyeballs + products)
+    - Product Mode: Returns products only (triggered by product_mode=true or 7+ commercial likes)
+    
+    Answers are cached (see valet_cache.py); `_cache` in the response is
+    "hit" or "miss". Send "cache": false to bypass.
+    
+    Hedging (llm.hedge, or LLM_HEDGE=1): if the provider has not answered
+    within the latency budget, a backup provider is raced against it and
+    the first answer wins; `_hedge` reports the primary and the winner.
+    """
+    data = request.get_json()
+    if not data.get('query', ''):
+        return jsonify({'error': 'Query required'}), 400
+    
+    plan, answer = prepare_valet(data)
+    if answer is not None:
+        return jsonify(answer)
+    with span('cache'):
+        cached = cached_valet_answer(plan)
+    if cached is not None:
+        return jsonify(cached)
+    
+    text = ''
     try:
         # Use multi-provider LLM system
-        text = call_llm(provider, user_api_key, user_model, system_prompt, temperature=0.8)
-        
-        # Clean up JSON from markdown code blocks
-        import re
-        text = re.sub(r'```json\s*', '', text)
-        text = re.sub(r'```\s*', '', text)
-        text = text.strip()
-        
-        parsed = json.loads(text)
-        # Add provider info to response for debugging
-        parsed['_provider'] = provider
-        parsed['_model'] = user_model or LLM_PROVIDERS.get(provider, {}).get('default_model', 'unknown')
-        parsed['_product_mode'] = use_product_mode
-        parsed['_commercial_likes'] = commercial_likes
-        
-        # Log the query
-        log_user_query(query, data, parsed)
-        
-        return jsonify(parsed)
+        attempts = valet_hedge_attempts(plan)
+        if attempts:
+            text, index = call_llm_hedged(attempts, plan['system_prompt'], temperature=0.8,
+                                          budget=hedge_budget(plan['hedge']),
+                                          user_prompt=plan['user_prompt'], usage=plan['usage'],
+                                          json_mode=plan['json_mode'], mode=plan['mode'])
+            use_hedge_winner(plan, attempts, index)
+        else:
+            text = call_llm(plan['provider'], plan['api_key'], plan['model'],
+                            plan['system_prompt'], temperature=0.8,
+                            user_prompt=plan['user_prompt'], usage=plan['usage'],
+                            json_mode=plan['json_mode'], mode=plan['mode'])
+        with span('parse'):
+            parsed = parse_valet_text(text)
+        return jsonify(finish_valet_answer(plan, parsed))
             
     except json.JSONDecodeError as e:
         app.logger.error(f'JSON parse error: {e}')
         return jsonify({'error': 'Failed to parse AI response', 'raw': text}), 500
+    except GatewayOverloaded as e:
+        response = jsonify({'error': str(e), 'retry_after': e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
     except Exception as e:
         app.logger.exception('Valet query failed')
         return jsonify({'error': str(e)}), 500
 
+def _valet_sse(event):
+    """SSE frame for a ValetStreamParser / answer_events() event"""
+    if event[0] == 'text':
+        return sse_event(event[1], {'delta': event[2]})
+    _, section, index, card = event
+    return sse_event('card', {'section': section, 'index': index, 'card': card})
+
+def ground_stream_event(plan, event, seen):
+    """A streamed product card resolved to its catalog item (reindexed), or
+    None for a product that is not in the catalog; other events unchanged"""
+    if event[0] != 'card' or event[1] != 'products' or plan['grounder'] is None:
+        return event
+    card = plan['grounder'].ground_card(event[3], plan['candidates'])
+    if card is None or card['id'] in seen:
+        return None
+    seen.add(card['id'])
+    return ('card', 'products', len(seen) - 1, card)
+
+@app.route('/api/valet/stream', methods=['POST'])
+def api_valet_stream():
+    """Streaming /api/valet over Server-Sent Events
+    
+    Same request body as /api/valet. Events:
+    - meta: provider, model and mode, sent before the LLM is called
+    - hedge: {"primary": ..., "winner": ...}, when hedging is on, once the
+      first provider to produce text has been picked
+    - response: {"delta": "..."}, the response text as it is generated
+    - card: {"section": "songs", "index": 0, "card": {...}}, each
+      youtube/songs/travel/products entry as soon as it is complete
+    - done: the full answer, as /api/valet would return it
+    - error: {"error": "..."}
+    """
+    data = request.get_json()
+    if not data.get('query', ''):
+        return jsonify({'error': 'Query required'}), 400
+    
+    plan, answer = prepare_valet(data)
+    
+    def generate():
+        if answer is not None:
+            yield sse_event('done', answer)
+            return
+        yield sse_event('meta', {
+            'provider': plan['provider'],
+            'model': plan['model_name'],
+            'mode': plan['mode'],
+        })
+        cached = cached_valet_answer(plan)
+        if cached is not None:
+            for event in answer_events(cached):
+                yield _valet_sse(event)
+            yield sse_event('done', cached)
+            return
+        
+        parser = ValetStreamParser()
+        chunks = []
+        attempts = valet_hedge_attempts(plan)
+        winner = {}
+        streamed_products = set()
+        try:
+            if attempts:
+                stream = stream_llm_hedged(attempts, plan['system_prompt'], temperature=0.8,
+                                           budget=hedge_budget(plan['hedge']), winner=winner,
+                                           user_prompt=plan['user_prompt'], usage=plan['usage'],
+                                           json_mode=plan['json_mode'], mode=plan['mode'])
+            else:
+                stream = stream_llm(plan['provider'], plan['api_key'], plan['model'],
+                                    plan['system_prompt'], temperature=0.8,
+                                    user_prompt=plan['user_prompt'], usage=plan['usage'],
+                                    json_mode=plan['json_mode'], mode=plan['mode'])
+            for chunk in stream:
+                if attempts and 'hedged' not in plan:
+                    use_hedge_winner(plan, attempts, winner['index'])
+                    yield sse_event('hedge', plan['hedged'])
+                chunks.append(chunk)
+                for event in parser.feed(chunk):
+                    event = ground_stream_event(plan, event, streamed_products)
+                    if event is not None:
+                        yield _valet_sse(event)
+            yield sse_event('done', finish_valet_answer(plan, parse_valet_text(''.join(chunks))))
+        except json.JSONDecodeError as e:
+            app.logger.error(f'JSON parse error: {e}')
+            yield sse_event('error', {'error': 'Failed to parse AI response', 'raw': ''.join(chunks)})
+        except GatewayOverloaded as e:
+            yield sse_event('error', {'error': str(e), 'retry_after': e.retry_after})
+        except Exception as e:
+            app.logger.exception('Valet stream failed')
+            yield sse_event('error', {'error': str(e)})
+    
+    return app.response_class(stream_with_context(generate()), mimetype='text/event-stream',
+                              headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/ai/query', methods=['POST'])
 def ai_query():
     """Process AI music query using local Llama model"""
@@ -2203,6 +2985,16 @@ def run_server(port=8080):
     
     # Kill any existing process on this port
     kill_process_on_port(port)
+
+    # Keep token totals recorded since the last periodic save
+    import atexit
+    atexit.register(LLM_TOKENS.close)
+
+    # SIGHUP forces a catalog reload without restarting the server. The
+    # handler only flags it: reloading here could deadlock on the store lock.
+    import signal
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda signum, frame: CATALOG_STORE.request_reload())
     
     print(f"\n🚀 iamtoxico Valet Server")
     print(f"📍 http://localhost:{port}")
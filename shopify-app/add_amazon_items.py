@@ -1,14 +1,14 @@
 
-import json
 import os
+import sys
 import time
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from catalog_writer import CatalogWriter
+
 def add_amazon_items():
     catalog_path = os.path.join(os.path.dirname(__file__), '../data/catalog.json')
     
-    with open(catalog_path, 'r') as f:
-        data = json.load(f)
-    
     # New items to add based on "Agent Autofill" search
     new_items = [
         {
@@ -77,20 +77,19 @@ def add_amazon_items():
         }
     ]
     
-    # Check for duplicates
-    existing_ids = {item['id'] for item in data['products']}
-    added_count = 0
-    
-    for item in new_items:
-        if item['id'] not in existing_ids:
-            data['products'].append(item)
-            print(f"Added: {item['title']}")
-            added_count += 1
-        else:
-            print(f"Skipped (duplicate): {item['title']}")
-            
-    with open(catalog_path, 'w') as f:
-        json.dump(data, f, indent=2)
+    with CatalogWriter(catalog_path) as catalog:
+        # Check for duplicates
+        added_count = 0
+        
+        for item in new_items:
+            if item['id'] not in catalog:
+                catalog.upsert([item])
+                print(f"Added: {item['title']}")
+                added_count += 1
+            else:
+                print(f"Skipped (duplicate): {item['title']}")
+                
+        catalog.commit(compact=True)
         
     print(f"\nSuccessfully added {added_count} Amazon items to catalog.")
 
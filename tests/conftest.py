@@ -14,6 +14,19 @@ if SHOPIFY_APP not in sys.path:
     sys.path.append(SHOPIFY_APP)  # append (not insert) to avoid shadowing root server
 
 
+# ---------------------------------------------------------------------------
+# Keep LLM token totals from test calls out of logs/llm_usage.json
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(scope='session', autouse=True)
+def llm_usage_path(tmp_path_factory):
+    """Session-scoped so it is set before any server.py import."""
+    path = tmp_path_factory.mktemp('logs') / 'llm_usage.json'
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv('LLM_USAGE_PATH', str(path))
+        yield path
+
+
 # ---------------------------------------------------------------------------
 # Catalog fixture
 # ---------------------------------------------------------------------------
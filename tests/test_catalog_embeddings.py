@@ -0,0 +1,91 @@
+"""Tests for catalog_embeddings.py: hashed embeddings and cosine top-k."""
+import pytest
+
+from catalog_embeddings import (EmbeddingIndex, HashingEmbedder, embeddings_for,
+                                embeddings_path_for, local_embedder)
+from catalog_store import CatalogSnapshot
+
+PRODUCTS = [
+    {'id': 1, 'name': 'Court Sneaker', 'category': 'shoes', 'vibes': ['streetwear'],
+     'description': 'White leather low-top'},
+    {'id': 2, 'name': 'Cabin Wool Slipper', 'category': 'slippers', 'vibes': ['cozy', 'winter'],
+     'activities': ['lounging']},
+    {'id': 3, 'name': 'Beach Towel', 'category': 'accessories', 'vibes': ['summer'],
+     'activities': ['beach', 'party']},
+    {'id': 4, 'name': 'Old Sneaker', 'category': 'shoes', 'active': False},
+]
+
+
+def _snapshot(products=PRODUCTS, digest='e1'):
+    return CatalogSnapshot({'products': products}, digest, 1)
+
+
+@pytest.fixture
+def index():
+    return EmbeddingIndex(_snapshot().items, HashingEmbedder(dim=256), 'e1')
+
+
+class TestHashingEmbedder:
+    def test_vectors_are_normalized_and_deterministic(self):
+        embedder = HashingEmbedder(dim=128)
+        vector = embedder.embed_query('cozy slippers')
+        assert vector == HashingEmbedder(dim=128).embed_query('cozy slippers')
+        assert sum(v * v for v in vector.values()) == pytest.approx(1.0)
+        assert all(0 <= bucket < 128 for bucket in vector)
+
+    def test_empty_text(self):
+        assert HashingEmbedder().embed_query('') == {}
+
+
+class TestEmbeddingIndex:
+    def test_top_ranks_by_similarity(self, index):
+        assert index.top('beach party', k=1)[0][0].id == 3
+        assert index.top('winter slippers', k=1)[0][0].id == 2
+
+    def test_typos_and_partial_words_match(self, index):
+        assert index.top('sneakr', k=1)[0][0].id == 1
+
+    def test_hash_collisions_are_not_matches(self, index):
+        assert index.top('zzqx', k=3) == []
+        assert index.top('the xylophone', k=3) == []
+        assert [item.id for item, _ in index.top('beach vacation', k=3)] == [3]
+
+    def test_inactive_and_excluded_products_are_skipped(self, index):
+        ids = [item.id for item, _ in index.top('sneaker', k=5)]
+        assert 4 not in ids
+        assert 1 not in [item.id for item, _ in index.top('sneaker', k=5, exclude=[1])]
+
+    def test_unchanged_products_are_reused(self, index):
+        changed = [dict(PRODUCTS[0], name='Court Sneaker II')] + PRODUCTS[1:]
+        rebuilt = EmbeddingIndex(_snapshot(changed).items, index.embedder, 'e2', previous=index)
+        assert rebuilt.reused == 2
+        assert rebuilt.top('court sneaker ii', k=1)[0][0].id == 1
+
+    def test_stats(self, index):
+        stats = index.stats()
+        assert stats['products'] == 3 and stats['model'] == 'hashing-256'
+
+
+class TestPersistence:
+    def test_round_trip(self, tmp_path):
+        pytest.importorskip('numpy')
+        embedder = HashingEmbedder(dim=64)
+        path = str(tmp_path / 'catalog.embeddings.npz')
+        built = EmbeddingIndex(_snapshot().items, embedder, 'e1')
+        built.save(path)
+        loaded = EmbeddingIndex.load(path, _snapshot().items, embedder, 'e1')
+        assert loaded is not None
+        assert [i.id for i, _ in loaded.top('beach', k=3)] == [i.id for i, _ in built.top('beach', k=3)]
+        assert EmbeddingIndex.load(path, _snapshot().items, embedder, 'other') is None
+
+    def test_embeddings_for_caches_per_digest(self, tmp_path):
+        embedder = HashingEmbedder(dim=64)
+        path = str(tmp_path / 'catalog.embeddings.npz')
+        first = embeddings_for(_snapshot(digest='c1'), embedder, path)
+        assert embeddings_for(_snapshot(digest='c1'), embedder, path) is first
+        assert embeddings_for(_snapshot(digest='c2'), embedder, path) is not first
+
+
+def test_paths_and_default_embedder():
+    assert embeddings_path_for('data/catalog.json') == 'data/catalog.embeddings.npz'
+    assert isinstance(local_embedder(''), HashingEmbedder)
@@ -0,0 +1,59 @@
+"""Tests for catalog_search.py: tokenizer, BM25 ranking, prefix matching."""
+import pytest
+
+from catalog_search import SearchIndex, tokenize
+from catalog_store import freeze, normalize_products
+
+
+PRODUCTS = [
+    {'id': 'robe', 'name': 'ugg robinson robe', 'brand': 'UGG', 'vibes': ['cozy'],
+     'description': 'plush robe for lounging'},
+    {'id': 'hoodie', 'title': 'Bedsure Wearable Blanket Hoodie', 'tags': ['blanket hoodie', 'warm']},
+    {'id': 'boot', 'name': 'blundstone 500', 'subtitle': 'chelsea boot', 'activities': ['hiking']},
+    {'id': 'loafer', 'name': 'gucci horsebit loafer', 'description': 'a boot it is not'},
+]
+
+
+@pytest.fixture
+def index():
+    return SearchIndex(normalize_products(freeze(PRODUCTS)))
+
+
+def _ids(hits):
+    return [item.id for item, _ in hits]
+
+
+class TestTokenize:
+    def test_lowercases_and_splits(self):
+        assert tokenize("Tod's Gommino-Driver") == ['tod', 's', 'gommino', 'driver']
+
+    def test_strips_accents(self):
+        assert tokenize('Café Crème') == ['cafe', 'creme']
+
+    def test_empty(self):
+        assert tokenize('') == []
+
+
+class TestSearchIndex:
+    def test_finds_by_title_fallback(self, index):
+        assert _ids(index.search('hoodie')) == ['hoodie']
+
+    def test_name_outranks_description(self, index):
+        assert _ids(index.search('boot'))[:2] == ['boot', 'loafer']
+
+    def test_prefix_typeahead(self, index):
+        assert _ids(index.search('blunds')) == ['boot']
+        assert index.search('blunds', prefix=False) == []
+
+    def test_mask_restricts_results(self, index):
+        assert _ids(index.search('boot', mask=0b1000)) == ['loafer']
+
+    def test_no_match(self, index):
+        assert index.search('yacht') == []
+
+    def test_reuses_unchanged_documents(self, index):
+        changed = [dict(p) for p in PRODUCTS]
+        changed[0]['description'] = 'now with pockets'
+        rebuilt = SearchIndex(normalize_products(freeze(changed)), previous=index)
+        assert rebuilt.reused == 3
+        assert _ids(rebuilt.search('pockets')) == ['robe']
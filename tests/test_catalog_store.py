@@ -0,0 +1,361 @@
+"""Tests for catalog_store.py: snapshot caching, hot reload, immutability."""
+import json
+import os
+import pytest
+
+import random
+
+from catalog_store import (
+    CatalogIndex, CatalogStore, FrozenDict, OffersEngine, ResponseCache,
+    Product, decode_cursor, encode_cursor, freeze, normalize_products, thaw,
+)
+from catalog_snapshot import read_snapshot, snapshot_path_for, write_snapshot
+from catalog_writer import CatalogWriter
+
+
+def _write(path, products):
+    with open(path, 'w') as f:
+        json.dump({'meta': {'brand': 'iamtoxico'}, 'products': products}, f)
+
+
+@pytest.fixture
+def catalog_file(tmp_path):
+    path = tmp_path / 'catalog.json'
+    _write(path, [{'id': 'a', 'category': 'underwear', 'vibes': ['bold']}])
+    return path
+
+
+class TestCatalogStore:
+    def test_snapshot_loads_products(self, catalog_file):
+        store = CatalogStore(str(catalog_file), check_interval=0)
+        snap = store.snapshot()
+        assert len(snap.products) == 1
+        assert snap.products[0]['id'] == 'a'
+        assert snap.generation == 1
+
+    def test_snapshot_is_cached_when_file_unchanged(self, catalog_file):
+        store = CatalogStore(str(catalog_file), check_interval=0)
+        assert store.snapshot() is store.snapshot()
+
+    def test_reloads_when_file_changes(self, catalog_file):
+        store = CatalogStore(str(catalog_file), check_interval=0)
+        first = store.snapshot()
+        _write(catalog_file, [{'id': 'a'}, {'id': 'b'}])
+        second = store.snapshot()
+        assert second is not first
+        assert len(second.products) == 2
+        assert second.digest != first.digest
+
+    def test_force_reload(self, catalog_file):
+        store = CatalogStore(str(catalog_file), check_interval=3600)
+        first = store.snapshot()
+        assert store.reload() is not first
+
+    def test_requested_reload_happens_on_next_snapshot(self, catalog_file):
+        store = CatalogStore(str(catalog_file), check_interval=3600)
+        first = store.snapshot()
+        store.request_reload()
+        assert store.snapshot() is not first
+        second = store.snapshot()
+        assert store.snapshot() is second
+
+    def test_keeps_last_snapshot_on_bad_json(self, catalog_file):
+        store = CatalogStore(str(catalog_file), check_interval=0)
+        first = store.snapshot()
+        with open(catalog_file, 'w') as f:
+            f.write('{"products": [')
+        assert store.reload() is first
+
+    def test_missing_file_returns_none(self, tmp_path):
+        store = CatalogStore(str(tmp_path / 'nope.json'), check_interval=0)
+        assert store.snapshot() is None
+
+
+class TestProduct:
+    def test_reconciles_name_and_title(self):
+        assert Product({'id': 'x', 'title': 'Robe'}, 0).name == 'Robe'
+        assert Product({'id': 'x', 'name': 'Thong', 'title': 'ignored'}, 0).name == 'Thong'
+
+    def test_reconciles_price_and_price_value(self):
+        assert Product({'priceValue': '95'}, 0).price == 95.0
+        assert Product({'price': 29.99, 'priceValue': 10}, 0).price == 29.99
+        assert Product({'price': 'call us'}, 0).price == 0.0
+
+    def test_price_label(self):
+        assert Product({'price': 28}, 0).price_label == '28'
+        assert Product({'price': 29.99}, 0).price_label == '29.99'
+
+    def test_defaults(self):
+        p = Product({'id': 'x', 'vibes': ['bold', None]}, 3)
+        assert p.position == 3
+        assert p.vibes == ('bold',)
+        assert p.activities == ()
+        assert p.active is True
+        assert not hasattr(p, '__dict__')
+
+    def test_keeps_no_reference_to_the_source_dict(self):
+        source = freeze({'id': 'x', 'name': 'Robe', 'notes': 'long free-form text'})
+        p = Product(source, 0)
+        assert all(getattr(p, slot) is not source for slot in Product.__slots__)
+
+    def test_equal_tag_lists_share_one_tuple(self):
+        a, b = normalize_products(freeze([{'vibes': ['bold', 'party']}, {'vibes': ['bold', 'party']}]))
+        assert a.vibes is b.vibes
+
+
+class TestCatalogIndex:
+    @pytest.fixture
+    def index(self):
+        products = freeze([
+            {'id': 'a', 'category': 'underwear', 'vibes': ['bold', 'party'], 'source': 'internal'},
+            {'id': 'b', 'category': 'underwear', 'vibes': ['chill'], 'active': False},
+            {'id': 'c', 'category': 'robes', 'vibes': ['party'], 'activities': ['spa'],
+             'sites': ['iamtoxico'], 'source': 'affiliate'},
+        ])
+        return CatalogIndex(normalize_products(products), products)
+
+    def _ids(self, products):
+        return [p['id'] for p in products]
+
+    def test_active_only_by_default(self, index):
+        assert self._ids(index.filter()) == ['a', 'c']
+        assert self._ids(index.filter(active_only=False)) == ['a', 'b', 'c']
+
+    def test_intersects_fields(self, index):
+        assert self._ids(index.filter(category='underwear', vibe='party')) == ['a']
+        assert self._ids(index.filter(activity='spa', source='affiliate')) == ['c']
+
+    def test_list_value_means_any_of(self, index):
+        assert self._ids(index.filter(active_only=False, vibe=['chill', 'bold'])) == ['a', 'b']
+
+    def test_empty_filters_are_ignored(self, index):
+        assert self._ids(index.filter(category=None, vibe='')) == ['a', 'c']
+
+    def test_unknown_value_matches_nothing(self, index):
+        assert index.filter(site='melodiclabs') == []
+
+    def test_page_orders_by_id_and_resumes(self, index):
+        mask = index.filter_mask(active_only=False)
+        first, key = index.page(mask, 2)
+        assert self._ids(first) == ['a', 'b']
+        rest, key2 = index.page(mask, 2, decode_cursor(encode_cursor(key)))
+        assert self._ids(rest) == ['c']
+        assert key2 is None
+
+    def test_bad_cursor_raises_value_error(self):
+        with pytest.raises(ValueError):
+            decode_cursor('not-a-cursor')
+
+
+class TestOffersEngine:
+    @pytest.fixture
+    def engine(self):
+        products = freeze([
+            {'id': 'a', 'category': 'underwear', 'vibes': ['bold', 'party']},
+            {'id': 'b', 'category': 'robes', 'vibes': ['chill'], 'activities': ['spa']},
+            {'id': 'c', 'category': 'robes', 'vibes': ['luxury'], 'activities': ['spa', 'pool']},
+            {'id': 'd', 'category': 'boots', 'active': False, 'vibes': ['party']},
+        ])
+        return OffersEngine(CatalogIndex(normalize_products(products), products))
+
+    def _ids(self, products):
+        return [p['id'] for p in products]
+
+    def test_scores_only_matching_products(self, engine):
+        scores = engine.score('spa day')
+        assert set(scores) == {1, 2}
+
+    def test_substring_matching_both_ways(self, engine):
+        # word contains tag, and tag contains word
+        assert 0 in engine.score('partyboat')
+        assert 0 in engine.score('part')
+
+    def test_top_ranks_by_tag_hits(self, engine):
+        top = engine.top('luxury spa pool', count=1, rng=random.Random(0))
+        assert self._ids(top) == ['c']
+
+    def test_inactive_and_excluded_are_skipped(self, engine):
+        top = engine.top('party', count=4, exclude=['a'], rng=random.Random(0))
+        assert 'a' not in self._ids(top)
+        assert 'd' not in self._ids(top)
+        assert len(top) == 2
+
+    def test_seeded_rng_is_reproducible(self, engine):
+        first = engine.top('robes', count=3, rng=random.Random(42))
+        second = engine.top('robes', count=3, rng=random.Random(42))
+        assert self._ids(first) == self._ids(second)
+
+    def test_fills_with_unmatched_products(self, engine):
+        top = engine.top('nothing matches', count=3, rng=random.Random(1))
+        assert sorted(self._ids(top)) == ['a', 'b', 'c']
+
+
+class TestFrozen:
+    def test_snapshot_is_read_only(self, catalog_file):
+        snap = CatalogStore(str(catalog_file)).snapshot()
+        with pytest.raises(TypeError):
+            snap.products[0]['id'] = 'changed'
+        assert isinstance(snap.products, tuple)
+
+    def test_frozen_dict_is_json_serializable(self):
+        frozen = freeze({'a': [1, {'b': 2}]})
+        assert isinstance(frozen, FrozenDict)
+        assert json.loads(json.dumps(frozen)) == {'a': [1, {'b': 2}]}
+
+    def test_thaw_round_trip(self):
+        data = {'a': [1, {'b': [2, 3]}]}
+        thawed = thaw(freeze(data))
+        assert thawed == data
+        thawed['a'].append(4)
+
+
+class TestResponseCache:
+    def test_get_put(self):
+        cache = ResponseCache()
+        assert cache.get('k', 'v1') is None
+        entry = cache.put('k', 'v1', b'{}')
+        assert cache.get('k', 'v1') is entry
+        assert entry.etag
+
+    def test_version_change_clears(self):
+        cache = ResponseCache()
+        cache.put('k', 'v1', b'{}')
+        assert cache.get('k', 'v2') is None
+
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_entries=2)
+        cache.put('a', 'v', b'1')
+        cache.put('b', 'v', b'2')
+        cache.get('a', 'v')
+        cache.put('c', 'v', b'3')
+        assert cache.get('b', 'v') is None
+        assert cache.get('a', 'v') is not None
+
+
+class TestBinarySnapshot:
+    def test_json_load_writes_snapshot(self, catalog_file):
+        CatalogStore(str(catalog_file)).snapshot()
+        assert os.path.exists(snapshot_path_for(str(catalog_file)))
+
+    def test_cold_start_uses_snapshot(self, catalog_file):
+        first = CatalogStore(str(catalog_file)).snapshot()
+        second = CatalogStore(str(catalog_file)).snapshot()
+        assert first.source == 'json'
+        assert second.source == 'snapshot'
+        assert second.digest == first.digest
+        assert second.index.filter(category='underwear')[0]['id'] == 'a'
+
+    def test_stale_snapshot_falls_back_to_json(self, catalog_file):
+        CatalogStore(str(catalog_file)).snapshot()
+        _write(catalog_file, [{'id': 'a'}, {'id': 'b'}])
+        snap = CatalogStore(str(catalog_file)).snapshot()
+        assert snap.source == 'json'
+        assert len(snap.products) == 2
+
+    def test_corrupt_snapshot_is_ignored(self, catalog_file):
+        with open(snapshot_path_for(str(catalog_file)), 'wb') as f:
+            f.write(b'IMTXCAT\x00garbage')
+        assert CatalogStore(str(catalog_file)).snapshot().source == 'json'
+
+    def test_read_snapshot_checks_source_signature(self, tmp_path):
+        path = str(tmp_path / 'c.snapshot')
+        write_snapshot(path, (1, 2, 3), 'abc', {'data': {'products': []}})
+        assert read_snapshot(path, (1, 2, 3)) == ('abc', {'data': {'products': []}})
+        assert read_snapshot(path, (1, 2, 4)) is None
+
+    def test_payload_checksum_is_verified(self, tmp_path):
+        path = tmp_path / 'c.snapshot'
+        write_snapshot(str(path), (1, 2, 3), 'abc', {'data': {'products': ['x']}})
+        blob = bytearray(path.read_bytes())
+        blob[-2] ^= 0xff
+        path.write_bytes(bytes(blob))
+        assert read_snapshot(str(path), (1, 2, 3)) is None
+
+    def test_writable_by_others_is_ignored(self, tmp_path):
+        path = tmp_path / 'c.snapshot'
+        write_snapshot(str(path), (1, 2, 3), 'abc', {'data': {'products': []}})
+        assert not os.stat(path).st_mode & 0o022
+        os.chmod(path, 0o666)
+        assert read_snapshot(str(path), (1, 2, 3)) is None
+
+    def test_disabled(self, catalog_file):
+        CatalogStore(str(catalog_file), use_binary_snapshot=False).snapshot()
+        assert not os.path.exists(snapshot_path_for(str(catalog_file)))
+
+
+class TestJournalDeltas:
+    @pytest.fixture
+    def store(self, catalog_file):
+        _write(catalog_file, [
+            {'id': 'b', 'category': 'robes', 'vibes': ['chill']},
+            {'id': 'a', 'category': 'underwear', 'vibes': ['bold']},
+        ])
+        store = CatalogStore(str(catalog_file), check_interval=0)
+        store.snapshot()
+        return store
+
+    def _commit(self, path, **ops):
+        with CatalogWriter(str(path)) as catalog:
+            catalog.upsert(ops.get('upsert', []))
+            catalog.set_active(ops.get('deactivate', []), False)
+            catalog.delete(ops.get('delete', []))
+            return catalog.commit()
+
+    def _assert_matches_rebuild(self, snap):
+        rebuilt = CatalogIndex(normalize_products(snap.products), snap.products)
+        assert snap.index.postings == rebuilt.postings
+        assert snap.index.active_mask == rebuilt.active_mask
+        assert snap.index.all_mask == rebuilt.all_mask
+        assert snap.index.sort_keys == rebuilt.sort_keys
+
+    def test_journal_append_is_applied_as_delta(self, store, catalog_file):
+        first = store.snapshot()
+        self._commit(catalog_file, upsert=[{'id': 'c', 'category': 'robes', 'vibes': ['party']}],
+                     deactivate=['b'])
+        snap = store.snapshot()
+        assert snap.source == 'journal'
+        assert snap.version == 2
+        assert snap.items[1] is first.items[1]  # unchanged product reused
+        assert [p['id'] for p in snap.index.filter(category='robes')] == ['c']
+        self._assert_matches_rebuild(snap)
+
+    def test_delete_rebuilds_positions(self, store, catalog_file):
+        self._commit(catalog_file, delete=['b'])
+        snap = store.snapshot()
+        assert [p['id'] for p in snap.products] == ['a']
+        assert snap.items[0].position == 0
+        self._assert_matches_rebuild(snap)
+
+    def test_delta_digest_matches_full_load(self, store, catalog_file):
+        self._commit(catalog_file, upsert=[{'id': 'c'}])
+        delta = store.snapshot()
+        full = CatalogStore(str(catalog_file), use_binary_snapshot=False).snapshot()
+        assert delta.digest == full.digest
+        assert thaw(delta.data) == thaw(full.data)
+
+    def test_changes_since(self, store, catalog_file):
+        self._commit(catalog_file, upsert=[{'id': 'c'}], deactivate=['a'])
+        snap = store.snapshot()
+        changes, has_more, reset = snap.changes_since(0, 10)
+        assert [(c['op'], c['version']) for c in changes] == [('upsert', 1), ('deactivate', 2)]
+        assert not has_more and not reset
+        changes, has_more, _ = snap.changes_since(0, 1)
+        assert [c['version'] for c in changes] == [1] and has_more
+        assert snap.changes_since(2, 10) == ([], False, False)
+        assert snap.changes_since(7, 10) == ([], False, True)
+
+    def test_changes_survive_binary_cold_start(self, store, catalog_file):
+        self._commit(catalog_file, upsert=[{'id': 'c'}])
+        store.snapshot()
+        cold = CatalogStore(str(catalog_file)).snapshot()
+        assert cold.source == 'snapshot'
+        assert [c['id'] for c in cold.changes_since(0, 10)[0]] == ['c']
+
+    def test_trimmed_history_requires_reset(self, catalog_file):
+        _write(catalog_file, [])
+        snap = CatalogStore(str(catalog_file), use_binary_snapshot=False).snapshot()
+        assert snap.changes_since(0, 10) == ([], False, False)
+        with open(catalog_file, 'w') as f:
+            json.dump({'version': 5, 'products': []}, f)
+        snap = CatalogStore(str(catalog_file), use_binary_snapshot=False).snapshot()
+        assert snap.changes_since(2, 10) == ([], False, True)
@@ -0,0 +1,124 @@
+"""Tests for catalog_writer.py: locked writes, journal replay, compaction."""
+import json
+import os
+import pytest
+
+from catalog_store import CatalogStore
+from catalog_writer import (
+    CatalogWriter, journal_path_for, load_catalog_data, read_journal,
+)
+
+
+@pytest.fixture
+def catalog_file(tmp_path):
+    path = tmp_path / 'catalog.json'
+    with open(path, 'w') as f:
+        json.dump({'meta': {'brand': 'iamtoxico'}, 'products': [
+            {'id': 'a', 'name': 'august thong', 'active': True},
+            {'id': 'b', 'name': 'boston clog', 'active': True},
+        ]}, f, indent=2)
+    return str(path)
+
+
+def _ids(data):
+    return [p['id'] for p in data['products']]
+
+
+class TestCatalogWriter:
+    def test_journal_only_commit_leaves_json_untouched(self, catalog_file):
+        before = open(catalog_file).read()
+        with CatalogWriter(catalog_file) as catalog:
+            catalog.upsert([{'id': 'c', 'name': 'crocs classic'}])
+            assert catalog.commit() == 1
+        assert open(catalog_file).read() == before
+        assert _ids(load_catalog_data(catalog_file)) == ['a', 'b', 'c']
+
+    def test_batched_operations_get_increasing_versions(self, catalog_file):
+        with CatalogWriter(catalog_file) as catalog:
+            catalog.upsert([{'id': 'c'}, {'id': 'a', 'name': 'renamed'}])
+            catalog.delete(['b', 'missing'])
+            catalog.patch('c', image='https://example.com/c.jpg')
+            catalog.set_active(['a'], False)
+            assert catalog.commit() == 5
+        versions = [e['version'] for e in read_journal(journal_path_for(catalog_file))]
+        assert versions == [1, 2, 3, 4, 5]
+        data = load_catalog_data(catalog_file)
+        assert _ids(data) == ['a', 'c']
+        assert data['products'][0] == {'id': 'a', 'name': 'renamed', 'active': False}
+        assert data['products'][1]['image'] == 'https://example.com/c.jpg'
+
+    def test_compact_folds_journal_into_json(self, catalog_file):
+        with CatalogWriter(catalog_file) as catalog:
+            catalog.delete(['a'])
+            catalog.commit(compact=True)
+        with open(catalog_file) as f:
+            on_disk = json.load(f)
+        assert _ids(on_disk) == ['b']
+        assert on_disk['version'] == 1
+        # Journal history is kept, but already folded entries are not replayed
+        assert _ids(load_catalog_data(catalog_file)) == ['b']
+
+    def test_compact_keeps_file_mode(self, catalog_file):
+        os.chmod(catalog_file, 0o664)
+        with CatalogWriter(catalog_file) as catalog:
+            catalog.delete(['a'])
+            catalog.commit(compact=True)
+        assert os.stat(catalog_file).st_mode & 0o777 == 0o664
+
+    def test_uncommitted_changes_are_discarded(self, catalog_file):
+        with CatalogWriter(catalog_file) as catalog:
+            catalog.delete(['a', 'b'])
+        assert _ids(load_catalog_data(catalog_file)) == ['a', 'b']
+        assert not os.path.exists(journal_path_for(catalog_file))
+
+    def test_delete_removes_duplicate_ids(self, catalog_file):
+        with CatalogWriter(catalog_file) as catalog:
+            catalog.products.append({'id': 'a', 'name': 'dupe'})
+            catalog.commit(compact=True)
+        with CatalogWriter(catalog_file) as catalog:
+            catalog.delete(['a'])
+            catalog.commit()
+        assert _ids(load_catalog_data(catalog_file)) == ['b']
+
+    def test_insert_never_replaces(self, catalog_file):
+        with CatalogWriter(catalog_file) as catalog:
+            assert catalog.insert([{'id': 'a', 'name': 'new'}, {'id': 'a', 'name': 'newer'},
+                                   {'id': 'c'}]) == ['a-2', 'a-3', 'c']
+            catalog.commit()
+        data = load_catalog_data(catalog_file)
+        assert _ids(data) == ['a', 'b', 'a-2', 'a-3', 'c']
+        assert data['products'][0]['name'] == 'august thong'
+
+    def test_unreadable_catalog_releases_the_lock(self, catalog_file):
+        with open(catalog_file, 'w') as f:
+            f.write('{"products": [')
+        writer = CatalogWriter(catalog_file)
+        with pytest.raises(ValueError):
+            writer.__enter__()
+        assert writer._lock_file is None
+        fcntl = pytest.importorskip('fcntl')
+        with open(writer.lock_path, 'a') as other:
+            fcntl.flock(other.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)  # would raise if still held
+
+    def test_upsert_requires_id(self, catalog_file):
+        with CatalogWriter(catalog_file) as catalog:
+            with pytest.raises(ValueError):
+                catalog.upsert([{'name': 'no id'}])
+
+    def test_torn_journal_line_is_ignored(self, catalog_file):
+        with CatalogWriter(catalog_file) as catalog:
+            catalog.upsert([{'id': 'c'}])
+            catalog.commit()
+        with open(journal_path_for(catalog_file), 'a') as f:
+            f.write('{"op": "delete", "id": "a", "vers')
+        assert _ids(load_catalog_data(catalog_file)) == ['a', 'b', 'c']
+
+    def test_store_sees_journal_changes(self, catalog_file):
+        store = CatalogStore(catalog_file, check_interval=0, use_binary_snapshot=False)
+        assert len(store.snapshot().products) == 2
+        with CatalogWriter(catalog_file) as catalog:
+            catalog.upsert([{'id': 'c'}])
+            catalog.commit()
+        snap = store.snapshot()
+        assert [p['id'] for p in snap.products] == ['a', 'b', 'c']
+        assert snap.data['version'] == 1
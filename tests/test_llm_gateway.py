@@ -0,0 +1,160 @@
+"""Tests for llm_gateway.py: per-provider limits and backpressure."""
+import asyncio
+import contextvars
+import threading
+
+import pytest
+
+from llm_gateway import GatewayOverloaded, LLMGateway, parse_limits
+
+
+@pytest.fixture
+def gateway():
+    gw = LLMGateway(provider_limit=2, provider_limits={'groq': 1},
+                    max_waiting=2, queue_timeout=0.5)
+    yield gw
+    gw.close()
+
+
+class TestLLMGateway:
+    def test_run_returns_coroutine_result(self, gateway):
+        async def double(x):
+            return x * 2
+        assert gateway.run('gemini', double, 21) == 42
+
+    def test_errors_propagate_and_release_slot(self, gateway):
+        async def boom():
+            raise ValueError('nope')
+        for _ in range(3):  # would deadlock if the slot leaked
+            with pytest.raises(ValueError):
+                gateway.run('groq', boom)
+        assert gateway.stats()['providers']['groq']['failed'] == 3
+
+    def test_concurrency_is_capped_per_provider(self, gateway):
+        peak = {'now': 0, 'max': 0}
+
+        async def work():
+            peak['now'] += 1
+            peak['max'] = max(peak['max'], peak['now'])
+            await asyncio.sleep(0.05)
+            peak['now'] -= 1
+
+        async def many():
+            await asyncio.gather(*(gateway.arun('gemini', work) for _ in range(4)))
+
+        asyncio.run_coroutine_threadsafe(many(), gateway.loop).result(5)
+        assert peak['max'] == 2
+        stats = gateway.stats()['providers']['gemini']
+        assert stats['completed'] == 4 and stats['in_flight'] == 0
+
+    def test_queue_timeout_rejects(self, gateway):
+        release = threading.Event()
+
+        async def hold():
+            await gateway.loop.run_in_executor(None, release.wait)
+
+        blocker = asyncio.run_coroutine_threadsafe(gateway.arun('groq', hold), gateway.loop)
+        try:
+            with pytest.raises(GatewayOverloaded) as info:
+                gateway.run('groq', asyncio.sleep, 0)
+            assert info.value.provider == 'groq'
+        finally:
+            release.set()
+            blocker.result(5)
+        assert gateway.stats()['providers']['groq']['rejected'] == 1
+
+    def test_full_queue_rejects_immediately(self):
+        gw = LLMGateway(provider_limit=1, max_waiting=0, queue_timeout=30)
+        release = threading.Event()
+
+        async def hold():
+            await gw.loop.run_in_executor(None, release.wait)
+
+        blocker = asyncio.run_coroutine_threadsafe(gw.arun('groq', hold), gw.loop)
+        try:
+            with pytest.raises(GatewayOverloaded, match='queue full'):
+                gw.run('groq', asyncio.sleep, 0, timeout=5)
+        finally:
+            release.set()
+            blocker.result(5)
+            gw.close()
+
+    def test_slot_holds_a_permit(self, gateway):
+        with gateway.slot('groq'):
+            with pytest.raises(GatewayOverloaded):
+                gateway.run('groq', asyncio.sleep, 0)
+        gateway.run('groq', asyncio.sleep, 0)
+
+    def test_run_sees_callers_context(self, gateway):
+        var = contextvars.ContextVar('request', default=None)
+
+        async def read():
+            return var.get()
+        var.set('request-1')
+        assert gateway.run('gemini', read) == 'request-1'
+        var.set('request-2')
+        assert gateway.run('gemini', read) == 'request-2'
+
+    def test_run_timeout_cancels_call(self, gateway):
+        cancelled = threading.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+        with pytest.raises(TimeoutError):
+            gateway.run('gemini', slow, timeout=0.05)
+        assert cancelled.wait(2)
+
+
+class TestHedge:
+    @staticmethod
+    def _after(seconds, value=None, error=None):
+        async def call():
+            await asyncio.sleep(seconds)
+            if error:
+                raise error
+            return value
+        return call
+
+    def test_backup_wins_when_primary_is_slow(self, gateway):
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        index, result = gateway.hedge([('gemini', slow, ()),
+                                       ('groq', self._after(0, 'fast'), ())], budget=0.05, timeout=2)
+        assert (index, result) == (1, 'fast')
+        gateway.run('gemini', asyncio.sleep, 0.01)  # lets the cancellation land
+        assert cancelled.is_set()
+        assert gateway.stats()['hedging'] == {'calls': 1, 'backups_launched': 1, 'backup_wins': 1}
+
+    def test_primary_within_budget_skips_backup(self, gateway):
+        backup = self._after(0, 'backup')
+        index, result = gateway.hedge([('gemini', self._after(0, 'primary'), ()),
+                                       ('groq', backup, ())], budget=1, timeout=2)
+        assert (index, result) == (0, 'primary')
+        assert gateway.stats()['hedging']['backups_launched'] == 0
+
+    def test_primary_failure_launches_backup_immediately(self, gateway):
+        index, result = gateway.hedge([('gemini', self._after(0, error=ValueError('down')), ()),
+                                       ('groq', self._after(0, 'ok'), ())], budget=10, timeout=2)
+        assert (index, result) == (1, 'ok')
+
+    def test_all_failing_raises_primary_error(self, gateway):
+        with pytest.raises(ValueError, match='primary'):
+            gateway.hedge([('gemini', self._after(0.05, error=ValueError('primary')), ()),
+                           ('groq', self._after(0, error=ValueError('backup')), ())],
+                          budget=0.01, timeout=2)
+
+
+def test_parse_limits():
+    assert parse_limits('groq:8, gemini:16,bad,x:y') == {'groq': 8, 'gemini': 16}
+    assert parse_limits('') == {}
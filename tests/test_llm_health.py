@@ -0,0 +1,114 @@
+"""Tests for llm_health.py: circuit breakers and health-aware routing."""
+import time
+
+import pytest
+
+from llm_gateway import GatewayOverloaded
+from llm_health import CLOSED, HALF_OPEN, OPEN, CircuitOpen, CircuitBreaker, ProviderHealth, is_failure_status
+
+
+def _fail(breaker, n, seconds=0.1):
+    for _ in range(n):
+        breaker.record(False, seconds, breaker.begin())
+
+
+class TestCircuitBreaker:
+    def test_opens_on_error_rate(self):
+        breaker = CircuitBreaker(min_calls=4, error_rate=0.5, cooldown=60)
+        breaker.record(True, 0.1)
+        breaker.record(True, 0.1)
+        _fail(breaker, 1)
+        assert breaker.state == CLOSED
+        _fail(breaker, 1)
+        assert breaker.state == OPEN
+        assert breaker.begin() is None
+        assert 1 <= breaker.retry_after() <= 60
+
+    def test_opens_on_slow_calls(self):
+        breaker = CircuitBreaker(min_calls=2, error_rate=0.5, slow_seconds=1, cooldown=60)
+        breaker.record(True, 2.0)
+        breaker.record(True, 3.0)
+        assert breaker.state == OPEN
+
+    def test_needs_min_calls(self):
+        breaker = CircuitBreaker(min_calls=5)
+        _fail(breaker, 4)
+        assert breaker.state == CLOSED
+
+    def test_old_calls_leave_the_window(self):
+        breaker = CircuitBreaker(window=0.05, min_calls=2)
+        _fail(breaker, 1)
+        time.sleep(0.06)
+        _fail(breaker, 1)
+        assert breaker.state == CLOSED
+        assert breaker.snapshot()['calls'] == 1
+
+    def test_half_open_probe_closes_on_success(self):
+        breaker = CircuitBreaker(min_calls=1, cooldown=0.02, probes=1)
+        _fail(breaker, 1)
+        time.sleep(0.03)
+        assert breaker.state == HALF_OPEN
+        probe = breaker.begin()
+        assert probe is True
+        assert breaker.begin() is None  # one probe at a time
+        breaker.record(True, 0.1, probe)
+        assert breaker.state == CLOSED
+        assert breaker.snapshot()['calls'] == 0
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(min_calls=1, cooldown=0.02)
+        _fail(breaker, 1)
+        time.sleep(0.03)
+        breaker.record(False, 0.1, breaker.begin())
+        assert breaker.state == OPEN
+        assert breaker.times_opened == 2
+
+    def test_cancelled_probe_frees_slot(self):
+        breaker = CircuitBreaker(min_calls=1, cooldown=0.02)
+        _fail(breaker, 1)
+        time.sleep(0.03)
+        breaker.cancel(breaker.begin())
+        assert breaker.begin() is True
+
+
+class TestProviderHealth:
+    def test_begin_raises_circuit_open(self):
+        health = ProviderHealth(min_calls=1, cooldown=60)
+        health.record('groq', False, 0.1)
+        with pytest.raises(CircuitOpen) as info:
+            health.begin('groq')
+        assert isinstance(info.value, GatewayOverloaded)
+        assert info.value.provider == 'groq'
+
+    def test_route_keeps_healthy_provider(self):
+        health = ProviderHealth()
+        assert health.route('gemini', ['groq']) == 'gemini'
+        assert health.reroutes == 0
+
+    def test_route_picks_healthiest_alternative(self):
+        health = ProviderHealth(min_calls=1, error_rate=0.5, cooldown=60)
+        health.record('gemini', False, 0.1)
+        health.record('groq', True, 2.0)
+        health.record('cerebras', True, 0.2)
+        assert health.route('gemini', ['gemini', 'groq', 'cerebras']) == 'cerebras'
+        assert health.reroutes == 1
+
+    def test_route_with_everything_open(self):
+        health = ProviderHealth(min_calls=1, cooldown=60)
+        health.record('gemini', False, 0.1)
+        health.record('groq', False, 0.1)
+        assert health.route('gemini', ['groq']) is None
+
+    def test_stats(self):
+        health = ProviderHealth(min_calls=10)
+        health.record('groq', True, 0.2)
+        health.record('groq', False, 0.4)
+        snap = health.stats()['providers']['groq']
+        assert snap['state'] == CLOSED
+        assert snap['calls'] == 2 and snap['error_rate'] == 0.5
+        assert snap['avg_seconds'] == pytest.approx(0.3)
+
+
+def test_is_failure_status():
+    assert is_failure_status(503) and is_failure_status(429)
+    assert not is_failure_status(200) and not is_failure_status(401)
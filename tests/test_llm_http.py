@@ -0,0 +1,141 @@
+"""Tests for llm_http.py: pooled keep-alive sessions, timeouts, reuse metrics."""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import llm_http
+from llm_http import ProviderSessions
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if body.get('sleep'):
+            time.sleep(body['sleep'])
+        out = json.dumps({'echo': body}).encode('utf-8')
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+        except (BrokenPipeError, ConnectionResetError):  # client timed out
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_address[1]}/'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def sessions():
+    pool = ProviderSessions(pool_size=2, read_timeout=5, http2=False)
+    yield pool
+    pool.close()
+
+
+class TestProviderSessions:
+    def test_one_session_per_provider(self, sessions):
+        assert sessions.session('openai') is sessions.session('openai')
+        assert sessions.session('openai') is not sessions.session('groq')
+
+    def test_connections_are_reused(self, server, sessions):
+        for n in range(5):
+            response = sessions.post('openai', server, json={'n': n})
+            assert response.json() == {'echo': {'n': n}}
+        stats = sessions.stats()['providers']['openai']
+        assert stats['requests'] == 5
+        assert stats['connections_opened'] == 1
+        assert stats['connections_reused'] == 4
+        assert stats['reuse_ratio'] == 0.8
+        assert stats['http_versions'] == {'HTTP/1.1': 5}
+
+    def test_read_timeout_raises_requests_timeout(self, server):
+        pool = ProviderSessions(read_timeout=0.1, http2=False)
+        with pytest.raises(requests.Timeout):
+            pool.post('slow', server, json={'sleep': 0.5})
+        stats = pool.stats()['providers']['slow']
+        assert stats['timeouts'] == 1 and stats['errors'] == 1
+        pool.close()
+
+    def test_connection_error_is_counted(self, sessions):
+        with pytest.raises(requests.ConnectionError):
+            sessions.post('down', 'http://127.0.0.1:9/')
+        assert sessions.stats()['providers']['down']['errors'] == 1
+
+    def test_stream_yields_lines_and_reuses_connection(self, server, sessions):
+        for _ in range(2):
+            with sessions.stream('claude', server, json={'n': 1}) as response:
+                assert response.status_code == 200
+                assert list(response.lines()) == ['{"echo": {"n": 1}}']
+        stats = sessions.stats()['providers']['claude']
+        assert stats['requests'] == 2
+        assert stats['connections_opened'] == 1
+
+    def test_apost_runs_on_event_loop(self, server, sessions):
+        async def both():
+            return await asyncio.gather(sessions.apost('groq', server, json={'n': 1}),
+                                        sessions.apost('groq', server, json={'n': 2}))
+        responses = asyncio.run(both())
+        assert [r.json()['echo']['n'] for r in responses] == [1, 2]
+        assert sessions.stats()['providers']['groq']['requests'] == 2
+
+    def test_apost_without_httpx_is_bounded_by_max_threads(self, monkeypatch):
+        monkeypatch.setattr(llm_http, 'httpx', None)
+        pool = ProviderSessions(http2=False, max_threads=2)
+        lock = threading.Lock()
+        running = {'now': 0, 'max': 0}
+
+        def slow_post(provider, url, **kwargs):
+            with lock:
+                running['now'] += 1
+                running['max'] = max(running['max'], running['now'])
+            time.sleep(0.05)
+            with lock:
+                running['now'] -= 1
+            return 'ok'
+
+        monkeypatch.setattr(pool, 'post', slow_post)
+
+        async def many():
+            return await asyncio.gather(*(pool.apost('groq', 'http://x/') for _ in range(6)))
+        assert asyncio.run(many()) == ['ok'] * 6
+        assert running['max'] == 2
+        pool.close()
+
+    def test_httpx_transport(self, server):
+        pytest.importorskip('httpx')
+        pytest.importorskip('h2')
+        pool = ProviderSessions(read_timeout=5, http2=True)
+        assert pool.post('groq', server, json={'n': 1}).json() == {'echo': {'n': 1}}
+        response = asyncio.run(pool.apost('groq', server, json={'n': 2}))
+        assert response.json() == {'echo': {'n': 2}}
+        with pool.stream('groq', server, json={'n': 3}) as streamed:
+            assert list(streamed.lines()) == ['{"echo": {"n": 3}}']
+        stats = pool.stats()
+        assert stats['transport'] == 'httpx-h2'
+        assert stats['providers']['groq']['requests'] == 3
+        pool.close()
+
+    def test_stats_report_configuration(self, sessions):
+        stats = sessions.stats()
+        assert stats['transport'] == 'requests'
+        assert stats['pool_size'] == 2
+        assert stats['read_timeout'] == 5
@@ -0,0 +1,123 @@
+"""Tests for query_analytics.py: hourly rollups of the query log."""
+import gzip
+import json
+import os
+import time
+
+import pytest
+
+from query_analytics import HourRollup, RollupStore, log_segments, parse_entries, read_lines
+from query_log import rotated_path
+
+NOW = time.mktime((2026, 10, 17, 15, 30, 0, 0, 0, -1))
+
+
+def _entry(minutes_ago=0, **fields):
+    entry = {'timestamp': NOW - minutes_ago * 60, 'query': 'q', 'mode': 'default',
+             'provider': 'groq', 'model': 'm', 'detected_category': None}
+    entry.update(fields)
+    return entry
+
+
+def _write(path, entries, gz=False, tail=''):
+    opener = gzip.open if gz else open
+    with opener(path, 'at', encoding='utf-8') as f:
+        f.write(''.join(json.dumps(e) + '\n' for e in entries) + tail)
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'user_queries.jsonl')
+
+
+class TestReading:
+    def test_segments_oldest_first_then_live(self, log_path):
+        for day, n in (('2026-10-17', 2), ('2026-10-16', 1), ('2026-10-17', 10)):
+            _write(rotated_path(log_path, day, n), [_entry()], gz=True)
+        _write(rotated_path(log_path, '2026-10-17', 3, compressed=False), [_entry()])
+        _write(log_path, [_entry()])
+        names = [os.path.basename(p) for p in log_segments(log_path)]
+        assert names == ['user_queries-2026-10-16.1.jsonl.gz', 'user_queries-2026-10-17.2.jsonl.gz',
+                         'user_queries-2026-10-17.3.jsonl', 'user_queries-2026-10-17.10.jsonl.gz',
+                         'user_queries.jsonl']
+
+    def test_partial_and_bad_lines(self, log_path):
+        _write(log_path, [_entry()], tail='not json\n{"timestamp": 1, "query": "half')
+        assert len(list(read_lines(log_path))) == 2
+        assert len(list(parse_entries(read_lines(log_path)))) == 1
+
+
+class TestHourRollup:
+    def test_latency_percentiles_are_bucket_bounds(self):
+        rollup = HourRollup()
+        for ms in [40] * 50 + [300] * 45 + [1500] * 4 + [90000]:
+            rollup.add({'latency_ms': ms})
+        assert rollup.latency_percentiles() == {'count': 100, 'p50': 50, 'p95': 500, 'p99': 2000}
+        restored = HourRollup.from_dict(json.loads(json.dumps(rollup.to_dict())))
+        assert restored.latency == rollup.latency and restored.count == 100
+
+    def test_tail_beyond_last_bucket_is_overflow(self):
+        rollup = HourRollup()
+        for ms in [300] * 90 + [75000] * 10:
+            rollup.add({'latency_ms': ms})
+        assert rollup.latency_percentiles() == {'count': 100, 'p50': 500, 'p95': '>60000', 'p99': '>60000'}
+
+    def test_no_latency_recorded(self):
+        rollup = HourRollup()
+        rollup.add({'mode': 'default'})
+        assert rollup.latency_percentiles() == {'count': 0, 'p50': None, 'p95': None, 'p99': None}
+        assert 'latency' not in rollup.to_dict()
+
+
+class TestRollupStore:
+    def test_summary_counts_dimensions(self, log_path):
+        _write(rotated_path(log_path, '2026-10-17', 1), [_entry(120, provider='gemini')] * 2, gz=True)
+        _write(log_path, [_entry(5, mode='product', detected_category='boots', latency_ms=800),
+                          _entry(0, latency_ms=1200)])
+        summary = RollupStore(log_path).summary(hours=24, now=NOW)
+        assert summary['count'] == 4
+        assert summary['provider'] == [('gemini', 2), ('groq', 2)]
+        assert dict(summary['mode']) == {'default': 3, 'product': 1}
+        assert dict(summary['detected_category']) == {'unknown': 3, 'boots': 1}
+        assert summary['latency_ms']['count'] == 2
+        assert [h['count'] for h in summary['hourly']] == [2, 2]
+        assert os.path.exists(os.path.join(os.path.dirname(log_path), 'rollups', '2026-10-17.json'))
+
+    def test_window_and_top(self, log_path):
+        _write(log_path, [_entry(60 * 30)] + [_entry(0, model=f'm{i % 3}') for i in range(6)])
+        summary = RollupStore(log_path).summary(hours=2, top=2, now=NOW)
+        assert summary['count'] == 6
+        assert len(summary['model']) == 2
+
+    def test_update_reads_only_new_lines(self, log_path):
+        store = RollupStore(log_path)
+        _write(log_path, [_entry()] * 3, tail='{"timestamp": ')
+        assert store.update()['entries'] == 3
+        assert store.update()['entries'] == 0
+        _write(log_path, [], tail=f'{NOW}, "mode": "x"}}\n')
+        assert store.update()['entries'] == 1
+        assert store.summary(hours=1, now=NOW, update=False)['count'] == 4
+
+    def test_rotated_live_file_resumes_at_offset(self, log_path):
+        store = RollupStore(log_path)
+        _write(log_path, [_entry(), _entry()])
+        store.update()
+        _write(log_path, [_entry(provider='late')])
+        # The writer rotates and compresses the live file, then starts a new one
+        segment = rotated_path(log_path, '2026-10-17', 1)
+        with open(log_path, 'rb') as src, gzip.open(segment, 'wb') as dst:
+            dst.write(src.read())
+        os.remove(log_path)
+        _write(log_path, [_entry(provider='fresh')])
+        assert store.update()['entries'] == 2
+        summary = store.summary(hours=1, now=NOW, update=False)
+        assert summary['count'] == 4
+        assert dict(summary['provider']) == {'groq': 2, 'late': 1, 'fresh': 1}
+        assert store.update()['entries'] == 0
+
+    def test_rebuild_rescans_everything(self, log_path):
+        store = RollupStore(log_path)
+        _write(log_path, [_entry()] * 2)
+        store.update()
+        assert store.rebuild()['entries'] == 2
+        assert store.summary(hours=1, now=NOW, update=False)['count'] == 2
@@ -0,0 +1,92 @@
+"""Tests for query_log.py: the background query log writer."""
+import gzip
+import json
+import time
+
+import pytest
+
+import query_log
+from query_log import QueryLogWriter, rotated_path
+
+
+def _lines(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / 'logs' / 'user_queries.jsonl')
+
+
+class TestQueryLogWriter:
+    def test_entries_are_written_in_order(self, log_path):
+        writer = QueryLogWriter(log_path, batch_size=3)
+        for i in range(7):
+            assert writer.log({'query': f'q{i}'})
+        assert writer.flush()
+        assert [e['query'] for e in _lines(log_path)] == [f'q{i}' for i in range(7)]
+        stats = writer.stats()
+        assert stats['written'] == 7 and stats['dropped'] == 0
+        assert stats['batches'] == 3  # two full batches, then the flush
+        writer.close()
+
+    def test_partial_batch_is_flushed_after_interval(self, log_path):
+        writer = QueryLogWriter(log_path, batch_size=100, flush_interval=0.05)
+        writer.log({'query': 'alone'})
+        deadline = time.monotonic() + 2
+        while writer.stats()['written'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert _lines(log_path) == [{'query': 'alone'}]
+        writer.close()
+
+    def test_full_queue_drops_and_counts(self, log_path):
+        writer = QueryLogWriter(log_path, max_queue=2)
+        writer._start = lambda: None  # no writer thread yet
+        results = [writer.log({'query': f'q{i}'}) for i in range(3)]
+        assert results == [True, True, False]
+        assert writer.stats()['dropped'] == 1
+        del writer._start
+        writer.log({'query': 'q3'})
+        assert writer.flush()
+        assert [e['query'] for e in _lines(log_path)] == ['q0', 'q1', 'q3']
+        writer.close()
+
+    def test_rotates_and_compresses_by_size(self, log_path):
+        writer = QueryLogWriter(log_path, batch_size=1, max_bytes=60)
+        for i in range(4):
+            writer.log({'query': 'x' * 30, 'n': i})
+            writer.flush()
+        writer.close()
+        day = query_log._day()
+        segments = [rotated_path(log_path, day, n) for n in (1, 2, 3)]
+        rotated = []
+        for segment in segments:
+            with gzip.open(segment, 'rt', encoding='utf-8') as f:
+                rotated.extend(json.loads(line)['n'] for line in f)
+        assert rotated == [0, 1, 2]
+        assert [e['n'] for e in _lines(log_path)] == [3]
+        assert writer.stats()['rotations'] == 3
+
+    def test_rotates_when_the_day_changes(self, log_path, monkeypatch):
+        days = iter(['2026-10-16', '2026-10-16', '2026-10-17'])
+        current = ['']
+        monkeypatch.setattr(query_log, '_day', lambda timestamp=None: current[0])
+        writer = QueryLogWriter(log_path, compress=False)
+        for query in ('late', 'later', 'next day'):
+            current[0] = next(days)
+            writer.log({'query': query})
+            writer.flush()
+        writer.close()
+        assert [e['query'] for e in _lines(rotated_path(log_path, '2026-10-16', 1, compressed=False))] == \
+            ['late', 'later']
+        assert [e['query'] for e in _lines(log_path)] == ['next day']
+
+    def test_unserializable_entry_is_skipped(self, log_path):
+        writer = QueryLogWriter(log_path)
+        writer.log({'query': object()})
+        writer.log({'query': 'ok'})
+        assert writer.flush()
+        assert _lines(log_path) == [{'query': 'ok'}]
+        assert writer.stats()['errors'] == 1
+        writer.close()
@@ -0,0 +1,90 @@
+"""Tests for request_trace.py: spans, Server-Timing and the span ring buffer."""
+import time
+
+from request_trace import TraceRecorder, Trace, current_trace, end_trace, span, start_trace
+
+
+class TestSpans:
+    def test_span_outside_a_trace_is_a_noop(self):
+        assert current_trace() is None
+        with span('catalog'):
+            pass
+        assert current_trace() is None
+
+    def test_spans_are_recorded_into_the_current_trace(self):
+        trace, token = start_trace('/api/valet')
+        try:
+            with span('catalog'):
+                time.sleep(0.01)
+            with span('llm', 'groq'):
+                pass
+        finally:
+            end_trace(token)
+        assert current_trace() is None
+        assert [(stage, provider) for stage, _, provider in trace.spans] == [('catalog', None), ('llm', 'groq')]
+        assert trace.spans[0][1] >= 0.01
+
+    def test_span_records_on_error(self):
+        trace, token = start_trace('/api/valet')
+        try:
+            try:
+                with span('parse'):
+                    raise ValueError('bad json')
+            except ValueError:
+                pass
+        finally:
+            end_trace(token)
+        assert [s[0] for s in trace.spans] == ['parse']
+
+    def test_server_timing_sums_repeated_stages(self):
+        trace = Trace('/api/valet')
+        trace.add('llm.network', 0.2, 'groq')
+        trace.add('llm.network', 0.1, 'groq')
+        trace.add('parse', 0.0015)
+        assert trace.server_timing(total=0.5) == \
+            'llm.network;dur=300.0;desc="groq", parse;dur=1.5, total;dur=500.0'
+
+
+class TestTraceRecorder:
+    def _trace(self, endpoint, **stages):
+        trace = Trace(endpoint)
+        for stage, seconds in stages.items():
+            trace.add(stage, seconds, 'groq' if stage == 'llm' else None)
+        return trace
+
+    def test_percentiles_per_endpoint_stage_and_provider(self):
+        recorder = TraceRecorder()
+        for i in range(1, 101):
+            recorder.record(self._trace('/api/valet', llm=i / 100, parse=0.001), total=i / 50)
+        stats = recorder.percentiles()
+        llm = stats[('/api/valet', 'llm', 'groq')]
+        assert llm['count'] == 100
+        assert (llm['p50'], llm['p95'], llm['p99']) == (0.51, 0.96, 1.0)
+        assert stats[('/api/valet', 'total', '')]['p50'] == 1.02
+        assert recorder.requests == 100
+
+    def test_ring_buffer_keeps_recent_spans(self):
+        recorder = TraceRecorder(size=4)
+        for seconds in (9.0, 9.0, 0.1, 0.1):
+            recorder.record(self._trace('/api/valet', parse=seconds), total=seconds)
+        assert recorder.percentiles()[('/api/valet', 'parse', '')]['p99'] == 0.1
+
+    def test_prometheus_sum_and_count_are_cumulative(self):
+        recorder = TraceRecorder(size=1)  # keeps only the last 'total' span
+        for _ in range(5):
+            recorder.record(self._trace('/api/valet', parse=0.5), total=1.0)
+        text = recorder.prometheus()
+        assert 'valet_stage_seconds_count{endpoint="/api/valet",stage="parse"} 5' in text
+        assert 'valet_stage_seconds_sum{endpoint="/api/valet",stage="parse"} 2.500000' in text
+        # Evicted from the ring buffer: no quantiles, but the counters stay
+        assert 'valet_stage_seconds{endpoint="/api/valet",stage="parse",quantile' not in text
+        assert 'valet_stage_seconds_count{endpoint="/api/valet",stage="total"} 5' in text
+
+    def test_prometheus_text(self):
+        recorder = TraceRecorder()
+        recorder.record(self._trace('/api/valet', llm=0.25), total=0.3)
+        text = recorder.prometheus()
+        assert '# TYPE valet_stage_seconds summary' in text
+        assert 'valet_stage_seconds{endpoint="/api/valet",stage="llm",provider="groq",quantile="0.95"} 0.250000' in text
+        assert 'valet_stage_seconds_count{endpoint="/api/valet",stage="total"} 1' in text
+        assert text.endswith('valet_traced_requests_total 1\n')
@@ -6,6 +6,7 @@ to avoid name-clash with shopify-app/server.py.
 import sys
 import os
 import json
+import asyncio
 import time
 import importlib.util
 import pytest
@@ -47,6 +48,15 @@ def client(app):
     return app.test_client()
 
 
+@pytest.fixture(autouse=True)
+def threaded_llm_transport(monkeypatch):
+    """Run apost() through post() in the thread pool, as without httpx, so
+    tests that patch LLM_HTTP.post also cover the gateway path and never
+    reach a provider through httpx.AsyncClient."""
+    import llm_http
+    monkeypatch.setattr(llm_http, "httpx", None)
+
+
 class TestStaticServing:
     def test_root_returns_index_html(self, client):
         rv = client.get("/")
@@ -210,3 +220,747 @@ class TestServerHelpers:
         finally:
             server_mod.SPOTIFY_CLIENT_ID = original_id
             server_mod.SPOTIFY_CLIENT_SECRET = original_secret
+
+
+class TestCatalogStoreIntegration:
+    def test_loaders_share_one_snapshot(self, server_mod):
+        assert server_mod.load_catalog() is server_mod.load_product_catalog()
+
+    def test_reload_endpoint_is_disabled_without_token(self, client, server_mod):
+        with patch.object(server_mod, "VALET_ADMIN_TOKEN", ""):
+            assert client.post("/api/valet/catalog/reload").status_code == 403
+
+    def test_reload_endpoint_requires_token(self, client, server_mod):
+        with patch.object(server_mod, "VALET_ADMIN_TOKEN", "s3cret"):
+            assert client.post("/api/valet/catalog/reload").status_code == 401
+            rv = client.post("/api/valet/catalog/reload", headers={"X-Admin-Token": "s3cret"})
+        assert rv.status_code == 200
+        data = rv.get_json()
+        assert data["loaded"] is True
+        assert data["products"] > 0
+
+
+class TestOffersAPI:
+    def test_offers_respects_count(self, client):
+        rv = client.post("/api/valet/offers", json={"context": "beach party", "count": 5})
+        assert rv.status_code == 200
+        assert len(rv.get_json()["offers"]) == 5
+
+    def test_offers_seed_is_reproducible(self, client):
+        body = {"context": "cozy lounge spa", "count": 4, "seed": 7}
+        first = client.post("/api/valet/offers", json=body).get_json()["offers"]
+        second = client.post("/api/valet/offers", json=body).get_json()["offers"]
+        assert [p["id"] for p in first] == [p["id"] for p in second]
+
+    def test_offers_excludes_ids(self, client):
+        first = client.post("/api/valet/offers", json={"context": "party", "count": 1, "seed": 1})
+        excluded = first.get_json()["offers"][0]["id"]
+        rv = client.post("/api/valet/offers",
+                         json={"context": "party", "count": 10, "exclude": [excluded]})
+        assert excluded not in [p["id"] for p in rv.get_json()["offers"]]
+
+    def test_offers_rank_by_embedding_similarity(self, client, server_mod):
+        item = next(i for i in server_mod.CATALOG_STORE.snapshot().items if i.active and i.name)
+        rv = client.post("/api/valet/offers", json={"context": item.name, "count": 1})
+        assert rv.get_json()["offers"][0]["id"] == item.id
+
+    def test_gibberish_context_falls_back_to_seeded_tag_matching(self, client, server_mod):
+        import random
+        body = {"context": "zzqx", "count": 3, "seed": 11}
+        offers = client.post("/api/valet/offers", json=body).get_json()["offers"]
+        snapshot = server_mod.CATALOG_STORE.snapshot()
+        assert server_mod.catalog_embeddings(snapshot).top("zzqx", k=3) == []
+        expected = snapshot.offers.top("zzqx", count=3, rng=random.Random(11), exclude=[])
+        assert [p["id"] for p in offers] == [p["id"] for p in expected]
+
+    def test_offers_rejects_bad_count(self, client):
+        rv = client.post("/api/valet/offers", json={"context": "party", "count": "many"})
+        assert rv.status_code == 400
+
+
+class TestCatalogResponseCache:
+    def test_repeat_query_is_cache_hit(self, client):
+        client.get("/api/valet/catalog?category=robes&vibes=luxury")
+        rv = client.get("/api/valet/catalog?vibes=luxury&category=robes")
+        assert rv.headers["X-Cache"] == "HIT"
+
+    def test_etag_round_trip_returns_304(self, client):
+        rv = client.get("/api/valet/products?category=underwear")
+        etag = rv.headers["ETag"]
+        assert etag
+        rv2 = client.get("/api/valet/products?category=underwear",
+                         headers={"If-None-Match": etag})
+        assert rv2.status_code == 304
+        assert rv2.data == b""
+
+    def test_cached_body_matches_fresh_body(self, client, server_mod):
+        server_mod.RESPONSE_CACHE.clear()
+        fresh = client.get("/api/valet/products?source=internal")
+        cached = client.get("/api/valet/products?source=internal")
+        assert fresh.headers["X-Cache"] == "MISS"
+        assert cached.data == fresh.data
+
+    def test_reload_with_new_digest_invalidates(self, client, server_mod):
+        client.get("/api/valet/products")
+        server_mod.RESPONSE_CACHE.get(("/api/valet/products", ()), "other-digest")
+        rv = client.get("/api/valet/products")
+        assert rv.headers["X-Cache"] == "MISS"
+
+
+class TestCatalogPagination:
+    def test_limit_returns_page_and_cursor(self, client):
+        rv = client.get("/api/valet/catalog?limit=24")
+        data = rv.get_json()
+        assert data["count"] == 24
+        assert data["total"] > 24
+        assert data["next_cursor"]
+
+    def test_cursor_walks_every_product_once(self, client):
+        everything = client.get("/api/valet/catalog").get_json()
+        seen = []
+        cursor = None
+        while True:
+            url = "/api/valet/catalog?limit=50" + (f"&cursor={cursor}" if cursor else "")
+            page = client.get(url).get_json()
+            seen.extend(p["id"] for p in page["products"])
+            cursor = page["next_cursor"]
+            if not cursor:
+                break
+        assert sorted(seen) == sorted(p["id"] for p in everything["products"])
+
+    def test_fields_projection(self, client):
+        data = client.get("/api/valet/catalog?limit=5&fields=name,price,image").get_json()
+        for p in data["products"]:
+            assert set(p) <= {"id", "name", "price", "image"}
+
+    def test_include_empty_omits_blocks(self, client):
+        data = client.get("/api/valet/catalog?include=").get_json()
+        assert "meta" not in data and "vibes" not in data and "activities" not in data
+        data = client.get("/api/valet/catalog?include=meta").get_json()
+        assert "meta" in data and "vibes" not in data
+
+    def test_bad_limit_and_cursor_rejected(self, client):
+        assert client.get("/api/valet/catalog?limit=0").status_code == 400
+        assert client.get("/api/valet/catalog?limit=abc").status_code == 400
+        assert client.get("/api/valet/catalog?cursor=!!!").status_code == 400
+
+
+class TestCatalogChangesAPI:
+    @pytest.fixture
+    def store(self, server_mod, tmp_path):
+        from catalog_store import CatalogStore
+        path = tmp_path / "catalog.json"
+        path.write_text(json.dumps({"products": [{"id": "a", "name": "august thong"}]}))
+        store = CatalogStore(str(path), check_interval=0)
+        with patch.object(server_mod, "CATALOG_STORE", store):
+            yield store
+
+    def _commit(self, store, **fields):
+        from catalog_writer import CatalogWriter
+        with CatalogWriter(store.path) as catalog:
+            catalog.patch("a", **fields)
+            return catalog.commit()
+
+    def test_feed_returns_changes_since_version(self, client, store):
+        start = client.get("/api/valet/catalog").get_json()["version"]
+        self._commit(store, price=32)
+        data = client.get(f"/api/valet/catalog/changes?since={start}").get_json()
+        assert data["version"] == start + 1
+        assert data["changes"][0]["fields"] == {"price": 32}
+        assert data["reset"] is False
+        data = client.get(f"/api/valet/catalog/changes?since={data['version']}").get_json()
+        assert data["changes"] == []
+
+    def test_feed_is_cached_until_next_change(self, client, store):
+        self._commit(store, price=30)
+        first = client.get("/api/valet/catalog/changes?since=0")
+        assert client.get("/api/valet/catalog/changes?since=0").headers["X-Cache"] == "HIT"
+        self._commit(store, price=31)
+        second = client.get("/api/valet/catalog/changes?since=0")
+        assert second.headers["X-Cache"] == "MISS"
+        assert second.get_json()["count"] == first.get_json()["count"] + 1
+
+    def test_future_version_requires_reset(self, client, store):
+        assert client.get("/api/valet/catalog/changes?since=99").get_json()["reset"] is True
+
+    def test_bad_params_rejected(self, client, store):
+        assert client.get("/api/valet/catalog/changes?since=abc").status_code == 400
+        assert client.get("/api/valet/catalog/changes?since=-1").status_code == 400
+        assert client.get("/api/valet/catalog/changes?limit=0").status_code == 400
+
+
+class TestLLMConnectionPool:
+    def test_call_llm_uses_pooled_session(self, server_mod):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"choices": [{"message": {"content": "hi"}}]}
+        with patch.object(server_mod.LLM_HTTP, "post", return_value=response) as post:
+            assert server_mod.call_llm("groq", "key", None, "prompt") == "hi"
+        assert post.call_args[0][0] == "groq"
+
+    def test_overloaded_provider_returns_503(self, client, server_mod):
+        from llm_gateway import GatewayOverloaded
+        with patch.object(server_mod, "call_llm", side_effect=GatewayOverloaded("groq", "queue full", 2)), \
+                patch.object(server_mod, "log_user_query"):
+            rv = client.post("/api/valet", json={"query": "sunset overload", "cache": False})
+        assert rv.status_code == 503
+        assert rv.headers["Retry-After"] == "2"
+
+    def test_gateway_endpoint(self, client, server_mod):
+        async def ok():
+            return "ok"
+        server_mod.LLM_GATEWAY.run("gemini", ok)
+        data = client.get("/api/valet/gateway").get_json()
+        assert data["providers"]["gemini"]["completed"] >= 1
+
+    def test_connections_endpoint(self, client):
+        data = client.get("/api/valet/connections").get_json()
+        assert data["pool_size"] > 0
+        assert "providers" in data
+
+
+class TestValetPrompt:
+    def test_product_mode_prompt_uses_normalized_items(self, client, server_mod):
+        captured = {}
+
+        def fake_llm(provider, api_key, model, prompt, temperature=0.8, user_prompt=None, usage=None,
+                     json_mode=False, mode=None):
+            captured["prompt"] = user_prompt
+            return '{"response": "ok", "mode": "product", "products": []}'
+
+        with patch.object(server_mod, "call_llm", side_effect=fake_llm), \
+                patch.object(server_mod, "log_user_query"):
+            rv = client.post("/api/valet", json={"query": "show me boots", "product_mode": True})
+        assert rv.status_code == 200
+        assert rv.get_json()["_product_mode"] is True
+        assert "Catalog products for this request:" in captured["prompt"]
+        assert "$" in captured["prompt"].split("Catalog products for this request:")[1]
+
+
+class TestProductGrounding:
+    def test_products_are_resolved_to_catalog_ids(self, client, server_mod):
+        item = next(i for i in server_mod.CATALOG_STORE.snapshot().items if i.active and i.name)
+        answer = {"response": "ok", "mode": "product", "products": [
+            {"name": item.name.upper(), "reason": "fits"}, {"name": "Imaginary Hovercraft 9000"}]}
+        with patch.object(server_mod, "call_llm", return_value=json.dumps(answer)), \
+                patch.object(server_mod, "log_user_query"):
+            data = client.post("/api/valet", json={"query": item.name, "product_mode": True,
+                                                   "cache": False}).get_json()
+        assert [p["id"] for p in data["products"]] == [item.id]
+        assert data["products"][0]["name"] == item.name
+        assert data["_grounding"]["dropped"] == 1
+        assert data["_grounding"]["candidates"] == server_mod.VALET_GROUNDING_K
+
+    def test_streamed_product_cards_are_grounded(self, client, server_mod):
+        item = next(i for i in server_mod.CATALOG_STORE.snapshot().items if i.active and i.name)
+        answer = json.dumps({"response": "ok", "mode": "product", "products": [
+            {"name": "Imaginary Hovercraft 9000"}, {"name": item.name}]})
+        with patch.object(server_mod, "stream_llm", side_effect=lambda *a, **k: iter([answer])), \
+                patch.object(server_mod, "log_user_query"):
+            rv = client.post("/api/valet/stream", json={"query": "shop", "product_mode": True, "cache": False})
+            events = _sse(rv.get_data(as_text=True))
+        cards = [d for e, d in events if e == "card"]
+        assert [(c["index"], c["card"]["id"]) for c in cards] == [(0, item.id)]
+
+
+class TestValetResponseCache:
+    @pytest.fixture
+    def fake_llm(self, server_mod):
+        from valet_cache import ValetResponseCache
+        llm = MagicMock(return_value='{"response": "ok", "mode": "default"}')
+        with patch.object(server_mod, "VALET_CACHE", ValetResponseCache()), \
+                patch.object(server_mod, "call_llm", llm), \
+                patch.object(server_mod, "log_user_query"):
+            yield llm
+
+    def test_near_identical_query_is_a_hit(self, client, fake_llm):
+        first = client.post("/api/valet", json={"query": "cozy hoodie"}).get_json()
+        second = client.post("/api/valet", json={"query": "Cozy hoodie!"}).get_json()
+        assert first["_cache"] == "miss"
+        assert second["_cache"] == "hit"
+        assert second["response"] == "ok"
+        assert fake_llm.call_count == 1
+
+    def test_mode_and_provider_change_key(self, client, fake_llm):
+        client.post("/api/valet", json={"query": "sunset drinks"})
+        client.post("/api/valet", json={"query": "sunset drinks", "product_mode": True})
+        client.post("/api/valet", json={"query": "sunset drinks", "llm": {"provider": "groq", "apiKey": "k"}})
+        assert fake_llm.call_count == 3
+
+    def test_cache_false_bypasses(self, client, fake_llm):
+        client.post("/api/valet", json={"query": "cozy hoodie"})
+        data = client.post("/api/valet", json={"query": "cozy hoodie", "cache": False}).get_json()
+        assert data["_cache"] == "miss"
+        assert fake_llm.call_count == 2
+
+
+def _sse(body):
+    """Parse an SSE body into [(event, data), ...]"""
+    events = []
+    for frame in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in frame.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class TestValetStream:
+    ANSWER = '```json\n{"response": "Sunset mood.", "mode": "default", "songs": [{"title": "A"}, {"title": "B"}]}\n```'
+
+    @pytest.fixture
+    def fake_stream(self, server_mod):
+        from valet_cache import ValetResponseCache
+        chunks = [self.ANSWER[i:i + 9] for i in range(0, len(self.ANSWER), 9)]
+        llm = MagicMock(side_effect=lambda *a, **k: iter(chunks))
+        with patch.object(server_mod, "VALET_CACHE", ValetResponseCache()), \
+                patch.object(server_mod, "stream_llm", llm), \
+                patch.object(server_mod, "log_user_query"):
+            yield llm
+
+    def test_streams_text_cards_and_done(self, client, fake_stream):
+        rv = client.post("/api/valet/stream", json={"query": "sunset drinks"})
+        assert rv.mimetype == "text/event-stream"
+        events = _sse(rv.get_data(as_text=True))
+        assert events[0][0] == "meta"
+        text = "".join(d["delta"] for e, d in events if e == "response")
+        assert text == "Sunset mood."
+        cards = [d for e, d in events if e == "card"]
+        assert [(c["section"], c["index"], c["card"]["title"]) for c in cards] == [
+            ("songs", 0, "A"), ("songs", 1, "B")]
+        assert events[-1][0] == "done"
+        assert events[-1][1]["_cache"] == "miss"
+
+    def test_cache_hit_is_replayed_as_events(self, client, fake_stream):
+        client.post("/api/valet/stream", json={"query": "sunset drinks"}).get_data()
+        events = _sse(client.post("/api/valet/stream", json={"query": "Sunset drinks"}).get_data(as_text=True))
+        assert fake_stream.call_count == 1
+        assert [e for e, _ in events] == ["meta", "response", "card", "card", "done"]
+        assert events[-1][1]["_cache"] == "hit"
+
+    def test_provider_error_becomes_error_event(self, client, server_mod):
+        with patch.object(server_mod, "stream_llm", side_effect=ValueError("boom")), \
+                patch.object(server_mod, "log_user_query"):
+            events = _sse(client.post("/api/valet/stream", json={"query": "sunset", "cache": False}).get_data(as_text=True))
+        assert events[-1] == ("error", {"error": "boom"})
+
+    def test_requires_query(self, client):
+        assert client.post("/api/valet/stream", json={}).status_code == 400
+
+
+class TestHedgedValet:
+    @pytest.fixture(autouse=True)
+    def quiet(self, server_mod):
+        with patch.object(server_mod, "log_user_query"):
+            yield
+
+    def test_hedge_attempts_pick_configured_backup(self, server_mod):
+        with patch.dict(server_mod.LLM_PROVIDERS["groq"], default_key="gk"), \
+                patch.object(server_mod, "LLM_HEDGE_PROVIDERS", ["gemini", "groq"]):
+            assert server_mod.hedge_attempts("gemini", "", "", True) == [
+                ("gemini", "", ""), ("groq", "", "")]
+        explicit = {"provider": "cerebras", "apiKey": "ck", "model": "m"}
+        assert server_mod.hedge_attempts("groq", "k", "", explicit)[1] == ("cerebras", "ck", "m")
+
+    def test_slow_primary_loses_to_backup(self, client, server_mod):
+        async def fake_acall(provider, api_key, model, prompt, temperature=0.8, user_prompt=None, usage=None,
+                             json_mode=False, mode=None):
+            if provider == "gemini":
+                await asyncio.sleep(5)
+            return '{"response": "fast", "mode": "default"}'
+
+        with patch.object(server_mod, "acall_llm", fake_acall):
+            rv = client.post("/api/valet", json={
+                "query": "sunset hedge", "cache": False,
+                "llm": {"provider": "gemini", "apiKey": "k",
+                        "hedge": {"provider": "groq", "apiKey": "g", "budget_ms": 20}}})
+        data = rv.get_json()
+        assert data["response"] == "fast"
+        assert data["_hedge"] == {"primary": "gemini", "winner": "groq"}
+        assert data["_provider"] == "groq"
+
+    def test_stream_hedge_picks_first_token(self, client, server_mod):
+        def fake_stream(provider, *args, **kwargs):
+            if provider == "gemini":
+                time.sleep(0.5)
+            yield '{"response": "%s", "mode": "default"}' % provider
+
+        with patch.object(server_mod, "stream_llm", fake_stream):
+            rv = client.post("/api/valet/stream", json={
+                "query": "sunset hedge stream", "cache": False,
+                "llm": {"provider": "gemini", "apiKey": "k",
+                        "hedge": {"provider": "groq", "apiKey": "g", "budget_ms": 20}}})
+            events = _sse(rv.get_data(as_text=True))
+        assert ("hedge", {"primary": "gemini", "winner": "groq"}) in events
+        assert events[-1][1]["response"] == "groq"
+
+    def test_stream_hedge_falls_back_after_primary_error(self, server_mod):
+        def fake_stream(provider, *args, **kwargs):
+            if provider == "gemini":
+                raise ValueError("down")
+            yield "ok"
+
+        winner = {}
+        with patch.object(server_mod, "stream_llm", fake_stream):
+            chunks = list(server_mod.stream_llm_hedged(
+                [("gemini", "", ""), ("groq", "", "")], "prompt", budget=10, winner=winner))
+        assert chunks == ["ok"] and winner == {"index": 1}
+
+
+class TestProviderHealth:
+    @pytest.fixture
+    def health(self, server_mod):
+        from llm_health import ProviderHealth
+        fresh = ProviderHealth(min_calls=2, error_rate=0.5, cooldown=60)
+        with patch.object(server_mod, "LLM_HEALTH", fresh):
+            yield fresh
+
+    def test_5xx_responses_open_the_breaker(self, server_mod, health):
+        response = MagicMock(status_code=503, text="unavailable")
+        with patch.object(server_mod.LLM_HTTP, "post", return_value=response) as post:
+            for _ in range(2):
+                with pytest.raises(ValueError):
+                    server_mod.call_llm("groq", "key", None, "prompt")
+            from llm_health import CircuitOpen
+            with pytest.raises(CircuitOpen):
+                server_mod.call_llm("groq", "key", None, "prompt")
+        assert post.call_count == 2  # third call failed fast
+
+    def test_client_errors_do_not_count(self, server_mod, health):
+        response = MagicMock(status_code=401, text="bad key")
+        with patch.object(server_mod.LLM_HTTP, "post", return_value=response):
+            for _ in range(3):
+                with pytest.raises(ValueError):
+                    server_mod.call_llm("groq", "key", None, "prompt")
+        assert health.breaker("groq").state == "closed"
+
+    def test_valet_routes_around_open_provider(self, client, server_mod, health):
+        health.record("gemini", False, 1.0)
+        health.record("gemini", False, 1.0)
+        llm = MagicMock(return_value='{"response": "ok", "mode": "default"}')
+        only_groq = {name: dict(config, default_key="gk" if name == "groq" else "")
+                     for name, config in server_mod.LLM_PROVIDERS.items()}
+        with patch.dict(server_mod.LLM_PROVIDERS, only_groq), \
+                patch.object(server_mod, "call_llm", llm), \
+                patch.object(server_mod, "log_user_query"):
+            data = client.post("/api/valet", json={"query": "sunset route", "cache": False}).get_json()
+        assert llm.call_args[0][0] == "groq"
+        assert data["_provider"] == "groq"
+        assert data["_routed_from"] == "gemini"
+
+    def test_health_endpoint(self, client, health):
+        health.record("gemini", False, 1.0)
+        health.record("gemini", False, 1.0)
+        data = client.get("/api/valet/health").get_json()
+        assert data["providers"]["gemini"]["state"] == "open"
+        assert data["providers"]["gemini"]["retry_after"] >= 1
+        assert "configured" in data
+
+
+class TestPromptCaching:
+    def test_static_prefix_is_sent_as_cacheable_system_content(self, server_mod):
+        build = server_mod.build_llm_request
+        _, claude, _ = build("claude", "k", "m", "STATIC", user_prompt="query")
+        assert claude["system"] == [{"type": "text", "text": "STATIC", "cache_control": {"type": "ephemeral"}}]
+        assert claude["messages"] == [{"role": "user", "content": "query"}]
+        _, openai, _ = build("openai", "k", "m", "STATIC", user_prompt="query")
+        assert [m["role"] for m in openai["messages"]] == ["system", "user"]
+        _, gemini, _ = build("gemini", "k", "m", "STATIC", user_prompt="query")
+        assert gemini["systemInstruction"] == {"parts": [{"text": "STATIC"}]}
+        _, cohere, _ = build("cohere", "k", "m", "STATIC", user_prompt="query")
+        assert cohere["preamble"] == "STATIC" and cohere["message"] == "query"
+
+    def test_single_prompt_is_still_one_user_message(self, server_mod):
+        _, payload, _ = server_mod.build_llm_request("groq", "k", "m", "whole prompt")
+        assert payload["messages"] == [{"role": "user", "content": "whole prompt"}]
+
+    @pytest.mark.parametrize("provider,body,expected", [
+        ("claude", {"content": [{"text": "hi"}], "usage": {"input_tokens": 20, "cache_read_input_tokens": 900,
+                                                           "output_tokens": 50}},
+         {"input_tokens": 920, "output_tokens": 50, "cached_tokens": 900}),
+        ("openai", {"choices": [{"message": {"content": "hi"}}],
+                    "usage": {"prompt_tokens": 1200, "completion_tokens": 40,
+                              "prompt_tokens_details": {"cached_tokens": 1024}}},
+         {"input_tokens": 1200, "output_tokens": 40, "cached_tokens": 1024}),
+        ("gemini", {"candidates": [{"content": {"parts": [{"text": "hi"}]}}],
+                    "usageMetadata": {"promptTokenCount": 800, "candidatesTokenCount": 30,
+                                      "cachedContentTokenCount": 600}},
+         {"input_tokens": 800, "output_tokens": 30, "cached_tokens": 600}),
+    ])
+    def test_call_llm_reports_cached_tokens(self, server_mod, provider, body, expected):
+        response = MagicMock(status_code=200)
+        response.json.return_value = body
+        usage = {}
+        with patch.object(server_mod.LLM_HTTP, "post", return_value=response):
+            assert server_mod.call_llm(provider, "key", None, "static", user_prompt="q", usage=usage) == "hi"
+        assert usage == expected
+
+    def test_claude_stream_usage(self, server_mod):
+        lines = ['data: {"type": "message_start", "message": {"usage": {"input_tokens": 10, '
+                 '"cache_read_input_tokens": 500, "output_tokens": 1}}}',
+                 'data: {"type": "content_block_delta", "delta": {"text": "hi"}}',
+                 'data: {"type": "message_delta", "usage": {"output_tokens": 12}}']
+        response = MagicMock(status_code=200)
+        response.lines.return_value = iter(lines)
+        ctx = MagicMock()
+        ctx.__enter__.return_value = response
+        usage = {}
+        with patch.object(server_mod.LLM_HTTP, "stream", MagicMock(return_value=ctx)):
+            assert "".join(server_mod.stream_llm("claude", "k", None, "static", user_prompt="q", usage=usage)) == "hi"
+        assert usage == {"input_tokens": 510, "output_tokens": 12, "cached_tokens": 500}
+
+    def test_valet_splits_prompt_and_returns_usage(self, client, server_mod):
+        captured = {}
+
+        def fake_llm(provider, api_key, model, prompt, temperature=0.8, user_prompt=None, usage=None,
+                     json_mode=False, mode=None):
+            captured.update(prompt=prompt, user_prompt=user_prompt)
+            usage.update(input_tokens=900, output_tokens=60, cached_tokens=700)
+            return '{"response": "ok", "mode": "default"}'
+
+        with patch.object(server_mod, "call_llm", side_effect=fake_llm), \
+                patch.object(server_mod, "log_user_query"):
+            data = client.post("/api/valet", json={"query": "sunset usage", "cache": False}).get_json()
+        assert "sunset usage" not in captured["prompt"]
+        assert captured["user_prompt"].endswith('User Query: "sunset usage"')
+        assert data["_usage"]["cached_tokens"] == 700
+
+
+
+class TestStructuredOutput:
+    def test_json_mode_per_provider(self, server_mod):
+        build = server_mod.build_llm_request
+        _, groq, _ = build("groq", "k", "m", "STATIC", user_prompt="q", json_mode=True)
+        assert groq["response_format"] == {"type": "json_object"}
+        _, cohere, _ = build("cohere", "k", "m", "STATIC", user_prompt="q", json_mode=True)
+        assert cohere["response_format"] == {"type": "json_object"}
+        _, gemini, _ = build("gemini", "k", "m", "STATIC", user_prompt="q", json_mode=True)
+        assert gemini["generationConfig"]["responseMimeType"] == "application/json"
+        _, perplexity, _ = build("perplexity", "k", "m", "STATIC", user_prompt="q", json_mode=True)
+        assert perplexity["response_format"]["json_schema"]["schema"]["required"] == ["response"]
+        _, claude, _ = build("claude", "k", "m", "STATIC", user_prompt="q", json_mode=True)
+        assert claude["messages"][-1] == {"role": "assistant", "content": "{"}
+        _, plain, _ = build("groq", "k", "m", "STATIC", user_prompt="q")
+        assert "response_format" not in plain
+
+    def test_claude_prefill_is_put_back(self, server_mod):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"content": [{"text": '"response": "ok"}'}]}
+        with patch.object(server_mod.LLM_HTTP, "post", return_value=response):
+            text = server_mod.call_llm("claude", "k", None, "static", user_prompt="q", json_mode=True)
+        assert text == '{"response": "ok"}'
+
+    def test_claude_stream_prefill_rides_first_chunk(self, server_mod):
+        response = MagicMock(status_code=200)
+        response.lines.return_value = iter([
+            'data: {"type": "content_block_delta", "delta": {"text": "\\"response\\""}}',
+            'data: {"type": "content_block_delta", "delta": {"text": ": 1}"}}'])
+        ctx = MagicMock()
+        ctx.__enter__.return_value = response
+        with patch.object(server_mod.LLM_HTTP, "stream", MagicMock(return_value=ctx)):
+            chunks = list(server_mod.stream_llm("claude", "k", None, "static", user_prompt="q", json_mode=True))
+        assert chunks == ['{"response"', ": 1}"]
+
+    def test_valet_repairs_answer_instead_of_failing(self, client, server_mod):
+        captured = {}
+
+        def fake_llm(provider, api_key, model, prompt, temperature=0.8, user_prompt=None, usage=None,
+                     json_mode=False, mode=None):
+            captured["json_mode"] = json_mode
+            return ('Here you go!\n```json\n{"response": "ok", "songs": [{"title": "A", "artist": "B"},'
+                    ' {"vibe": "no title"},], "mode": "default"}\n```\nEnjoy!')
+
+        with patch.object(server_mod, "call_llm", side_effect=fake_llm), \
+                patch.object(server_mod, "log_user_query"):
+            rv = client.post("/api/valet", json={"query": "repair me", "cache": False})
+        assert rv.status_code == 200
+        data = rv.get_json()
+        assert captured["json_mode"] is True
+        assert data["songs"] == [{"title": "A", "artist": "B"}]
+        assert data["_repaired"] == ["trailing comma", "songs: dropped 1"]
+
+    def test_unparseable_answer_is_still_an_error(self, client, server_mod):
+        with patch.object(server_mod, "call_llm", return_value="I can't answer that."), \
+                patch.object(server_mod, "log_user_query"):
+            rv = client.post("/api/valet", json={"query": "no json", "cache": False})
+        assert rv.status_code == 500
+        assert rv.get_json()["raw"] == "I can't answer that."
+
+
+class TestQueryLog:
+    def test_log_user_query_only_queues(self, server_mod):
+        writer = MagicMock()
+        with patch.object(server_mod, "QUERY_LOG", writer), \
+                patch.object(server_mod, "open", create=True, side_effect=AssertionError("no file I/O")):
+            server_mod.log_user_query("boots", {"query": "boots", "llm": {"apiKey": "secret"}, "product_mode": True},
+                                      {"mode": "product", "_provider": "groq", "_model": "m"})
+        entry = writer.log.call_args[0][0]
+        assert entry["query"] == "boots" and entry["provider"] == "groq" and entry["mode"] == "product"
+        assert entry["client_data"] == {"product_mode": True}
+
+    def test_query_log_stats_endpoint(self, client, server_mod):
+        data = client.get("/api/valet/query-log").get_json()
+        assert {"queued", "written", "dropped", "rotations"} <= set(data)
+
+    def test_analytics_endpoint(self, client, server_mod, tmp_path):
+        log = tmp_path / "user_queries.jsonl"
+        log.write_text(json.dumps({"timestamp": time.time(), "mode": "product", "provider": "groq"}) + "\n")
+        store = server_mod.RollupStore(str(log))
+        with patch.object(server_mod, "QUERY_ANALYTICS", store):
+            data = client.get("/api/valet/analytics?hours=2&top=3").get_json()
+        assert data["count"] == 1
+        assert data["mode"] == [["product", 1]]
+        assert (tmp_path / "rollups" / "state.json").exists()
+
+
+class TestTracing:
+    def test_valet_returns_server_timing_and_logs_latency(self, client, server_mod):
+        def fake_llm(*args, **kwargs):
+            return '{"response": "ok", "mode": "default"}'
+
+        with patch.object(server_mod, "call_llm", side_effect=fake_llm), \
+                patch.object(server_mod, "QUERY_LOG") as query_log:
+            rv = client.post("/api/valet", json={"query": "trace me", "cache": False})
+        assert rv.status_code == 200
+        stages = [part.split(";")[0] for part in rv.headers["Server-Timing"].split(", ")]
+        assert {"catalog", "prompt", "cache", "parse", "log", "total"} <= set(stages)
+        assert isinstance(query_log.log.call_args[0][0]["latency_ms"], int)
+        assert server_mod.current_trace() is None
+
+    def test_provider_network_span_crosses_to_gateway_loop(self, server_mod):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"choices": [{"message": {"content": "hi"}}]}
+        trace, token = server_mod.start_trace("/api/valet")
+        try:
+            with patch.object(server_mod.LLM_HTTP, "post", return_value=response):
+                assert server_mod.call_llm("openai", "key", None, "prompt") == "hi"
+        finally:
+            server_mod.end_trace(token)
+        assert [(stage, provider) for stage, _, provider in trace.spans] == \
+            [("llm.network", "openai"), ("llm", "openai")]
+
+    def test_catalog_endpoint_is_traced(self, client):
+        rv = client.get("/api/valet/catalog?limit=5&fields=name")
+        assert "catalog;dur=" in rv.headers["Server-Timing"]
+
+    def test_non_api_routes_are_not_traced(self, client):
+        assert "Server-Timing" not in client.get("/").headers
+
+    def test_metrics_endpoint(self, client):
+        client.get("/api/valet/catalog?limit=1")
+        rv = client.get("/metrics")
+        assert rv.mimetype == "text/plain"
+        text = rv.get_data(as_text=True)
+        assert 'valet_stage_seconds{endpoint="/api/valet/catalog",stage="catalog",quantile="0.5"}' in text
+        assert "valet_traced_requests_total" in text
+
+
+class TestTokenUsage:
+    @pytest.fixture
+    def ledger(self, server_mod):
+        from token_ledger import TokenLedger
+        fresh = TokenLedger(prices={p: config["price"] for p, config in server_mod.LLM_PROVIDERS.items()})
+        with patch.object(server_mod, "LLM_TOKENS", fresh):
+            yield fresh
+
+    def test_tests_do_not_write_the_real_usage_file(self, server_mod, llm_usage_path):
+        assert server_mod.LLM_TOKENS.path == str(llm_usage_path)
+
+    def test_every_provider_has_a_price(self, server_mod):
+        for config in server_mod.LLM_PROVIDERS.values():
+            assert len(config["price"]) in (2, 3)
+
+    def test_call_llm_records_tokens_and_cost(self, server_mod, ledger):
+        response = MagicMock(status_code=200)
+        response.json.return_value = {"choices": [{"message": {"content": "hi"}}],
+                                      "usage": {"prompt_tokens": 1000, "completion_tokens": 200,
+                                                "prompt_tokens_details": {"cached_tokens": 800}}}
+        with patch.object(server_mod.LLM_HTTP, "post", return_value=response):
+            server_mod.call_llm("openai", "key", None, "prompt", mode="product")
+        row = ledger.stats()["rows"][0]
+        assert (row["provider"], row["model"], row["mode"]) == ("openai", "gpt-4o", "product")
+        assert (row["input_tokens"], row["output_tokens"], row["cached_tokens"]) == (1000, 200, 800)
+        assert row["cost_usd"] > 0
+
+    def test_failed_call_is_not_recorded(self, server_mod, ledger):
+        response = MagicMock(status_code=500, text="error")
+        with patch.object(server_mod.LLM_HTTP, "post", return_value=response):
+            with pytest.raises(ValueError):
+                server_mod.call_llm("groq", "key", None, "prompt")
+        assert ledger.stats()["rows"] == []
+
+    def test_stream_is_recorded_when_read_to_the_end(self, server_mod, ledger):
+        lines = ['data: {"choices": [{"delta": {"content": "hi"}}]}',
+                 'data: {"choices": [], "usage": {"prompt_tokens": 50, "completion_tokens": 7}}']
+        response = MagicMock(status_code=200)
+        response.lines.return_value = iter(lines)
+        ctx = MagicMock()
+        ctx.__enter__.return_value = response
+        with patch.object(server_mod.LLM_HTTP, "stream", MagicMock(return_value=ctx)):
+            assert "".join(server_mod.stream_llm("groq", "key", None, "prompt", mode="default")) == "hi"
+        groq = ledger.stats()["providers"]["groq"]
+        assert (groq["calls"], groq["input_tokens"], groq["output_tokens"]) == (1, 50, 7)
+
+    def test_valet_passes_its_mode(self, client, server_mod):
+        llm = MagicMock(return_value='{"response": "ok", "mode": "default"}')
+        with patch.object(server_mod, "call_llm", llm), \
+                patch.object(server_mod, "log_user_query"):
+            client.post("/api/valet", json={"query": "sunset usage mode", "cache": False})
+        assert llm.call_args[1]["mode"] == "default"
+
+    def test_usage_endpoint(self, client, ledger):
+        ledger.record("groq", "llama", "default", {"input_tokens": 1000, "output_tokens": 500}, 1.0)
+        ledger.record("openai", "gpt-4o-mini", "default", {"input_tokens": 1000, "output_tokens": 500}, 10.0)
+        data = client.get("/api/valet/usage?min_tps=100").get_json()
+        assert data["total"]["calls"] == 2
+        assert set(data["providers"]) == {"groq", "openai"}
+        assert [r["provider"] for r in data["ranking"]] == ["groq"]
+
+
+class TestStreamLLM:
+    def _fake_stream(self, lines):
+        response = MagicMock(status_code=200)
+        response.lines.return_value = iter(lines)
+        ctx = MagicMock()
+        ctx.__enter__.return_value = response
+        return MagicMock(return_value=ctx)
+
+    @pytest.mark.parametrize("provider,lines", [
+        ("groq", ['data: {"choices": [{"delta": {"content": "Hel"}}]}', "",
+                  'data: {"choices": [{"delta": {"content": "lo"}}]}', "data: [DONE]"]),
+        ("claude", ["event: content_block_delta",
+                    'data: {"type": "content_block_delta", "delta": {"text": "Hel"}}',
+                    'data: {"type": "content_block_delta", "delta": {"text": "lo"}}',
+                    'data: {"type": "message_stop"}']),
+        ("gemini", ['data: {"candidates": [{"content": {"parts": [{"text": "Hel"}]}}]}',
+                    'data: {"candidates": [{"content": {"parts": [{"text": "lo"}]}}]}']),
+        ("cohere", ['{"event_type": "stream-start"}', '{"event_type": "text-generation", "text": "Hel"}',
+                    '{"event_type": "text-generation", "text": "lo"}']),
+    ])
+    def test_provider_stream_formats(self, server_mod, provider, lines):
+        fake = self._fake_stream(lines)
+        with patch.object(server_mod.LLM_HTTP, "stream", fake):
+            assert "".join(server_mod.stream_llm(provider, "key", None, "prompt")) == "Hello"
+        assert fake.call_args[1]["json"].get("stream", True) is True
+
+    def test_gemini_uses_sse_endpoint(self, server_mod):
+        fake = self._fake_stream([])
+        with patch.object(server_mod.LLM_HTTP, "stream", fake):
+            list(server_mod.stream_llm("gemini", "key", None, "prompt"))
+        assert ":streamGenerateContent?alt=sse" in fake.call_args[0][1]
+
+
+class TestSearchAPI:
+    def test_search_returns_ranked_products(self, client):
+        rv = client.get("/api/valet/search?q=loafer")
+        assert rv.status_code == 200
+        data = rv.get_json()
+        assert data["count"] > 0
+        scores = [p["_score"] for p in data["products"]]
+        assert scores == sorted(scores, reverse=True)
+
+    def test_search_respects_category_filter(self, client):
+        data = client.get("/api/valet/search?q=black&category=underwear").get_json()
+        for p in data["products"]:
+            assert p["category"] == "underwear"
+
+    def test_search_requires_query(self, client):
+        assert client.get("/api/valet/search").status_code == 400
+        assert client.get("/api/valet/search?q=robe&limit=500").status_code == 400
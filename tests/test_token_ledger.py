@@ -0,0 +1,92 @@
+"""Tests for token_ledger.py: per-provider token, cost and throughput totals."""
+import json
+import threading
+
+import pytest
+
+from token_ledger import TokenLedger
+
+PRICES = {'groq': (0.59, 0.79), 'openai': (2.50, 10.00, 1.25), 'openai/gpt-4o-mini': (0.15, 0.60, 0.075)}
+
+
+class TestCost:
+    def test_cached_tokens_use_the_cached_price(self):
+        ledger = TokenLedger(prices=PRICES)
+        usage = {'input_tokens': 1_000_000, 'output_tokens': 100_000, 'cached_tokens': 400_000}
+        assert ledger.cost('openai', 'gpt-4o', usage) == pytest.approx(0.6 * 2.5 + 0.4 * 1.25 + 0.1 * 10)
+
+    def test_model_price_overrides_provider_price(self):
+        ledger = TokenLedger(prices=PRICES)
+        assert ledger.price('openai', 'gpt-4o-mini') == (0.15, 0.60, 0.075)
+        assert ledger.price('groq', 'llama') == (0.59, 0.79, 0.59)  # no cached price: input price
+        assert ledger.price('unknown', 'm') == (0.0, 0.0, 0.0)
+
+
+class TestTotals:
+    def test_rows_per_provider_model_and_mode(self):
+        ledger = TokenLedger(prices=PRICES)
+        ledger.record('groq', 'llama', 'default', {'input_tokens': 900, 'output_tokens': 100}, 0.5)
+        ledger.record('groq', 'llama', 'default', {'input_tokens': 900, 'output_tokens': 300}, 0.5)
+        ledger.record('groq', 'llama', 'product', {}, 0.2)
+        ledger.record('openai', 'gpt-4o', None, {'input_tokens': 1000, 'output_tokens': 50,
+                                                 'cached_tokens': 800}, 2.0)
+        stats = ledger.stats()
+        groq = stats['providers']['groq']
+        assert (groq['calls'], groq['input_tokens'], groq['output_tokens']) == (3, 1800, 400)
+        assert groq['tokens_per_second'] == pytest.approx(400 / 1.2, abs=0.1)
+        assert set(stats['modes']) == {'default', 'product', 'other'}
+        assert stats['total']['calls'] == 4
+        row = next(r for r in stats['rows'] if r['mode'] == 'default')
+        assert (row['provider'], row['model'], row['calls'], row['tokens_per_second']) == ('groq', 'llama', 2, 400.0)
+
+    def test_ranking_is_cheapest_fast_enough_first(self):
+        ledger = TokenLedger(prices=PRICES)
+        ledger.record('groq', 'llama', 'default', {'input_tokens': 1000, 'output_tokens': 500}, 1.0)
+        ledger.record('openai', 'gpt-4o-mini', 'default', {'input_tokens': 1000, 'output_tokens': 500}, 10.0)
+        ledger.record('gemini', 'flash', 'default', {}, 1.0)  # no usage reported: not ranked
+        assert [r['provider'] for r in ledger.ranking()] == ['openai', 'groq']
+        assert [r['provider'] for r in ledger.ranking(min_tokens_per_second=100)] == ['groq']
+
+
+class TestPersistence:
+    def test_totals_survive_a_restart(self, tmp_path):
+        path = str(tmp_path / 'usage' / 'llm_usage.json')
+        ledger = TokenLedger(path, prices=PRICES, save_interval=3600)
+        ledger.record('groq', 'llama', 'default', {'input_tokens': 10, 'output_tokens': 5}, 0.1)
+        ledger.save()
+        saved = json.loads(open(path).read())
+        assert saved['rows'][0]['provider'] == 'groq'
+
+        restored = TokenLedger(path, prices=PRICES)
+        assert restored.since == ledger.since
+        restored.record('groq', 'llama', 'default', {'input_tokens': 10, 'output_tokens': 5}, 0.1)
+        assert restored.stats()['providers']['groq']['calls'] == 2
+
+    def test_record_never_writes_on_the_calling_thread(self, tmp_path, monkeypatch):
+        import token_ledger
+        writers = []
+        saved = threading.Event()
+
+        def fake_write(path, data):
+            writers.append(threading.current_thread())
+            saved.set()
+
+        monkeypatch.setattr(token_ledger, 'atomic_write_bytes', fake_write)
+        ledger = TokenLedger(str(tmp_path / 'llm_usage.json'), save_interval=0.01)
+        ledger.record('groq', 'llama', 'default', {}, 0.1)
+        assert saved.wait(2)
+        assert writers[0] is not threading.current_thread()
+        ledger.close()
+
+    def test_close_saves_pending_totals(self, tmp_path):
+        path = tmp_path / 'llm_usage.json'
+        ledger = TokenLedger(str(path), save_interval=3600)
+        ledger.record('groq', 'llama', 'default', {}, 0.1)
+        assert not path.exists()
+        ledger.close()
+        assert json.loads(path.read_text())['rows'][0]['calls'] == 1
+
+    def test_unreadable_file_starts_empty(self, tmp_path):
+        path = tmp_path / 'llm_usage.json'
+        path.write_text('{not json')
+        assert TokenLedger(str(path)).stats()['rows'] == []
@@ -0,0 +1,69 @@
+"""Tests for valet_cache.py: normalized keys, TTL/LRU, disk tier."""
+from unittest.mock import patch
+
+from valet_cache import ValetResponseCache, cache_key, normalize_query
+
+
+def _key(query, **overrides):
+    args = dict(mode='default', category=None, provider='gemini',
+                model='gemini-2.0-flash', catalog_version='abc')
+    args.update(overrides)
+    return cache_key(query, **args)
+
+
+class TestCacheKey:
+    def test_normalizes_case_punctuation_and_accents(self):
+        assert normalize_query('  Cozy   hoodie! ') == 'cozy hoodie'
+        assert normalize_query('Café robe') == 'cafe robe'
+        assert _key('cozy hoodie') == _key('Cozy hoodie!')
+
+    def test_mode_provider_and_catalog_are_part_of_key(self):
+        base = _key('cozy hoodie')
+        assert _key('cozy hoodie', mode='product') != base
+        assert _key('cozy hoodie', category='travel') != base
+        assert _key('cozy hoodie', provider='openai') != base
+        assert _key('cozy hoodie', model='gemini-pro') != base
+        assert _key('cozy hoodie', catalog_version='def') != base
+        assert _key('cozy hoodie', context={'anchor': 'x'}) != base
+
+
+class TestValetResponseCache:
+    def test_get_returns_copy(self):
+        cache = ValetResponseCache()
+        cache.put('k', {'response': 'hi'})
+        first = cache.get('k')
+        first['response'] = 'changed'
+        assert cache.get('k') == {'response': 'hi'}
+        assert cache.stats()['hits'] == 2
+
+    def test_ttl_expiry(self):
+        cache = ValetResponseCache(ttl=10)
+        with patch('valet_cache.time.time', return_value=1000.0):
+            cache.put('k', {'response': 'hi'})
+        with patch('valet_cache.time.time', return_value=1009.0):
+            assert cache.get('k') is not None
+        with patch('valet_cache.time.time', return_value=1010.0):
+            assert cache.get('k') is None
+
+    def test_lru_eviction(self):
+        cache = ValetResponseCache(max_entries=2)
+        cache.put('a', {})
+        cache.put('b', {})
+        cache.get('a')
+        cache.put('c', {})
+        assert cache.get('b') is None
+        assert cache.get('a') is not None
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        path = str(tmp_path / 'valet.sqlite')
+        ValetResponseCache(disk_path=path).put('k', {'response': 'hi'})
+        cache = ValetResponseCache(disk_path=path)
+        assert cache.get('k') == {'response': 'hi'}
+        assert cache.stats()['disk_hits'] == 1
+
+    def test_disk_tier_respects_ttl(self, tmp_path):
+        path = str(tmp_path / 'valet.sqlite')
+        with patch('valet_cache.time.time', return_value=1000.0):
+            ValetResponseCache(disk_path=path, ttl=10).put('k', {})
+        with patch('valet_cache.time.time', return_value=1011.0):
+            assert ValetResponseCache(disk_path=path, ttl=10).get('k') is None
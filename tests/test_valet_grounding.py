@@ -0,0 +1,71 @@
+"""Tests for valet_grounding.py: retrieval and name resolution."""
+from catalog_store import CatalogSnapshot
+from valet_grounding import ProductGrounder, grounder_for
+
+PRODUCTS = [
+    {'id': 1, 'name': 'Alpine Trail Boot', 'category': 'boots', 'price': 120, 'image': 'a.jpg',
+     'vibes': ['rugged', 'outdoor'], 'description': 'Waterproof leather hiking boot'},
+    {'id': 2, 'name': 'Cloud Lounge Robe', 'category': 'loungewear', 'price': 80, 'image': 'b.jpg',
+     'vibes': ['cozy'], 'description': 'Plush cotton robe'},
+    {'id': 3, 'name': 'Harbor Deck Shoe', 'category': 'shoes', 'price': 95, 'sku': 'HDS-1',
+     'vibes': ['nautical', 'rugged'], 'description': 'Leather boat shoe'},
+    {'id': 4, 'name': 'Retired Boot', 'category': 'boots', 'price': 10, 'active': False},
+]
+
+
+def _grounder(products=PRODUCTS, digest='v1'):
+    return ProductGrounder(CatalogSnapshot({'products': products}, digest, 1))
+
+
+class TestRetrieve:
+    def test_query_ranks_relevant_products(self):
+        found = _grounder().retrieve('leather hiking boot', k=2)
+        assert [p.id for p in found] == [1, 3]
+
+    def test_inactive_products_are_never_retrieved(self):
+        assert 4 not in [p.id for p in _grounder().retrieve('boot', k=10)]
+
+    def test_liked_products_pull_similar_items(self):
+        grounder = _grounder()
+        assert grounder.retrieve('something new', liked=['Harbor Deck Shoe'], k=1)[0].id == 3
+
+    def test_embedding_ranking_is_fused_in(self):
+        from catalog_embeddings import EmbeddingIndex, HashingEmbedder
+        snapshot = CatalogSnapshot({'products': PRODUCTS}, 'v1', 1)
+        semantic = EmbeddingIndex(snapshot.items, HashingEmbedder(), 'v1')
+        grounder = ProductGrounder(snapshot)
+        assert grounder.retrieve('lounge robes', k=1)[0].id == 2
+        # "robez" has no keyword match; the trigram embedding still finds the robe
+        assert grounder.retrieve('robez', k=1, semantic=semantic)[0].id == 2
+
+    def test_fills_up_with_image_products(self):
+        found = _grounder().retrieve('zzz', k=3)
+        assert [p.id for p in found] == [1, 2, 3]  # products with images first
+
+
+class TestResolve:
+    def test_by_id_exact_name_and_fuzzy_name(self):
+        grounder = _grounder()
+        assert grounder.resolve({'id': '2', 'name': 'whatever'}).id == 2
+        assert grounder.resolve({'name': 'cloud lounge robe!'}).id == 2
+        assert grounder.resolve({'name': 'Alpine Boot'}).id == 1
+        assert grounder.resolve({'name': 'Invented Jetpack'}) is None
+
+    def test_ground_completes_cards_and_drops_inventions(self):
+        grounder = _grounder()
+        answer = {'products': [
+            {'name': 'Harbor Deck Shoes', 'reason': 'boat days'},
+            {'name': 'Invented Jetpack'},
+            {'id': 3, 'name': 'Harbor Deck Shoe'},  # duplicate
+        ]}
+        counts = grounder.ground(answer, grounder.retrieve('deck shoe', k=2))
+        assert counts == {'candidates': 2, 'resolved': 1, 'dropped': 2}
+        card = answer['products'][0]
+        assert card['id'] == 3 and card['name'] == 'Harbor Deck Shoe' and card['sku'] == 'HDS-1'
+        assert card['reason'] == 'boat days' and card['price'] == 95.0
+
+
+def test_grounder_for_rebuilds_on_new_digest():
+    first = grounder_for(CatalogSnapshot({'products': PRODUCTS}, 'g1', 1))
+    assert grounder_for(CatalogSnapshot({'products': PRODUCTS}, 'g1', 1)) is first
+    assert grounder_for(CatalogSnapshot({'products': PRODUCTS[:1]}, 'g2', 2)).by_id.keys() == {'1'}
@@ -0,0 +1,85 @@
+"""Tests for valet_json.py: tolerant JSON extraction and answer validation."""
+import json
+
+import pytest
+
+from valet_json import extract_json, repair_json, validate_answer
+
+ANSWER = {'response': 'Oh, you\'re gonna love "this" {really}', 'mode': 'default',
+          'songs': [{'title': 'Song', 'artist': 'Artist'}]}
+
+
+class TestExtractJson:
+    @pytest.mark.parametrize('text', [
+        json.dumps(ANSWER),
+        '```json\n' + json.dumps(ANSWER) + '\n```',
+        'Sure! Here you go:\n' + json.dumps(ANSWER, indent=2) + '\nEnjoy {the} vibes.',
+    ])
+    def test_clean_object_needs_no_repair(self, text):
+        repairs = []
+        assert extract_json(text, repairs) == ANSWER
+        assert repairs == []
+
+    def test_raw_newline_in_string(self):
+        assert extract_json('{"response": "line one\nline two"}') == {'response': 'line one\nline two'}
+
+    def test_trailing_commas(self):
+        repairs = []
+        text = '```json\n{"songs": [{"title": "A",}, {"title": "B"},], "mode": "default",}\n```'
+        assert extract_json(text, repairs) == {'songs': [{'title': 'A'}, {'title': 'B'}], 'mode': 'default'}
+        assert repairs == ['trailing comma']
+
+    def test_typographic_quotes(self):
+        repairs = []
+        assert extract_json('{“response”: “it’s here”}', repairs) == {'response': 'it’s here'}
+        assert repairs == ['quotes']
+
+    def test_mismatched_closer(self):
+        assert extract_json('{"songs": [{"title": "A"}}') == {'songs': [{'title': 'A'}]}
+
+    @pytest.mark.parametrize('text,expected', [
+        ('{"response": "cut off mid-sen', {'response': 'cut off mid-sen'}),
+        ('{"response": "ok", "songs": [{"title": "A"}, {"title": "B", "art',
+         {'response': 'ok', 'songs': [{'title': 'A'}, {'title': 'B'}]}),
+        ('{"response": "ok", "mode":', {'response': 'ok', 'mode': None}),
+        ('{"response": "ok", "songs": [{"title": "A"}, {"tit', {'response': 'ok', 'songs': [{'title': 'A'}]}),
+    ])
+    def test_truncated_answer_is_closed(self, text, expected):
+        repairs = []
+        assert extract_json(text, repairs) == expected
+        assert 'truncated' in repairs
+
+    def test_escaped_quotes_are_kept(self):
+        assert repair_json('{"a": "say \\"hi\\"",}') == '{"a": "say \\"hi\\""}'
+
+    @pytest.mark.parametrize('text', ['', 'Sorry, I cannot help with that.', '{not json at all}'])
+    def test_unrecoverable_raises(self, text):
+        with pytest.raises(json.JSONDecodeError):
+            extract_json(text)
+
+
+class TestValidateAnswer:
+    def test_valid_answer_is_unchanged(self):
+        answer = json.loads(json.dumps(ANSWER))
+        assert validate_answer(answer) == []
+        assert answer == ANSWER
+
+    def test_invalid_cards_are_dropped(self):
+        answer = {
+            'response': 'ok',
+            'youtube': [{'title': 'A'}, 'just a string', {'channel': 'no title'}, {'searchQuery': 'q'}],
+            'songs': {'title': 'Single', 'artist': 'Card'},
+            'travel': 'somewhere nice',
+            'products': [{'id': 7}, {'name': ['bad'], 'reason': 'x'}],
+        }
+        fixes = validate_answer(answer)
+        assert answer['youtube'] == [{'title': 'A'}, {'searchQuery': 'q'}]
+        assert answer['songs'] == [{'title': 'Single', 'artist': 'Card'}]
+        assert answer['travel'] == []
+        assert answer['products'] == [{'id': '7'}]
+        assert fixes == ['youtube: dropped 2', 'travel: not a list', 'products: dropped 1']
+
+    def test_response_and_vibes(self):
+        answer = {'response': None, 'vibes': ['chill', 3]}
+        assert validate_answer(answer) == ['response', 'vibes']
+        assert answer == {'response': '', 'vibes': ['chill']}
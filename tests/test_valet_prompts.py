@@ -0,0 +1,61 @@
+"""Tests for valet_prompts.py: compiled prefixes and per-request slots."""
+from catalog_store import CatalogSnapshot
+from valet_prompts import ValetPrompts, prompts_for
+
+
+def _snapshot(digest='v1', products=None):
+    products = products if products is not None else [
+        {'id': 1, 'name': 'Trail Boot', 'category': 'boots', 'price': 120, 'image': 'a.jpg'},
+        {'id': 2, 'name': 'Lounge Robe', 'category': 'loungewear', 'price': 80, 'image': 'b.jpg'},
+        {'id': 3, 'name': 'No Image Tee', 'category': 'tops', 'price': 20},
+    ]
+    return CatalogSnapshot({'products': products}, digest, 1)
+
+
+class TestValetPrompts:
+    def test_product_prefix_holds_catalog_context(self):
+        prompts = ValetPrompts(_snapshot().items)
+        assert prompts.categories == ('boots', 'loungewear', 'tops')
+        assert 'Available product categories: boots, loungewear, tops' in prompts.product_prefix
+        assert '"mode": "product"' in prompts.product_prefix
+        assert 'Trail Boot' not in prompts.product_prefix
+
+    def test_retrieved_products_go_in_request_part(self):
+        snapshot = _snapshot()
+        prompts = ValetPrompts(snapshot.items)
+        _, request = prompts.render(True, 'boots', products=snapshot.items[:1])
+        assert '- [1] Trail Boot (boots, $120)' in request
+        assert 'Lounge Robe' not in request
+
+    def test_prefix_is_shared_and_request_part_varies(self):
+        prompts = ValetPrompts(_snapshot().items)
+        prefix_a, request_a = prompts.render(True, 'boots please')
+        prefix_b, request_b = prompts.render(True, 'a robe', liked=['Lounge Robe'])
+        assert prefix_a is prefix_b
+        assert request_a.endswith('User Query: "boots please"')
+        assert '- Lounge Robe' in request_b
+        assert 'boots please' not in prefix_a
+
+    def test_default_mode_slots(self):
+        prompts = ValetPrompts(_snapshot().items)
+        prefix, request = prompts.render(False, 'sunset', anchor='beach day', category='travel')
+        assert '"youtube"' in prefix
+        assert 'User has selected "travel" mode' in request
+        assert request.endswith('Previous context: beach day')
+
+    def test_long_history_detects_category(self):
+        prompts = ValetPrompts(_snapshot().items)
+        history = [f'message {i}' for i in range(8)]
+        _, request = prompts.render(False, 'more', history=history)
+        assert 'message 2' in request and 'message 1\n' not in request
+        assert 'Available categories: boots, loungewear, tops' in request
+        _, request = prompts.render(False, 'more', history=history, category='auto')
+        assert 'Analyze chat history' in request
+
+    def test_prompts_for_recompiles_on_new_digest(self):
+        first = prompts_for(_snapshot('v1'))
+        assert prompts_for(_snapshot('v1')) is first
+        second = prompts_for(_snapshot('v2', [{'id': 9, 'name': 'Cap', 'category': 'hats', 'price': 5}]))
+        assert second is not first
+        assert second.categories == ('hats',)
+        assert prompts_for(None).categories == ()
@@ -0,0 +1,66 @@
+"""Tests for valet_stream.py: incremental parsing of streamed valet JSON."""
+import json
+
+import pytest
+
+from valet_stream import ValetStreamParser, answer_events, sse_event
+
+ANSWER = {
+    'response': 'Oh, you\'re gonna "love" this: café 😀 \\ done',
+    'detected_category': None,
+    'mode': 'default',
+    'youtube': [{'title': 'Sunset [live]', 'meta': {'views': 1}}, {'title': 'B'}],
+    'songs': [{'title': 'Song', 'artist': 'Artist'}],
+    'travel': [],
+    'vibes': ['chill', {'not': 'a card'}],
+}
+
+
+def _feed(text, step):
+    parser = ValetStreamParser()
+    events = []
+    for i in range(0, len(text), step):
+        events.extend(parser.feed(text[i:i + step]))
+    return parser, events
+
+
+class TestValetStreamParser:
+    @pytest.mark.parametrize('step', [1, 2, 5, 16, 10000])
+    def test_chunking_does_not_change_result(self, step):
+        text = '```json\n' + json.dumps(ANSWER) + '\n```'
+        parser, events = _feed(text, step)
+        assert parser.done
+        deltas = [e[2] for e in events if e[0] == 'text']
+        assert ''.join(deltas) == ANSWER['response']
+        cards = [e[1:] for e in events if e[0] == 'card']
+        assert cards == [
+            ('youtube', 0, ANSWER['youtube'][0]),
+            ('youtube', 1, ANSWER['youtube'][1]),
+            ('songs', 0, ANSWER['songs'][0]),
+        ]
+
+    def test_non_ascii_json_escapes(self):
+        text = json.dumps(ANSWER, ensure_ascii=True)
+        _, events = _feed(text, 3)
+        assert ''.join(e[2] for e in events if e[0] == 'text') == ANSWER['response']
+
+    def test_text_is_emitted_before_string_closes(self):
+        parser = ValetStreamParser()
+        assert parser.feed('{"response": "Hello wor') == [('text', 'response', 'Hello wor')]
+        assert parser.feed('ld", "songs": [{"title": "x"}') == [
+            ('text', 'response', 'ld'), ('card', 'songs', 0, {'title': 'x'})]
+
+    def test_nested_response_key_is_not_streamed(self):
+        _, events = _feed('{"songs": [{"response": "no"}], "response": "yes"}', 4)
+        assert [e for e in events if e[0] == 'text'] == [('text', 'response', 'yes')]
+
+
+class TestHelpers:
+    def test_answer_events_match_parser(self):
+        _, streamed = _feed(json.dumps(ANSWER), 7)
+        replayed = list(answer_events(ANSWER))
+        assert ''.join(e[2] for e in replayed if e[0] == 'text') == ANSWER['response']
+        assert [e for e in replayed if e[0] == 'card'] == [e for e in streamed if e[0] == 'card']
+
+    def test_sse_event_format(self):
+        assert sse_event('card', {'a': 1}) == 'event: card\ndata: {"a":1}\n\n'
@@ -0,0 +1,198 @@
+"""
+Token and cost accounting for LLM calls.
+
+TokenLedger adds up, per (provider, model, mode), the calls, input, output
+and cached input tokens (as parsed from each provider's usage block), the
+seconds spent on the provider, and the estimated cost:
+
+    cost = (input - cached) * input price + cached * cached price
+           + output * output price            (prices in $ per million tokens)
+
+Output tokens per provider second give each row's throughput, and
+``ranking()`` orders providers by what a million tokens actually cost them,
+keeping only those fast enough, which is the input for routing traffic to
+the cheapest provider that still answers quickly.
+
+Totals live in memory. ``record()`` runs on the LLM gateway's event loop,
+so it only marks the totals dirty; a background thread saves them to a
+JSON file every ``save_interval`` seconds, and the server calls
+``close()`` at exit. A restarted server continues from the saved totals.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from catalog_snapshot import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAVE_INTERVAL = 60.0
+
+COUNTERS = ('calls', 'input_tokens', 'output_tokens', 'cached_tokens', 'seconds', 'cost_usd')
+
+Key = Tuple[str, str, str]  # (provider, model, mode)
+
+
+def _with_rates(row: Dict[str, Any]) -> Dict[str, Any]:
+    out = dict(row)
+    out['seconds'] = round(row['seconds'], 3)
+    out['cost_usd'] = round(row['cost_usd'], 6)
+    out['tokens_per_second'] = round(row['output_tokens'] / row['seconds'], 1) if row['seconds'] else None
+    tokens = row['input_tokens'] + row['output_tokens']
+    out['usd_per_million_tokens'] = round(row['cost_usd'] * 1e6 / tokens, 4) if tokens else None
+    return out
+
+
+class TokenLedger:
+    """Thread-safe token and cost totals, optionally persisted to ``path``."""
+
+    def __init__(self, path: Optional[str] = None,
+                 prices: Optional[Dict[str, Sequence[float]]] = None,
+                 save_interval: float = DEFAULT_SAVE_INTERVAL):
+        self.path = path
+        # 'provider' or 'provider/model' -> (input, output, cached input) $/M tokens
+        self.prices = dict(prices or {})
+        self.save_interval = save_interval
+        self._rows: Dict[Key, Dict[str, float]] = {}
+        self.since = time.time()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        if path:
+            self.load()
+
+    # -- recording ------------------------------------------------------
+
+    def price(self, provider: str, model: str) -> Tuple[float, float, float]:
+        price = self.prices.get(f'{provider}/{model}') or self.prices.get(provider)
+        if not price:
+            return 0.0, 0.0, 0.0
+        input_price, output_price = price[0], price[1]
+        cached_price = price[2] if len(price) > 2 and price[2] is not None else input_price
+        return input_price, output_price, cached_price
+
+    def cost(self, provider: str, model: str, usage: Dict[str, int]) -> float:
+        input_price, output_price, cached_price = self.price(provider, model)
+        cached = usage.get('cached_tokens', 0)
+        return ((usage.get('input_tokens', 0) - cached) * input_price + cached * cached_price
+                + usage.get('output_tokens', 0) * output_price) / 1e6
+
+    def record(self, provider: str, model: str, mode: Optional[str],
+               usage: Dict[str, int], seconds: float) -> None:
+        """Add one call. ``usage`` is {'input_tokens', 'output_tokens',
+        'cached_tokens'} (empty when the provider reported none)."""
+        key = (provider, model or '', mode or 'other')
+        cost = self.cost(provider, model, usage)
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = dict.fromkeys(COUNTERS, 0)
+            row['calls'] += 1
+            row['input_tokens'] += usage.get('input_tokens', 0)
+            row['output_tokens'] += usage.get('output_tokens', 0)
+            row['cached_tokens'] += usage.get('cached_tokens', 0)
+            row['seconds'] += seconds
+            row['cost_usd'] += cost
+            self._dirty = True
+        if self.path and self._thread is None:
+            self._start()
+
+    # -- persistence ----------------------------------------------------
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='llm-usage', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.save_interval):
+            self.save()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the saver thread and save what is left."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout)
+        self.save()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            rows = [dict(row, provider=key[0], model=key[1], mode=key[2])
+                    for key, row in sorted(self._rows.items())]
+            self._dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            atomic_write_bytes(self.path, json.dumps({'since': self.since, 'rows': rows},
+                                                     separators=(',', ':')).encode('utf-8'))
+        except OSError as e:
+            logger.warning('Could not save LLM usage totals: %s', e)
+
+    def load(self) -> None:
+        try:
+            with open(self.path, 'rb') as f:
+                saved = json.loads(f.read())
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            self.since = saved.get('since', self.since)
+            for row in saved.get('rows', ()):
+                key = (row.get('provider', ''), row.get('model', ''), row.get('mode', 'other'))
+                self._rows[key] = {counter: row.get(counter, 0) for counter in COUNTERS}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._rows.clear()
+            self.since = time.time()
+            self._dirty = True
+
+    # -- reporting ------------------------------------------------------
+
+    def _totals(self, by: Optional[int]) -> Dict[str, Dict[str, float]]:
+        """Rows summed by key[by] (0 provider, 1 model, 2 mode; None: all)."""
+        totals: Dict[str, Dict[str, float]] = {}
+        with self._lock:
+            for key, row in self._rows.items():
+                total = totals.setdefault(key[by] if by is not None else 'all', dict.fromkeys(COUNTERS, 0))
+                for counter in COUNTERS:
+                    total[counter] += row[counter]
+        return totals
+
+    def ranking(self, min_tokens_per_second: float = 0.0) -> List[Dict[str, Any]]:
+        """Providers with measured throughput of at least
+        ``min_tokens_per_second``, cheapest per million tokens first."""
+        rows = []
+        for provider, total in self._totals(0).items():
+            row = _with_rates(total)
+            if row['tokens_per_second'] is None or row['usd_per_million_tokens'] is None:
+                continue
+            if row['tokens_per_second'] >= min_tokens_per_second:
+                rows.append({'provider': provider, 'usd_per_million_tokens': row['usd_per_million_tokens'],
+                             'tokens_per_second': row['tokens_per_second']})
+        return sorted(rows, key=lambda r: (r['usd_per_million_tokens'], -r['tokens_per_second']))
+
+    def stats(self, min_tokens_per_second: float = 0.0) -> Dict[str, Any]:
+        with self._lock:
+            rows = [dict(_with_rates(row), provider=key[0], model=key[1], mode=key[2])
+                    for key, row in sorted(self._rows.items())]
+        total = self._totals(None).get('all', dict.fromkeys(COUNTERS, 0))
+        return {
+            'since': self.since,
+            'total': _with_rates(total),
+            'providers': {provider: _with_rates(t) for provider, t in sorted(self._totals(0).items())},
+            'modes': {mode: _with_rates(t) for mode, t in sorted(self._totals(2).items())},
+            'rows': rows,
+            'ranking': self.ranking(min_tokens_per_second),
+        }
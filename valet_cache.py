@@ -0,0 +1,130 @@
+"""
+Response cache for /api/valet.
+
+LLM answers are cached under a key built from the normalized query, the
+mode, the category override, provider/model, the catalog digest and any
+other context that went into the prompt. "Cozy hoodie!" and "cozy hoodie"
+share an entry; a catalog change starts a fresh keyspace.
+
+Two tiers: an in-memory LRU with a TTL, and an optional SQLite file that
+survives restarts. A disk hit is promoted into memory.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from catalog_search import tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL = 3600.0
+
+
+def normalize_query(query: str) -> str:
+    """Case, accents, punctuation and spacing do not change the answer."""
+    return ' '.join(tokenize(query))
+
+
+def cache_key(query: str, mode: str, category: Optional[str], provider: str,
+              model: str, catalog_version: str, context: Any = None) -> str:
+    """Stable key for one valet answer. ``context`` is any extra prompt input."""
+    parts = [normalize_query(query), mode, category or '', provider, model,
+             catalog_version, context]
+    raw = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class ValetResponseCache:
+    """TTL + LRU cache of parsed valet responses, with an optional disk tier."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL,
+                 disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._entries: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_path:
+            try:
+                self._db = sqlite3.connect(disk_path, check_same_thread=False)
+                self._db.execute('PRAGMA journal_mode=WAL')
+                self._db.execute('CREATE TABLE IF NOT EXISTS responses '
+                                 '(key TEXT PRIMARY KEY, stored REAL, body TEXT)')
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning('Valet cache disk tier disabled (%s): %s', disk_path, e)
+                self._db = None
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        try:
+            row = self._db.execute('SELECT stored, body FROM responses WHERE key = ?',
+                                   (key,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning('Valet cache read failed: %s', e)
+            return None
+        if row is None or now - row[0] >= self.ttl:
+            return None
+        return row[0], row[1]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The cached response for ``key`` (a fresh dict), or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] >= self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                entry = self._disk_get(key, now)
+                if entry is not None:
+                    self.disk_hits += 1
+                    self._remember(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(entry[1])
+
+    def _remember(self, key: str, entry: Tuple[float, str]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, key: str, response: Dict[str, Any]) -> None:
+        entry = (time.time(), json.dumps(response, separators=(',', ':')))
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                try:
+                    self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?)',
+                                     (key,) + entry)
+                    self._db.execute('DELETE FROM responses WHERE stored < ?',
+                                     (entry[0] - self.ttl,))
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    logger.warning('Valet cache write failed: %s', e)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM responses')
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'entries': len(self._entries), 'ttl': self.ttl,
+                'disk': bool(self._db), 'hits': self.hits,
+                'disk_hits': self.disk_hits, 'misses': self.misses}
@@ -0,0 +1,169 @@
+"""
+Catalog grounding for product mode.
+
+Instead of showing the LLM an arbitrary slice of the catalog, each
+product-mode query retrieves the ``k`` products most relevant to the query
+and to the user's liked products (BM25 over the snapshot's SearchIndex,
+fused with embedding similarity when an EmbeddingIndex is given). Only
+those go into the prompt, with their ids.
+
+The products the LLM returns are then resolved back to catalog items:
+
+1. by id;
+2. by exact (normalized) name;
+3. by the catalog name sharing most terms with the returned one (products
+   that were in the prompt first).
+
+Cards are completed with the catalog's id, name, price, image and url.
+Names that match nothing in the catalog are dropped.
+"""
+
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from catalog_search import tokenize
+
+# Products retrieved into a product-mode prompt
+DEFAULT_K = 15
+
+# Weight of liked-product similarity relative to the query
+LIKED_WEIGHT = 0.5
+
+# Liked products that steer retrieval
+LIKED_LIMIT = 5
+
+# A fuzzy name match must cover this share of the returned name's terms
+MIN_NAME_OVERLAP = 0.5
+
+# Reciprocal rank fusion constant (keyword and embedding rankings)
+RRF_K = 60
+
+
+def _name_key(name: str) -> str:
+    return ' '.join(tokenize(name))
+
+
+class ProductGrounder:
+    """Retrieval and name resolution over one catalog snapshot."""
+
+    __slots__ = ('digest', 'items', 'search', 'by_id', 'by_name', 'by_position', 'name_terms')
+
+    def __init__(self, snapshot: Any):
+        self.digest = snapshot.digest if snapshot is not None else ''
+        self.items = tuple(item for item in (snapshot.items if snapshot is not None else ())
+                           if item.active)
+        self.search = snapshot.search if snapshot is not None else None
+        self.by_id: Dict[str, Any] = {}
+        self.by_name: Dict[str, Any] = {}
+        self.by_position = {item.position: item for item in self.items}
+        self.name_terms = {item.position: frozenset(tokenize(item.name)) for item in self.items}
+        for item in self.items:
+            self.by_id.setdefault(str(item.id), item)
+            self.by_name.setdefault(_name_key(item.name), item)
+
+    # -- retrieval ------------------------------------------------------
+
+    def _scores(self, text: str, weight: float, scores: Dict[int, float]) -> None:
+        for item, score in self.search.search(text, limit=len(self.items), prefix=False):
+            if item.position in self.by_position:  # active
+                scores[item.position] = scores.get(item.position, 0.0) + weight * score
+
+    def retrieve(self, query: str, liked: Iterable[str] = (), k: int = DEFAULT_K,
+                 semantic: Any = None) -> List[Any]:
+        """Top ``k`` active products for ``query``, nudged towards products
+        like the ``liked`` names. With ``semantic`` (an EmbeddingIndex for the
+        same snapshot), the keyword and embedding rankings are fused. Falls
+        back to products with images (then any) when fewer than ``k`` match."""
+        if k <= 0 or not self.items:
+            return []
+        scores: Dict[int, float] = {}
+        if self.search is not None:
+            self._scores(query, 1.0, scores)
+            for name in list(liked)[:LIKED_LIMIT]:
+                item = self.by_name.get(_name_key(name))
+                text = ' '.join((item.name, item.category) + item.vibes) if item else name
+                self._scores(text, LIKED_WEIGHT, scores)
+        ranked = sorted(scores, key=lambda pos: (-scores[pos], pos))
+        if semantic is not None:
+            fused = {pos: 1.0 / (RRF_K + rank) for rank, pos in enumerate(ranked)}
+            for rank, (item, _) in enumerate(semantic.top(query, k=len(self.items))):
+                if item.position in self.by_position:
+                    fused[item.position] = fused.get(item.position, 0.0) + 1.0 / (RRF_K + rank)
+            ranked = sorted(fused, key=lambda pos: (-fused[pos], pos))
+        ranked = ranked[:k]
+        chosen = [self.by_position[pos] for pos in ranked]
+        if len(chosen) < k:
+            picked = set(ranked)
+            fill = sorted((item for item in self.items if item.position not in picked),
+                          key=lambda item: (not item.image, item.position))
+            chosen.extend(fill[:k - len(chosen)])
+        return chosen
+
+    # -- resolution -----------------------------------------------------
+
+    def resolve(self, card: Dict[str, Any], candidates: Sequence[Any] = ()) -> Optional[Any]:
+        """The catalog item an LLM product card refers to, or None."""
+        pid = card.get('id')
+        if pid is not None and str(pid) in self.by_id:
+            return self.by_id[str(pid)]
+        name = card.get('name') or ''
+        key = _name_key(name)
+        if not key:
+            return None
+        if key in self.by_name:
+            return self.by_name[key]
+        terms = set(key.split())
+        # Prefer what the prompt offered, then the whole catalog
+        for pool in (candidates, self.items):
+            best, best_overlap = None, 0.0
+            for item in pool:
+                overlap = len(terms & self.name_terms.get(item.position, frozenset())) / len(terms)
+                if overlap > best_overlap:
+                    best, best_overlap = item, overlap
+            if best is not None and best_overlap >= MIN_NAME_OVERLAP:
+                return best
+        return None
+
+    def ground_card(self, card: Dict[str, Any], candidates: Sequence[Any] = ()) -> Optional[Dict[str, Any]]:
+        """``card`` completed from the catalog, or None if it is not a catalog product."""
+        item = self.resolve(card, candidates)
+        if item is None:
+            return None
+        grounded = dict(card)
+        grounded.update(id=item.id, name=item.name, category=item.category,
+                        price=item.price, url=item.url, image=item.image)
+        if item.sku:
+            grounded['sku'] = item.sku
+        return grounded
+
+    def ground(self, answer: Dict[str, Any], candidates: Sequence[Any] = ()) -> Dict[str, int]:
+        """Resolve ``answer['products']`` in place; returns counts."""
+        products = answer.get('products')
+        if not isinstance(products, list):
+            return {'candidates': len(candidates), 'resolved': 0, 'dropped': 0}
+        grounded, seen = [], set()
+        for card in products:
+            card = self.ground_card(card, candidates) if isinstance(card, dict) else None
+            if card is not None and card['id'] not in seen:
+                seen.add(card['id'])
+                grounded.append(card)
+        answer['products'] = grounded
+        return {'candidates': len(candidates), 'resolved': len(grounded),
+                'dropped': len(products) - len(grounded)}
+
+
+_grounder: Optional[ProductGrounder] = None
+_lock = threading.Lock()
+
+
+def grounder_for(snapshot: Any) -> ProductGrounder:
+    """ProductGrounder for a catalog snapshot, rebuilt when the digest changes."""
+    global _grounder
+    digest = snapshot.digest if snapshot is not None else ''
+    grounder = _grounder
+    if grounder is None or grounder.digest != digest:
+        with _lock:
+            grounder = _grounder
+            if grounder is None or grounder.digest != digest:
+                grounder = _grounder = ProductGrounder(snapshot)
+    return grounder
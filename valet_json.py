@@ -0,0 +1,206 @@
+"""
+Tolerant JSON extraction and schema checks for valet answers.
+
+LLMs asked for JSON still wrap it in markdown fences, add a sentence before
+or after it, leave trailing commas, use typographic quotes or stop mid-way
+at the token limit. ``extract_json`` handles all of these:
+
+1. the first ``{`` is located and decoded in place with ``raw_decode``
+   (surrounding fences and prose are never touched, raw newlines inside
+   strings are accepted). This is the common case;
+2. if that fails, one forward scan from the same ``{`` rebuilds the object:
+   typographic quotes become ``"``, trailing commas are dropped, closers
+   are matched to their openers, and a truncated answer is closed (back to
+   the last complete member if needed).
+
+``validate_answer`` then checks the card arrays (``youtube``, ``songs``,
+``travel``, ``products``): cards that are not objects or lack every key
+field are dropped, and non-text values in text fields are fixed, so the
+client never renders a half-formed card.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from valet_stream import CARD_SECTIONS
+
+# Text fields of each card section
+CARD_FIELDS = {
+    'youtube': ('title', 'channel', 'searchQuery', 'vibe'),
+    'songs': ('title', 'artist', 'vibe'),
+    'travel': ('name', 'location', 'price_hint', 'vibe'),
+    'products': ('id', 'name', 'category', 'reason', 'vibe'),
+}
+
+# A card needs at least one of these to be shown
+KEY_FIELDS = {
+    'youtube': ('title', 'searchQuery'),
+    'songs': ('title',),
+    'travel': ('name',),
+    'products': ('id', 'name'),
+}
+
+# JSON Schema of an answer, for providers that accept a response schema
+ANSWER_SCHEMA = {
+    'type': 'object',
+    'properties': dict(
+        {'response': {'type': 'string'},
+         'detected_category': {'type': ['string', 'null']},
+         'mode': {'type': 'string'},
+         'vibes': {'type': 'array', 'items': {'type': 'string'}}},
+        **{section: {'type': 'array', 'items': {
+            'type': 'object',
+            'properties': {field: {'type': 'string'} for field in fields},
+        }} for section, fields in CARD_FIELDS.items()}),
+    'required': ['response'],
+}
+
+_DECODER = json.JSONDecoder(strict=False)
+_CLOSERS = {'{': '}', '[': ']'}
+# Typographic quotes used where JSON needs '"'
+_OPEN_QUOTES = '“”'
+_CLOSE_QUOTES = '"”'
+
+
+def _strip_trailing_comma(out: List[str]) -> bool:
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ',':
+        del out[i]
+        return True
+    return False
+
+
+def _close(out: List[str], stack: List[str]) -> str:
+    text = ''.join(out).rstrip()
+    if text.endswith(','):
+        text = text[:-1]
+    if text.endswith(':'):
+        text += ' null'
+    return text + ''.join(_CLOSERS[b] for b in reversed(stack))
+
+
+def repair_json(text: str, start: int = 0, repairs: Optional[List[str]] = None) -> str:
+    """The JSON object starting at ``text[start]`` (a ``{``), rewritten so
+    that it parses. What was changed is appended to ``repairs``."""
+    if repairs is None:
+        repairs = []
+    out: List[str] = []
+    stack: List[str] = []
+    checkpoint: Optional[Tuple[int, List[str]]] = None  # before the last comma
+    closers = ''  # quotes that end the open string
+    i, n = start, len(text)
+    while i < n:
+        c = text[i]
+        if closers:
+            if c == '\\' and i + 1 < n:
+                out.append(text[i:i + 2])
+                i += 2
+                continue
+            if c in closers:
+                out.append('"')
+                closers = ''
+            else:
+                out.append(c)
+        elif c == '"':
+            out.append(c)
+            closers = '"'
+        elif c in _OPEN_QUOTES:
+            out.append('"')
+            closers = _CLOSE_QUOTES
+            repairs.append('quotes')
+        elif c in _CLOSERS:
+            stack.append(c)
+            out.append(c)
+        elif c in '}]':
+            if _strip_trailing_comma(out):
+                repairs.append('trailing comma')
+            closer = _CLOSERS[stack.pop()]
+            if c != closer:
+                repairs.append('bracket')
+            out.append(closer)
+            if not stack:
+                return ''.join(out)
+        elif c == ',':
+            checkpoint = (len(out), list(stack))
+            out.append(c)
+        else:
+            out.append(c)
+        i += 1
+    # Ran out of text: the answer was cut off
+    repairs.append('truncated')
+    if closers:
+        out.append('"')
+    closed = _close(out, stack)
+    if checkpoint is not None:
+        try:
+            _DECODER.decode(closed)
+        except ValueError:
+            # Drop the incomplete last member
+            closed = _close(out[:checkpoint[0]], checkpoint[1])
+    return closed
+
+
+def extract_json(text: str, repairs: Optional[List[str]] = None) -> Dict[str, Any]:
+    """The first JSON object in ``text``; raises json.JSONDecodeError when
+    there is none that can be recovered. Repairs are appended to ``repairs``."""
+    start = text.find('{')
+    if start < 0:
+        raise json.JSONDecodeError('No JSON object in response', text, 0)
+    try:
+        return _DECODER.raw_decode(text, start)[0]
+    except json.JSONDecodeError as e:
+        error = e
+    changes: List[str] = []
+    try:
+        value = _DECODER.decode(repair_json(text, start, changes))
+    except json.JSONDecodeError:
+        raise error from None
+    if repairs is not None:
+        repairs.extend(dict.fromkeys(changes))  # unique, in order
+    return value
+
+
+def _valid_card(section: str, card: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(card, dict):
+        return None
+    card = dict(card)
+    for field in CARD_FIELDS[section]:
+        value = card.get(field)
+        if value is None or isinstance(value, str):
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            card[field] = str(value)
+        else:
+            del card[field]
+    if not any(card.get(field) for field in KEY_FIELDS[section]):
+        return None
+    return card
+
+
+def validate_answer(answer: Dict[str, Any]) -> List[str]:
+    """Fix ``answer`` in place to the valet schema; returns what was fixed."""
+    fixes = []
+    if not isinstance(answer.get('response'), str):
+        answer['response'] = '' if answer.get('response') is None else str(answer['response'])
+        fixes.append('response')
+    for section in CARD_SECTIONS:
+        if section not in answer:
+            continue
+        cards = answer[section]
+        if isinstance(cards, dict):  # a single card
+            cards = [cards]
+        if not isinstance(cards, list):
+            answer[section] = []
+            fixes.append(f'{section}: not a list')
+            continue
+        valid = [card for card in (_valid_card(section, c) for c in cards) if card is not None]
+        if len(valid) != len(cards):
+            fixes.append(f'{section}: dropped {len(cards) - len(valid)}')
+        answer[section] = valid
+    vibes = answer.get('vibes')
+    if vibes is not None and not (isinstance(vibes, list) and all(isinstance(v, str) for v in vibes)):
+        answer['vibes'] = [v for v in vibes if isinstance(v, str)] if isinstance(vibes, list) else []
+        fixes.append('vibes')
+    return fixes
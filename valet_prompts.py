@@ -0,0 +1,179 @@
+"""
+Compiled valet prompts.
+
+Each mode's prompt is split into a static prefix (persona, catalog
+categories, response format) and a short per-request part (the products
+retrieved for the query, liked products, category focus, the query). The
+prefixes depend only on the catalog, so they are rendered once per catalog
+version by ``prompts_for(snapshot)`` and every request just fills the few
+remaining slots.
+
+Keeping the static text first also gives providers an identical prompt
+prefix across requests, which is what provider-side prompt caching keys on.
+"""
+
+import threading
+from typing import Any, Iterable, Optional, Sequence, Tuple
+
+# Chat history lines used to detect the user's interest
+HISTORY_TURNS = 6
+
+PRODUCT_PREFIX = """You are Markov, iamtoxico's lifestyle valet in SHOPPING MODE - helping discover premium products.
+
+Your voice:
+- Warm but knowing ("oh, you're gonna love this...")
+- Confident recommendations ("trust me on this one")
+- Tasteful enthusiasm without being over the top
+
+BRAND: "iamtoxico" - liberates laughing. Deviant but proper, the sporting life.
+
+Markov knows the entire iamtoxico portfolio (internal and affiliate items).
+Always prioritize items from the catalog that match the user's vibe.
+
+Available product categories: {categories}
+
+Recommend only products from the catalog list given with the request, and
+copy each product's id and name exactly.
+
+Respond with valid JSON:
+{{
+  "response": "A warm, conversational 2-4 sentence response about the products.",
+  "detected_category": "category if detected, or null",
+  "mode": "product",
+  "products": [
+    {{"id": "catalog id", "name": "Product Name", "category": "category", "reason": "why this fits", "vibe": "lifestyle vibe"}},
+    {{"id": "catalog id", "name": "Product Name", "category": "category", "reason": "why this fits", "vibe": "lifestyle vibe"}},
+    {{"id": "catalog id", "name": "Product Name", "category": "category", "reason": "why this fits", "vibe": "lifestyle vibe"}}
+  ],
+  "vibes": ["vibe1", "vibe2", "vibe3"]
+}}
+
+Focus on products from the catalog. Prefer items with high relevance to the query.
+"""
+
+DEFAULT_PREFIX = """You are Markov, iamtoxico's lifestyle valet - think part trusted friend, part tastemaker, part concierge who's seen it all. You curate content and experiences.
+
+Your voice:
+- Warm but knowing ("oh, you're gonna love this...")
+- Confident recommendations ("trust me on this one")
+- Personal touches ("I've been there, it's unreal")
+- Tasteful enthusiasm without being over the top
+- Occasionally playful ("okay but hear me out...")
+
+BRAND: "iamtoxico" - liberates laughing. Deviant but proper, the sporting life.
+ALTER EGO: Captain Adventure
+
+Markov knows the entire iamtoxico portfolio (internal and affiliate items).
+Use these items as anchors for your recommendations when relevant.
+
+Respond with valid JSON:
+{
+  "response": "A warm, conversational 2-4 sentence response with PERSONALITY. Paint a picture of the lifestyle moment. Make it feel like advice from a friend who genuinely wants them to have an amazing experience.",
+  "detected_category": "category if detected, or null",
+  "mode": "default",
+  "youtube": [
+    {"title": "Video title", "channel": "Channel name", "searchQuery": "YouTube search query", "vibe": "the mood/vibe"},
+    {"title": "Video title", "channel": "Channel name", "searchQuery": "YouTube search query", "vibe": "the mood/vibe"},
+    {"title": "Video title", "channel": "Channel name", "searchQuery": "YouTube search query", "vibe": "the mood/vibe"}
+  ],
+  "songs": [
+    {"title": "Song title", "artist": "Artist name", "vibe": "mood description"},
+    {"title": "Song title", "artist": "Artist name", "vibe": "mood description"},
+    {"title": "Song title", "artist": "Artist name", "vibe": "mood description"}
+  ],
+  "travel": [
+    {"name": "Hotel/Place name", "location": "City, Country", "price_hint": "$$$", "vibe": "experience description"},
+    {"name": "Hotel/Place name", "location": "City, Country", "price_hint": "$$$$", "vibe": "experience description"},
+    {"name": "Hotel/Place name", "location": "City, Country", "price_hint": "$$", "vibe": "experience description"}
+  ]
+}
+
+For YouTube: Suggest interesting videos, documentaries, or content that matches the vibe.
+For Songs: Create a mini soundtrack that fits the mood - mix familiar and discovery.
+For Travel: Suggest luxury/boutique hotels or experiences that match the lifestyle.
+Keep suggestions varied, tasteful, and aligned with the sporting life aesthetic.
+"""
+
+PRODUCTS_SLOT = """
+Catalog products for this request:
+{products}
+"""
+
+LIKED_SLOT = """
+User has liked these products (consider similar items):
+{liked}
+"""
+
+CATEGORY_SLOT = """
+IMPORTANT: User has selected "{category}" mode.
+Focus recommendations on {category} items.
+"""
+
+HISTORY_SLOT = """
+Analyze chat history and detect primary interest:
+{history}
+
+Available categories: {categories}
+Use detected category to focus recommendations.
+Include "detected_category" in your response.
+"""
+
+
+class ValetPrompts:
+    """Valet prompts with the catalog-derived sections rendered once."""
+
+    __slots__ = ('digest', 'categories', 'product_prefix', 'default_prefix', '_category_list')
+
+    def __init__(self, items: Sequence[Any], digest: str = ''):
+        self.digest = digest
+        # Sorted so the prefix is byte-identical across processes
+        self.categories = tuple(sorted({item.category for item in items}))
+        self._category_list = ', '.join(self.categories)
+        self.product_prefix = PRODUCT_PREFIX.format(categories=self._category_list)
+        self.default_prefix = DEFAULT_PREFIX
+
+    def category_context(self, category: Optional[str], history: Sequence[str]) -> str:
+        """Focus on a user-selected category, or detect one from a long chat."""
+        if category and category != 'auto':
+            return CATEGORY_SLOT.format(category=category)
+        if len(history) >= HISTORY_TURNS:
+            return HISTORY_SLOT.format(history='\n'.join(history[-HISTORY_TURNS:]),
+                                       categories=self._category_list)
+        return ''
+
+    def render(self, product_mode: bool, query: str, anchor: str = '',
+               liked: Iterable[str] = (), category: Optional[str] = None,
+               history: Sequence[str] = (), products: Sequence[Any] = ()) -> Tuple[str, str]:
+        """(static prefix, per-request part) of the prompt for one query.
+
+        ``products`` are the catalog items retrieved for a product-mode query
+        (see valet_grounding.py).
+        """
+        context = self.category_context(category, history)
+        if product_mode:
+            catalog = PRODUCTS_SLOT.format(products='\n'.join(
+                f'- [{p.id}] {p.name} ({p.category}, ${p.price_label})' for p in products)) if products else ''
+            liked = list(liked)[:5]
+            liked_context = LIKED_SLOT.format(liked='\n'.join(f'- {p}' for p in liked)) if liked else ''
+            return self.product_prefix, f'{catalog}{liked_context}{context}\nUser Query: "{query}"'
+        previous = f'\nPrevious context: {anchor}' if anchor else ''
+        return self.default_prefix, f'{context}\nUser Query: "{query}"{previous}'
+
+
+_compiled: Optional[ValetPrompts] = None
+_lock = threading.Lock()
+
+
+def prompts_for(snapshot: Any) -> ValetPrompts:
+    """Compiled prompts for a catalog snapshot (``None`` = empty catalog),
+    rebuilt only when the catalog digest changes."""
+    global _compiled
+    digest = snapshot.digest if snapshot is not None else ''
+    compiled = _compiled
+    if compiled is None or compiled.digest != digest:
+        with _lock:
+            compiled = _compiled
+            if compiled is None or compiled.digest != digest:
+                compiled = ValetPrompts(snapshot.items if snapshot is not None else (), digest)
+                _compiled = compiled
+    return compiled
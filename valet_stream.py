@@ -0,0 +1,155 @@
+"""
+Incremental parsing of streamed valet answers.
+
+The LLM streams one JSON object (possibly wrapped in a markdown fence).
+ValetStreamParser is fed the raw text chunks as they arrive and reports:
+
+- ``('text', field, delta)``: newly decoded characters of a top-level
+  string field such as ``response``, so they can be shown while typing;
+- ``('card', section, index, card)``: a complete element of a top-level
+  card array (``youtube``, ``songs``, ``travel``, ``products``).
+
+It is a single forward scan with a container stack. Only a finished card
+(one small ``json.loads``) and the currently open text field are decoded.
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+TEXT_FIELDS = ('response',)
+CARD_SECTIONS = ('youtube', 'songs', 'travel', 'products')
+
+# A string tail that cannot be decoded yet: a lone backslash, a partial
+# \\uXXXX escape, or a high surrogate still waiting for its pair
+_INCOMPLETE_ESCAPE = re.compile(r'(\\u[dD][89abAB][0-9a-fA-F]{2})?(\\u[0-9a-fA-F]{0,3}|\\)?$')
+
+
+def sse_event(event: str, data: Any) -> str:
+    """One Server-Sent Events frame with a JSON payload."""
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+def answer_events(answer: Dict[str, Any], text_fields: Tuple[str, ...] = TEXT_FIELDS,
+                  card_sections: Tuple[str, ...] = CARD_SECTIONS) -> Iterator[tuple]:
+    """The events ValetStreamParser would report for an already complete answer."""
+    for field in text_fields:
+        if isinstance(answer.get(field), str) and answer[field]:
+            yield ('text', field, answer[field])
+    for section in card_sections:
+        cards = answer.get(section)
+        if isinstance(cards, list):
+            for index, card in enumerate(c for c in cards if isinstance(c, dict)):
+                yield ('card', section, index, card)
+
+
+class ValetStreamParser:
+    """Feed streamed JSON text; collect text deltas and finished cards."""
+
+    def __init__(self, text_fields: Tuple[str, ...] = TEXT_FIELDS,
+                 card_sections: Tuple[str, ...] = CARD_SECTIONS):
+        self.text_fields = text_fields
+        self.card_sections = card_sections
+        self.text = ''
+        self.pos = 0
+        # Open containers: [bracket, expecting a key?]
+        self.stack: List[list] = []
+        self.in_string = False
+        self.string_start = 0
+        self.key: Optional[str] = None  # last key seen in the top-level object
+        self.section: Optional[str] = None  # top-level key of the open array
+        self.card_start: Optional[int] = None
+        self.card_counts = {}
+        self.text_field: Optional[str] = None  # top-level string being streamed
+        self.emitted = 0
+        self.done = False
+
+    def feed(self, chunk: str) -> List[tuple]:
+        """Consume ``chunk``; return the events it completed."""
+        self.text += chunk
+        events: List[tuple] = []
+        text = self.text
+        pos = self.pos
+        while pos < len(text) and not self.done:
+            c = text[pos]
+            if self.in_string:
+                if c == '\\':
+                    if pos + 1 >= len(text):
+                        break  # escape split across chunks
+                    pos += 2
+                    continue
+                if c == '"':
+                    self.in_string = False
+                    self._end_string(pos, events)
+                pos += 1
+                continue
+            if not self.stack and c != '{':
+                pos += 1  # markdown fence or chatter before the object
+                continue
+            if c == '"':
+                self._start_string(pos)
+            elif c in '{[':
+                if len(self.stack) == 1:
+                    self.section = self.key if c == '[' else None
+                if (c == '{' and len(self.stack) == 2 and self.stack[1][0] == '['
+                        and self.section in self.card_sections):
+                    self.card_start = pos
+                self.stack.append([c, c == '{'])
+            elif c in '}]':
+                if self.stack:
+                    self.stack.pop()
+                if self.card_start is not None and len(self.stack) == 2:
+                    self._end_card(pos, events)
+                if len(self.stack) == 1:
+                    self.section = None
+                if not self.stack:
+                    self.done = True
+            elif c == ':':
+                self.stack[-1][1] = False
+            elif c == ',' and self.stack[-1][0] == '{':
+                self.stack[-1][1] = True
+            pos += 1
+        self.pos = pos
+        if self.in_string and self.text_field:
+            self._emit_text(pos, events)
+        return events
+
+    def _start_string(self, pos: int) -> None:
+        self.in_string = True
+        self.string_start = pos + 1
+        top_value = (len(self.stack) == 1 and not self.stack[0][1])
+        self.text_field = self.key if top_value and self.key in self.text_fields else None
+        self.emitted = 0
+
+    def _end_string(self, pos: int, events: List[tuple]) -> None:
+        if len(self.stack) == 1 and self.stack[0][1]:
+            try:
+                self.key = json.loads('"' + self.text[self.string_start:pos] + '"')
+            except ValueError:
+                self.key = None
+        elif self.text_field:
+            self._emit_text(pos, events)
+            self.text_field = None
+
+    def _emit_text(self, end: int, events: List[tuple]) -> None:
+        raw = self.text[self.string_start:end]
+        if self.in_string:
+            raw = _INCOMPLETE_ESCAPE.sub('', raw, count=1)
+        try:
+            decoded = json.loads('"' + raw + '"')
+        except ValueError:
+            return
+        if len(decoded) > self.emitted:
+            events.append(('text', self.text_field, decoded[self.emitted:]))
+            self.emitted = len(decoded)
+
+    def _end_card(self, pos: int, events: List[tuple]) -> None:
+        try:
+            card = json.loads(self.text[self.card_start:pos + 1])
+        except ValueError:
+            card = None
+        self.card_start = None
+        if isinstance(card, dict):
+            index = self.card_counts.get(self.section, 0)
+            self.card_counts[self.section] = index + 1
+            events.append(('card', self.section, index, card))